@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Compare FileReadStream and MappedFileReadStream when parsing PMX/PMD files.
+
+Usage:
+    blender --background --python benchmarks/bench_file_stream.py -- [file.pmx|file.pmd ...]
+
+A synthetic PMX model is generated if no file is given.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_pmx_model, save_pmx_model
+
+from mmd_tools.core import pmd, pmx
+
+
+def _best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    repeat = 5
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating a synthetic model...')
+            files = [save_pmx_model(os.path.join(tmp_dir, 'synthetic.pmx'), make_pmx_model(num_vertices=300000))]
+
+        print('%-40s %10s %12s %12s %8s'%('file', 'size(MB)', 'stream(s)', 'mmap(s)', 'speedup'))
+        for path in files:
+            module = pmd if path.lower().endswith('.pmd') else pmx
+            t_stream = _best_of(lambda: module.load(path, use_mmap=False), repeat)
+            t_mmap = _best_of(lambda: module.load(path, use_mmap=True), repeat)
+            print('%-40s %10.2f %12.3f %12.3f %7.2fx'%(
+                os.path.basename(path)[-40:], os.path.getsize(path)/1e6, t_stream, t_mmap, t_stream/t_mmap))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Measure the scaling of pmx.load_many() and vmd.load_many() with the number of workers.
+
+Usage:
+    blender --background --python benchmarks/bench_load_many.py -- [--workers N] [file.pmx|file.pmd|file.vmd ...]
+
+The files are loaded with 1, 2, 4, ... up to N workers (the number of CPUs by
+default). 16 synthetic models and 16 synthetic motions are generated if no file
+is given.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_pmx_model, make_vmd_file, save_pmx_model
+
+from mmd_tools.core import pmd, pmx, vmd
+
+
+_LOADERS = {'.pmx': pmx.load_many, '.pmd': pmd.load_many, '.vmd': vmd.load_many}
+
+def _worker_counts(max_workers):
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+def _timeit(func):
+    start = time.perf_counter()
+    ret = func()
+    return time.perf_counter() - start, ret
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    max_workers = os.cpu_count() or 1
+    if '--workers' in args:
+        i = args.index('--workers')
+        max_workers = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating synthetic models and motions...')
+            for i in range(16):
+                files.append(save_pmx_model(os.path.join(tmp_dir, 'synthetic%d.pmx'%i),
+                    make_pmx_model(num_vertices=20000, num_vertex_morphs=20, seed=i)))
+                path = os.path.join(tmp_dir, 'synthetic%d.vmd'%i)
+                make_vmd_file(num_bones=50, num_bone_keys=2000, seed=i).save(filepath=path)
+                files.append(path)
+
+        groups = {}
+        for path in files:
+            groups.setdefault(os.path.splitext(path)[1].lower(), []).append(path)
+
+        print('%-6s %6s %8s %10s %10s %8s'%('type', 'files', 'workers', 'time(s)', 'files/s', 'speedup'))
+        for ext, paths in sorted(groups.items()):
+            load_many = _LOADERS.get(ext)
+            if load_many is None:
+                continue
+            t_serial = None
+            for workers in _worker_counts(max_workers):
+                t, results = _timeit(lambda: load_many(paths, workers=workers))
+                failures = [r for r in results if r.error is not None]
+                t_serial = t_serial or t
+                print('%-6s %6d %8d %10.3f %10.1f %7.1fx%s'%(
+                    ext, len(paths), workers, t, len(paths)/t, t_serial/t, ' (%d failed)'%len(failures) if failures else ''))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Compare the memory used by the object model and the columnar model of pmx.Model.
+
+Usage:
+    blender --background --python benchmarks/bench_model_memory.py -- [file.pmx ...]
+
+A synthetic PMX model is generated if no file is given.
+"""
+
+import gc
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_pmx_model, save_pmx_model
+
+from mmd_tools.core import pmx
+
+
+def _load_objects(path):
+    model = pmx.load(path)
+    model.vertices[:] # create all Vertex objects, as the importer does
+    return model
+
+def _load_columnar(path):
+    return pmx.load(path, columnar=True)
+
+def _measure(func, path):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = func(path)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del model
+    return current, peak, elapsed
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating a synthetic model...')
+            files = [save_pmx_model(os.path.join(tmp_dir, 'synthetic.pmx'), make_pmx_model(num_vertices=500000))]
+
+        print('%-30s %-9s %12s %12s %10s'%('file', 'mode', 'retained(MB)', 'peak(MB)', 'time(s)'))
+        for path in files:
+            for mode, func in (('objects', _load_objects), ('columnar', _load_columnar)):
+                current, peak, elapsed = _measure(func, path)
+                print('%-30s %-9s %12.1f %12.1f %10.3f'%(os.path.basename(path)[-30:], mode, current/1e6, peak/1e6, elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Time the stages of PMXImporter which write the mesh data in bulk.
+
+Usage:
+    blender --background --python benchmarks/bench_pmx_import.py -- [file.pmx ...]
+
+Each model is imported twice, once as is and once with the former per-vertex
+implementation of each stage, and the time of each stage is compared. A
+synthetic model of 300k vertices is generated if no file is given.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_pmx_model, save_pmx_model
+
+import bpy
+import numpy as np
+from mathutils import Vector
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx.importer import PMXImporter
+
+
+def _legacy_import_vertices(self):
+    # one VertexGroup.add() call per vertex and bone, and two more per vertex
+    self._PMXImporter__importVertexGroup()
+
+    pmx_vertices = self._PMXImporter__model.vertices
+    vertex_count = len(pmx_vertices)
+    if vertex_count < 1:
+        return
+
+    meshObj = self._PMXImporter__meshObj
+    mesh = meshObj.data
+    mesh.vertices.add(count=vertex_count)
+    mesh.vertices.foreach_set('co', tuple(i for pv in pmx_vertices for i in (Vector(pv.co).xzy * self._PMXImporter__scale)))
+
+    vertex_group_table = self._PMXImporter__vertexGroupTable
+    vg_edge_scale = meshObj.vertex_groups.new(name='mmd_edge_scale')
+    vg_vertex_order = meshObj.vertex_groups.new(name='mmd_vertex_order')
+    sdef_vertices = {}
+    for i, pv in enumerate(pmx_vertices):
+        pv_bones, pv_weights, idx = pv.weight.bones, pv.weight.weights, (i,)
+
+        vg_edge_scale.add(index=idx, weight=pv.edge_scale, type='REPLACE')
+        vg_vertex_order.add(index=idx, weight=i/vertex_count, type='REPLACE')
+
+        if isinstance(pv_weights, pmx.BoneWeightSDEF):
+            if pv_bones[0] > pv_bones[1]:
+                pv_bones.reverse()
+                pv_weights.weight = 1.0 - pv_weights.weight
+                pv_weights.r0, pv_weights.r1 = pv_weights.r1, pv_weights.r0
+            vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights.weight, type='ADD')
+            vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights.weight, type='ADD')
+            sdef_vertices[i] = pv.weight.weights
+        elif len(pv_bones) == 1:
+            bone_index = pv_bones[0]
+            if bone_index >= 0:
+                vertex_group_table[bone_index].add(index=idx, weight=1.0, type='ADD')
+        elif len(pv_bones) == 2:
+            vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights[0], type='ADD')
+            vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights[0], type='ADD')
+        elif len(pv_bones) == 4:
+            for bone, weight in zip(pv_bones, pv_weights):
+                vertex_group_table[bone].add(index=idx, weight=weight, type='ADD')
+
+    vg_edge_scale.lock_weight = True
+    vg_vertex_order.lock_weight = True
+
+    indices = sorted(sdef_vertices)
+    self._PMXImporter__sdefVertices = (np.array(indices, dtype=np.intp),) + tuple(
+        np.array([getattr(sdef_vertices[i], name) for i in indices], dtype=np.float32).reshape(-1, 3) for name in ('c', 'r0', 'r1'))
+
+def _legacy_import_vertex_morphs(self):
+    # one RNA write per morph offset
+    mmd_root = self._PMXImporter__root.mmd_root
+    categories = self.CATEGORIES
+    self._PMXImporter__createBasisShapeKey()
+    for morph in (x for x in self._PMXImporter__model.morphs if isinstance(x, pmx.VertexMorph)):
+        shapeKey = self._PMXImporter__meshObj.shape_key_add(name=morph.name)
+        vtx_morph = mmd_root.vertex_morphs.add()
+        vtx_morph.name = morph.name
+        vtx_morph.name_e = morph.name_e
+        vtx_morph.category = categories.get(morph.category, 'OTHER')
+        for md in morph.offsets:
+            shapeKeyPoint = shapeKey.data[md.index]
+            shapeKeyPoint.co += Vector(md.offset).xzy * self._PMXImporter__scale
+
+def _legacy_store_vertices_sdef(self):
+    # three RNA writes per SDEF vertex
+    sdef_vertices = self._PMXImporter__sdefVertices
+    if sdef_vertices is None or len(sdef_vertices[0]) < 1:
+        return
+
+    self._PMXImporter__createBasisShapeKey()
+    meshObj, scale = self._PMXImporter__meshObj, self._PMXImporter__scale
+    sdefC = meshObj.shape_key_add(name='mmd_sdef_c')
+    sdefR0 = meshObj.shape_key_add(name='mmd_sdef_r0')
+    sdefR1 = meshObj.shape_key_add(name='mmd_sdef_r1')
+    indices, c, r0, r1 = sdef_vertices
+    for i, vc, vr0, vr1 in zip(indices.tolist(), c.tolist(), r0.tolist(), r1.tolist()):
+        sdefC.data[i].co = Vector(vc).xzy * scale
+        sdefR0.data[i].co = Vector(vr0).xzy * scale
+        sdefR1.data[i].co = Vector(vr1).xzy * scale
+
+def _legacy_import_faces(self):
+    # the loop data is expanded through per vertex dicts and generator tuples
+    pmxModel = self._PMXImporter__model
+    mesh = self._PMXImporter__meshObj.data
+    vertex_map = self._PMXImporter__vertex_map
+
+    loop_indices_orig = tuple(i for f in pmxModel.faces for i in f)
+    loop_indices = tuple(vertex_map[i][1] for i in loop_indices_orig) if vertex_map else loop_indices_orig
+    material_indices = tuple(i for i, c in enumerate(self._PMXImporter__materialFaceCountTable) for x in range(c))
+
+    mesh.loops.add(len(pmxModel.faces)*3)
+    mesh.loops.foreach_set('vertex_index', loop_indices)
+
+    mesh.polygons.add(len(pmxModel.faces))
+    mesh.polygons.foreach_set('loop_start', tuple(range(0, len(mesh.loops), 3)))
+    mesh.polygons.foreach_set('loop_total', (3,)*len(pmxModel.faces))
+    mesh.polygons.foreach_set('use_smooth', (True,)*len(pmxModel.faces))
+    mesh.polygons.foreach_set('material_index', material_indices)
+
+    uv_layers = mesh.uv_layers
+    uv_layer = uv_layers.new()
+    uv_table = {vi:self.flipUV_V(v.uv) for vi, v in enumerate(pmxModel.vertices)}
+    uv_layer.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i]))
+
+    if pmxModel.header and pmxModel.header.additional_uvs:
+        zw_data_map = {}
+        split_uvzw = lambda uvi: (self.flipUV_V(uvi[:2]), uvi[2:])
+        for i in range(pmxModel.header.additional_uvs):
+            add_uv = uv_layers.new(name='UV'+str(i+1))
+            uv_table = {vi:split_uvzw(v.additional_uvs[i]) for vi, v in enumerate(pmxModel.vertices)}
+            add_uv.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i][0]))
+            if any(any(s[1]) for s in uv_table.values()):
+                zw_data_map['_'+add_uv.name] = {k:self.flipUV_V(v[1]) for k, v in uv_table.items()}
+        for name, zw_table in zw_data_map.items():
+            add_zw = uv_layers.new(name=name)
+            if add_zw is not None:
+                add_zw.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in zw_table[i]))
+
+    if bpy.app.version >= (2, 80, 0):
+        self._PMXImporter__fixOverlappingFaceMaterials(mesh.materials, mesh.vertices, loop_indices, material_indices)
+
+def _legacy_fix_overlapping_face_materials(self, materials, vertices, loop_indices, material_indices):
+    # a dict keyed by the sorted rounded coordinates of each triangle
+    check = {}
+    mi_skip = -1
+    _vi_cache = {}
+    def _rounded_co_vi(vi):
+        if vi not in _vi_cache:
+            vco = vertices[vi].co
+            _vi_cache[vi] = (round(vco[0], 6), round(vco[1], 6), round(vco[2], 6))
+        return _vi_cache[vi]
+
+    loop_indices, material_indices = list(loop_indices), list(material_indices)
+    for i, mi in enumerate(material_indices):
+        if mi <= mi_skip:
+            continue
+        si = 3*i
+        verts = tuple(sorted((_rounded_co_vi(loop_indices[si]), _rounded_co_vi(loop_indices[si+1]), _rounded_co_vi(loop_indices[si+2]))))
+        if verts not in check:
+            check[verts] = mi
+        elif check[verts] < mi:
+            materials[mi].blend_method = 'BLEND'
+            materials[mi].show_transparent_back = False
+            mi_skip = mi
+
+
+# the former implementation of each timed stage of PMXImporter
+LEGACY_STAGES = {
+    '__importVertices': _legacy_import_vertices,
+    '__importFaces': _legacy_import_faces,
+    '__fixOverlappingFaceMaterials': _legacy_fix_overlapping_face_materials,
+    '__storeVerticesSDEF': _legacy_store_vertices_sdef,
+    '__importVertexMorphs': _legacy_import_vertex_morphs,
+    }
+
+def _timed(func, timings, name):
+    def _wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        ret = func(self, *args, **kwargs)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return ret
+    return _wrapper
+
+def _import(path, use_legacy):
+    timings = {}
+    originals = {name: getattr(PMXImporter, '_PMXImporter'+name) for name in LEGACY_STAGES}
+    try:
+        for name, legacy_func in LEGACY_STAGES.items():
+            setattr(PMXImporter, '_PMXImporter'+name, _timed(legacy_func if use_legacy else originals[name], timings, name))
+        start = time.perf_counter()
+        PMXImporter().execute(filepath=path, types={'MESH', 'ARMATURE', 'MORPHS'}, scale=0.08)
+        timings['total'] = time.perf_counter() - start
+    finally:
+        for name, func in originals.items():
+            setattr(PMXImporter, '_PMXImporter'+name, func)
+    return timings
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating a synthetic model...')
+            files = [save_pmx_model(os.path.join(tmp_dir, 'synthetic.pmx'), make_pmx_model(num_vertices=300000, num_vertex_morphs=100))]
+
+        print('%-30s %-24s %10s %10s %8s'%('file', 'stage', 'legacy(s)', 'bulk(s)', 'speedup'))
+        for path in files:
+            t_legacy = _import(path, use_legacy=True)
+            t_bulk = _import(path, use_legacy=False)
+            for name in (n for n in list(LEGACY_STAGES) + ['total'] if n in t_bulk):
+                print('%-30s %-24s %10.3f %10.3f %7.1fx'%(
+                    os.path.basename(path)[-30:], name.strip('_'), t_legacy[name], t_bulk[name], t_legacy[name]/t_bulk[name]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
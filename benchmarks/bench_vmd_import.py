@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Time the bone animation import of VMDImporter, which builds the F-Curves in bulk.
+
+Usage:
+    blender --background --python benchmarks/bench_vmd_import.py -- [file.vmd ...]
+
+The motion is assigned to a generated armature which has a bone of each bone
+name of the motion. A synthetic motion of 100k bone keys is generated if no
+file is given.
+
+For comparison, the resulting F-Curves are rebuilt with one RNA write per
+keyframe attribute, as the importer did before.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_vmd_file
+
+import bpy
+from mmd_tools.core import vmd
+from mmd_tools.core.vmd.importer import VMDImporter
+
+
+def _make_armature(bone_names):
+    arm = bpy.data.armatures.new('bench_vmd_import')
+    obj = bpy.data.objects.new('bench_vmd_import', arm)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    for i, name in enumerate(bone_names):
+        b = arm.edit_bones.new(name)
+        b.head = (i*0.1, 0.0, 0.0)
+        b.tail = (i*0.1, 0.0, 1.0)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    for b in obj.pose.bones:
+        b.rotation_mode = 'QUATERNION'
+    return obj
+
+def _rebuild_per_key(action):
+    # the per-key writes of the former importer: co, handles, handle types and interpolation
+    new_action = bpy.data.actions.new(name=action.name+'_per_key')
+    for c in action.fcurves:
+        fcurve = new_action.fcurves.new(data_path=c.data_path, index=c.array_index)
+        fcurve.keyframe_points.add(len(c.keyframe_points))
+        for src, kp in zip(c.keyframe_points, fcurve.keyframe_points):
+            kp.co = src.co
+            kp.interpolation = src.interpolation
+            kp.handle_left_type = src.handle_left_type
+            kp.handle_right_type = src.handle_right_type
+            kp.handle_left = src.handle_left
+            kp.handle_right = src.handle_right
+    return new_action
+
+def _timeit(func):
+    start = time.perf_counter()
+    ret = func()
+    return time.perf_counter() - start, ret
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating a synthetic motion...')
+            path = os.path.join(tmp_dir, 'synthetic.vmd')
+            make_vmd_file(num_bones=100, num_bone_keys=1000, num_morphs=0, num_camera_keys=0).save(filepath=path)
+            files = [path]
+
+        print('%-30s %10s %10s %12s %12s %10s'%('file', 'bone keys', 'import(s)', 'keys/s', 'per-key(s)', 'speedup'))
+        for path in files:
+            vmd_file = vmd.File()
+            vmd_file.load(filepath=path, sections=('boneAnimation',))
+            bone_names = [name for name, keys in vmd_file.boneAnimation.items() if len(keys)]
+            num_keys = sum(len(vmd_file.boneAnimation[name]) for name in bone_names)
+            armObj = _make_armature(bone_names)
+
+            importer = VMDImporter(path)
+            t_import, _ = _timeit(lambda: importer.assign(armObj, action_name='bench'))
+            action = armObj.animation_data.action
+            t_per_key, _ = _timeit(lambda: _rebuild_per_key(action))
+            print('%-30s %10d %10.3f %12.0f %12.3f %9.1fx'%(
+                os.path.basename(path)[-30:], num_keys, t_import, num_keys/t_import, t_per_key, t_per_key/t_import))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Compare the per-key VMD writer with the bulk writer of vmd.File.save().
+
+Usage:
+    blender --background --python benchmarks/bench_vmd_io.py -- [file.vmd ...]
+
+A synthetic motion of about 1.1 million keys is generated if no file is given.
+"""
+
+import logging
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_vmd_file
+
+from mmd_tools.core import vmd
+
+
+def _save_per_key(vmd_file, path):
+    # the writer used before the bulk writer, which packs every field of every key
+    with open(path, 'wb') as fin:
+        vmd_file.header.save(fin)
+        for anim in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation):
+            fin.write(struct.pack('<L', sum(len(i) for i in anim.values())))
+            for name, frameKeys in anim.items():
+                name_data = struct.pack('<15s', vmd._toShiftJisBytes(name))
+                for frameKey in frameKeys:
+                    fin.write(name_data)
+                    frameKey.save(fin)
+        for anim in (vmd_file.cameraAnimation, vmd_file.lampAnimation, vmd_file.selfShadowAnimation or [], vmd_file.propertyAnimation or []):
+            fin.write(struct.pack('<L', len(anim)))
+            for frameKey in anim:
+                frameKey.save(fin)
+
+def _timeit(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args
+        if not files:
+            print('generating a synthetic motion...')
+            path = os.path.join(tmp_dir, 'synthetic.vmd')
+            make_vmd_file().save(filepath=path)
+            files = [path]
+
+        output_per_key = os.path.join(tmp_dir, 'per_key.vmd')
+        output_bulk = os.path.join(tmp_dir, 'bulk.vmd')
+        print('%-30s %10s %10s %12s %10s %10s %8s'%('file', 'keys', 'load(s)', 'per-key(s)', 'bulk(s)', 'keys/s', 'speedup'))
+        for path in files:
+            vmd_file = vmd.File()
+            t_load = _timeit(lambda: vmd_file.load(filepath=path))
+            num_keys = sum(len(i) for anim in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation) for i in anim.values())
+            num_keys += len(vmd_file.cameraAnimation) + len(vmd_file.lampAnimation)
+
+            t_bulk = _timeit(lambda: vmd_file.save(filepath=output_bulk))
+            t_per_key = _timeit(lambda: _save_per_key(vmd_file, output_per_key))
+            with open(output_per_key, 'rb') as f0, open(output_bulk, 'rb') as f1:
+                if f0.read() != f1.read():
+                    print(' * the outputs of %s are different'%path)
+            print('%-30s %10d %10.3f %12.3f %10.3f %10.0f %7.1fx'%(
+                os.path.basename(path)[-30:], num_keys, t_load, t_per_key, t_bulk, num_keys/t_bulk, t_per_key/t_bulk))
+
+            # the bulk writer packs the key objects once they are created
+            for anim in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation):
+                for frameKeys in anim.values():
+                    frameKeys[:]
+            t_objects = _timeit(lambda: vmd_file.save(filepath=output_bulk))
+            print('%-30s %10s %10s %12s %10.3f %10.0f %7.1fx'%('  (from key objects)', '', '', '', t_objects, num_keys/t_objects, t_per_key/t_objects))
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
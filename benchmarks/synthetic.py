@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Synthetic MMD data for benchmarks.
+
+The generated models are not meant to look like anything, they only have
+the sizes and the variety of records of real-world data.
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mmd_tools.core import pmx, vmd
+
+
+def make_pmx_model(num_vertices=100000, num_bones=300, num_vertex_morphs=100, morph_size=1000, additional_uvs=1, seed=0):
+    rand = random.Random(seed)
+    def _vec(size, lo=-1.0, hi=1.0):
+        return [rand.uniform(lo, hi) for _ in range(size)]
+
+    model = pmx.Model()
+    model.name = model.name_e = 'synthetic'
+
+    for i in range(num_vertices):
+        v = pmx.Vertex()
+        v.co = _vec(3, -10, 10)
+        v.normal = _vec(3)
+        v.uv = _vec(2, 0, 1)
+        v.additional_uvs = [_vec(4, 0, 1) for _ in range(additional_uvs)]
+        w = v.weight = pmx.BoneWeight()
+        w.type = rand.choice((pmx.BoneWeight.BDEF1, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF4, pmx.BoneWeight.SDEF))
+        if w.type == pmx.BoneWeight.BDEF1:
+            w.bones = [rand.randrange(num_bones)]
+        elif w.type == pmx.BoneWeight.BDEF2:
+            w.bones = rand.sample(range(num_bones), 2)
+            w.weights = [rand.random()]
+        elif w.type == pmx.BoneWeight.BDEF4:
+            w.bones = rand.sample(range(num_bones), 4)
+            w.weights = [0.4, 0.3, 0.2, 0.1]
+        else:
+            w.bones = rand.sample(range(num_bones), 2)
+            w.weights = pmx.BoneWeightSDEF(rand.random(), _vec(3), _vec(3), _vec(3))
+        v.edge_scale = rand.random()
+        model.vertices.append(v)
+
+    num_faces = num_vertices * 2
+    model.faces = [tuple(rand.randrange(num_vertices) for _ in range(3)) for _ in range(num_faces)]
+
+    for i in range(4):
+        mat = pmx.Material()
+        mat.name = mat.name_e = 'material%d'%i
+        mat.diffuse, mat.specular, mat.ambient, mat.edge_color = _vec(4, 0, 1), _vec(3, 0, 1), _vec(3, 0, 1), _vec(4, 0, 1)
+        mat.vertex_count = (num_faces//4 + (num_faces%4 if i == 3 else 0)) * 3
+        model.materials.append(mat)
+
+    for i in range(num_bones):
+        b = pmx.Bone()
+        b.name = b.name_e = 'bone%d'%i
+        b.location = _vec(3, -10, 10)
+        b.parent = i - 1
+        b.displayConnection = i + 1 if i + 1 < num_bones else -1
+        if i > 3 and i % 50 == 0:
+            b.isIK = True
+            b.target = i - 1
+            for j in (2, 3):
+                link = pmx.IKLink()
+                link.target = i - j
+                if j == 2:
+                    link.minimumAngle, link.maximumAngle = [-3.14, 0, 0], [-0.01, 0, 0]
+                b.ik_links.append(link)
+        elif i > 0 and i % 37 == 0:
+            b.hasAdditionalRotate = True
+            b.additionalTransform = (i - 1, 0.5)
+        model.bones.append(b)
+
+    for i in range(num_vertex_morphs):
+        morph = pmx.VertexMorph('morph%d'%i, 'morph%d'%i, 1 + i%4)
+        for index in rand.sample(range(num_vertices), min(morph_size, num_vertices)):
+            offset = pmx.VertexMorphOffset()
+            offset.index = index
+            offset.offset = _vec(3, -0.1, 0.1)
+            morph.offsets.append(offset)
+        model.morphs.append(morph)
+
+    for i in range(min(10, num_bones)):
+        rigid = pmx.Rigid()
+        rigid.name = rigid.name_e = 'rigid%d'%i
+        rigid.bone = i
+        rigid.size, rigid.location, rigid.rotation = _vec(3, 0, 1), _vec(3), _vec(3)
+        rigid.velocity_attenuation = rigid.rotation_attenuation = rigid.bounce = rigid.friction = 0.5
+        model.rigids.append(rigid)
+
+    return model
+
+
+def save_pmx_model(path, model, additional_uvs=1):
+    pmx.save(path, model, add_uv_count=additional_uvs)
+    return path
+
+
+def make_vmd_file(num_bones=100, num_bone_keys=10000, num_morphs=50, num_morph_keys=2000, num_camera_keys=1000, seed=0):
+    rand = random.Random(seed)
+    def _vec(size, lo=-1.0, hi=1.0):
+        return [rand.uniform(lo, hi) for _ in range(size)]
+
+    vmd_file = vmd.File()
+    vmd_file.header = vmd.Header()
+    vmd_file.header.model_name = 'synthetic'
+    vmd_file.boneAnimation = vmd.BoneAnimation()
+    vmd_file.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+    vmd_file.cameraAnimation = vmd.CameraAnimation()
+    vmd_file.lampAnimation = vmd.LampAnimation()
+
+    for i in range(num_bones):
+        frame_keys = vmd_file.boneAnimation['bone%d'%i]
+        for frame_number in range(num_bone_keys):
+            key = vmd.BoneFrameKey()
+            key.frame_number = frame_number
+            key.location = _vec(3)
+            key.rotation = _vec(4)
+            key.interp = [rand.randrange(128) for _ in range(64)]
+            frame_keys.append(key)
+
+    for i in range(num_morphs):
+        frame_keys = vmd_file.shapeKeyAnimation['morph%d'%i]
+        for frame_number in range(num_morph_keys):
+            key = vmd.ShapeKeyFrameKey()
+            key.frame_number = frame_number
+            key.weight = rand.random()
+            frame_keys.append(key)
+
+    for frame_number in range(num_camera_keys):
+        key = vmd.CameraKeyFrameKey()
+        key.frame_number = frame_number
+        key.distance = -45.0
+        key.location = _vec(3, -10, 10)
+        key.rotation = _vec(3)
+        key.interp = [rand.randrange(128) for _ in range(24)]
+        key.angle = 30
+        vmd_file.cameraAnimation.append(key)
+        lamp_key = vmd.LampKeyFrameKey()
+        lamp_key.frame_number = frame_number
+        lamp_key.color = _vec(3, 0, 1)
+        lamp_key.direction = _vec(3)
+        vmd_file.lampAnimation.append(lamp_key)
+
+    return vmd_file
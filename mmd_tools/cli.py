@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+""" Convert and inspect MMD files without Blender.
+
+Usage:
+    python -m mmd_tools.cli convert [-o DIR] [-j N] PATH...
+    python -m mmd_tools.cli stats [--json] [-j N] PATH...
+    python -m mmd_tools.cli validate [-j N] PATH...
+
+convert   converts pmd models into pmx models (next to the pmd files, or in DIR)
+stats     prints the sizes of the sections of pmx, pmd, vmd and vpd files
+validate  checks the indices of pmx and pmd models, the exit code is 1 if any is invalid
+
+A directory PATH is searched recursively for the files of the command, and
+the files are processed by N worker processes (the number of CPUs by default).
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+from mmd_tools.core import batch, pmd, pmx, vmd, vpd
+from mmd_tools.core.pmd.importer import import_pmd_to_pmx
+
+EXTENSIONS = {
+    'convert': ('.pmd',),
+    'stats': ('.pmx', '.pmd', '.vmd', '.vpd'),
+    'validate': ('.pmx', '.pmd'),
+    }
+
+
+def find_files(paths, extensions):
+    """ The files of paths, the directories are searched recursively for the files of the extensions.
+    """
+    ret = []
+    for path in paths:
+        if not os.path.isdir(path):
+            ret.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            ret.extend(os.path.join(root, name) for name in sorted(files) if os.path.splitext(name)[1].lower() in extensions)
+    return ret
+
+
+def convert_pmd_to_pmx(path, output_dir=None):
+    """ Convert a pmd file into a pmx file of the same name.
+
+    @param output_dir the directory of the pmx file, None for the directory of the pmd file
+    @return the path of the pmx file
+    """
+    model = import_pmd_to_pmx(path)
+    name = os.path.splitext(os.path.basename(path))[0] + '.pmx'
+    output_path = os.path.join(output_dir or os.path.dirname(path), name)
+    pmx.save(output_path, model)
+    return output_path
+
+
+def _counts(**kwargs):
+    return collections.OrderedDict((k, v) for k, v in kwargs.items())
+
+def section_stats(path):
+    """ The statistics of the sections of a pmx, pmd, vmd or vpd file.
+
+    @return an OrderedDict of the values, the counts of the sections and the sizes of the pmx sections
+    """
+    ext = os.path.splitext(path)[1].lower()
+    stats = collections.OrderedDict([('path', path), ('size', os.path.getsize(path))])
+    if ext == '.pmx':
+        model = pmx.load(path, sections=('morphs',))
+        header = model.header
+        stats['version'] = header.version
+        stats['encoding'] = header.encoding.charset
+        stats['additional_uvs'] = header.additional_uvs
+        stats['name'] = model.name
+        for name, section in model.section_index.items():
+            stats[name] = section.count//3 if name == 'faces' else section.count # faces are counted by indices
+            stats[name + '_bytes'] = section.size
+        morph_types = collections.Counter(type(m).__name__ for m in model.morphs)
+        stats['morph_types'] = collections.OrderedDict(sorted(morph_types.items()))
+    elif ext == '.pmd':
+        model = pmd.load(path)
+        stats['name'] = model.name
+        stats.update(_counts(vertices=len(model.vertices), faces=len(model.faces), materials=len(model.materials),
+            bones=len(model.bones), iks=len(model.iks), morphs=len(model.morphs),
+            rigids=len(model.rigid_bodies), joints=len(model.joints)))
+    elif ext == '.vmd':
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=path)
+        frame_numbers = [k.frame_number for anim in (vmd_file.cameraAnimation, vmd_file.lampAnimation) for k in anim]
+        for anim in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation):
+            for frameKeys in anim.values():
+                frame_numbers.extend(k.frame_number for k in frameKeys)
+        stats['model_name'] = vmd_file.header.model_name
+        stats.update(_counts(
+            bones=len(vmd_file.boneAnimation),
+            bone_keys=sum(len(i) for i in vmd_file.boneAnimation.values()),
+            morphs=len(vmd_file.shapeKeyAnimation),
+            morph_keys=sum(len(i) for i in vmd_file.shapeKeyAnimation.values()),
+            camera_keys=len(vmd_file.cameraAnimation),
+            lamp_keys=len(vmd_file.lampAnimation),
+            self_shadow_keys=len(vmd_file.selfShadowAnimation),
+            property_keys=len(vmd_file.propertyAnimation),
+            last_frame=max(frame_numbers, default=0),
+            ))
+    elif ext == '.vpd':
+        vpd_file = vpd.File()
+        vpd_file.load(filepath=path)
+        stats['model_name'] = vpd_file.osm_name
+        stats.update(_counts(bones=len(vpd_file.bones), morphs=len(vpd_file.morphs)))
+    else:
+        raise ValueError('unsupported file type "%s"'%ext)
+    return stats
+
+
+def _vertexBones(vertices):
+    arrays = getattr(vertices, 'arrays', None)
+    if arrays is not None:
+        return arrays.bones
+    bones = np.full((len(vertices), 4), -1, dtype=np.int64)
+    for i, v in enumerate(vertices):
+        bones[i, :len(v.weight.bones)] = v.weight.bones
+    return bones
+
+def _faceArray(faces):
+    array = getattr(faces, 'array', None)
+    if array is not None:
+        return array
+    return np.array(list(faces), dtype=np.int64).reshape(-1, 3)
+
+def validate_model(model):
+    """ Check the indices of a pmx.Model.
+
+    @return a list of the messages of the invalid indices, empty if the model is valid
+    """
+    problems = []
+    num_vertices, num_textures, num_materials = len(model.vertices), len(model.textures), len(model.materials)
+    num_bones, num_morphs, num_rigids = len(model.bones), len(model.morphs), len(model.rigids)
+
+    def _check(where, name, index, count, optional=True):
+        if index is None and optional:
+            return
+        if index is None or not (-1 if optional else 0) <= index < count:
+            problems.append('%s: %s %s out of range (%d)'%(where, name, index, count))
+
+    def _checkArray(where, name, indices, count, lower=0):
+        invalid = np.flatnonzero((indices < lower) | (indices >= count))
+        if len(invalid):
+            problems.append('%s: %d %s out of range (%d), first at %d'%(where, len(invalid), name, count, invalid[0]))
+
+    faces = _faceArray(model.faces)
+    _checkArray('faces', 'vertex indices', faces.ravel(), num_vertices)
+    _checkArray('vertices', 'bone indices', _vertexBones(model.vertices).ravel(), num_bones, lower=-1)
+
+    vertex_count = 0
+    for i, mat in enumerate(model.materials):
+        where = 'materials[%d]'%i
+        _check(where, 'texture', mat.texture, num_textures)
+        _check(where, 'sphere texture', mat.sphere_texture, num_textures)
+        _check(where, 'toon texture', mat.toon_texture, 10 if mat.is_shared_toon_texture else num_textures)
+        if mat.vertex_count % 3:
+            problems.append('%s: vertex count %d is not a multiple of 3'%(where, mat.vertex_count))
+        vertex_count += mat.vertex_count
+    if vertex_count != len(faces)*3:
+        problems.append('materials: vertex counts %d do not match the faces (%d)'%(vertex_count, len(faces)*3))
+
+    for i, bone in enumerate(model.bones):
+        where = 'bones[%d]'%i
+        _check(where, 'parent', bone.parent, num_bones)
+        if bone.parent == i:
+            problems.append('%s: parent of itself'%where)
+        if isinstance(bone.displayConnection, int):
+            _check(where, 'display connection', bone.displayConnection, num_bones)
+        if (bone.hasAdditionalRotate or bone.hasAdditionalLocation) and bone.additionalTransform:
+            _check(where, 'append source', bone.additionalTransform[0], num_bones)
+        if bone.isIK:
+            _check(where, 'IK target', bone.target, num_bones, optional=False)
+            for j, link in enumerate(bone.ik_links):
+                _check(where, 'IK link %d'%j, link.target, num_bones, optional=False)
+
+    for i, morph in enumerate(model.morphs):
+        where = 'morphs[%d]'%i
+        if isinstance(morph, (pmx.VertexMorph, pmx.UVMorph)):
+            arrays = getattr(morph.offsets, 'arrays', None)
+            indices = arrays[0] if arrays is not None else np.array([o.index for o in morph.offsets], dtype=np.int64)
+            _checkArray(where, 'vertex indices', indices, num_vertices)
+        elif isinstance(morph, pmx.BoneMorph):
+            for o in morph.offsets:
+                _check(where, 'bone', o.index, num_bones, optional=False)
+        elif isinstance(morph, pmx.MaterialMorph):
+            for o in morph.offsets:
+                _check(where, 'material', o.index, num_materials)
+        elif isinstance(morph, pmx.GroupMorph):
+            for o in morph.offsets:
+                _check(where, 'morph', o.morph, num_morphs, optional=False)
+
+    for i, display in enumerate(model.display):
+        for disp_type, index in display.data:
+            _check('display[%d]'%i, 'bone' if disp_type == 0 else 'morph', index, num_bones if disp_type == 0 else num_morphs, optional=False)
+
+    for i, rigid in enumerate(model.rigids):
+        _check('rigids[%d]'%i, 'bone', rigid.bone, num_bones)
+
+    for i, joint in enumerate(model.joints):
+        _check('joints[%d]'%i, 'source rigid', joint.src_rigid, num_rigids)
+        _check('joints[%d]'%i, 'destination rigid', joint.dest_rigid, num_rigids)
+
+    return problems
+
+def validate_file(path):
+    """ Check the indices of a pmx or pmd file, see validate_model().
+    """
+    if os.path.splitext(path)[1].lower() == '.pmd':
+        model = import_pmd_to_pmx(path)
+    else:
+        model = pmx.load(path, columnar=True)
+    return validate_model(model)
+
+
+def _printStats(stats, use_json):
+    if use_json:
+        print(json.dumps(stats, ensure_ascii=False))
+        return
+    print(stats['path'])
+    for key, value in stats.items():
+        if key == 'path':
+            continue
+        if isinstance(value, dict):
+            value = ', '.join('%s %s'%i for i in value.items()) or '-'
+        print('  %-18s %s'%(key, value))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mmd_tools.cli', description='Convert and inspect MMD files without Blender.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the messages of the loaders')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    for command, help_text in (('convert', 'convert pmd models into pmx models'), ('stats', 'print the sections of the files'), ('validate', 'check the indices of the models')):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('paths', nargs='+', help='the files, or the directories to search for %s files'%'/'.join(EXTENSIONS[command]))
+        sub.add_argument('-j', '--workers', type=int, default=None, help='the number of worker processes (default: the number of CPUs)')
+        if command == 'convert':
+            sub.add_argument('-o', '--output-dir', default=None, help='the directory of the pmx files (default: next to the pmd files)')
+        elif command == 'stats':
+            sub.add_argument('--json', action='store_true', help='print a JSON object per file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(levelname)s: %(message)s')
+
+    paths = find_files(args.paths, EXTENSIONS[args.command])
+    if args.command == 'convert':
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        results = batch.load_many(convert_pmd_to_pmx, paths, args.workers, output_dir=args.output_dir)
+    elif args.command == 'stats':
+        results = batch.load_many(section_stats, paths, args.workers)
+    else:
+        results = batch.load_many(validate_file, paths, args.workers)
+
+    failed = 0
+    for r in results:
+        if r.error is not None: # logged by load_many()
+            failed += 1
+        elif args.command == 'convert':
+            print('%s -> %s'%(r.path, r.data))
+        elif args.command == 'stats':
+            _printStats(r.data, args.json)
+        else:
+            failed += bool(r.data)
+            print('%s: %s'%(r.path, 'invalid' if r.data else 'ok'))
+            for message in r.data:
+                print('  %s'%message)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+""" Load many MMD files in worker processes.
+
+The loaders of pmx, pmd and vmd are CPU-bound Python, so the files are parsed in
+a ProcessPoolExecutor and the models are pickled back to the caller.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import pickle
+import traceback
+
+LoadResult = collections.namedtuple('LoadResult', ('path', 'data', 'error', 'traceback', 'messages'))
+LoadResult.__doc__ = """ The result of loading a file.
+
+path: the path of the file
+data: the loaded model or motion, None on failure
+error: the exception raised by the loader, None on success
+traceback: the formatted traceback of the error in the worker, None on success
+messages: the (level name, message) of the warnings and errors logged while loading
+"""
+
+
+class _MessageHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        try:
+            self.messages.append((record.levelname, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+
+def _load(load_func, path, kwargs):
+    handler = _MessageHandler()
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+    try:
+        return LoadResult(path, load_func(path, **kwargs), None, None, handler.messages)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError('%s: %s'%(type(e).__name__, e))
+        return LoadResult(path, None, e, traceback.format_exc(), handler.messages)
+    finally:
+        logger.removeHandler(handler)
+
+
+def _loadInPools(load_func, paths, kwargs, workers):
+    """ Load the files in process pools, replacing a pool broken by a crashed worker.
+
+    The files which were not finished when a pool broke are loaded again in a new
+    pool. If no file was finished, they are loaded by a single worker, so the first
+    unfinished file of a broken pool is the one which crashed it and it fails alone.
+    """
+    results = [None]*len(paths)
+    pending = list(range(len(paths)))
+    while pending:
+        broken = []
+        workers = min(workers, len(pending))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_load, load_func, paths[i], kwargs) for i in pending]
+            for i, future in zip(pending, futures):
+                try:
+                    results[i] = future.result()
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    broken.append((i, e, traceback.format_exc()))
+                except Exception as e: # the result is not picklable
+                    results[i] = LoadResult(paths[i], None, e, traceback.format_exc(), [])
+        if broken and workers == 1:
+            i, e, tb = broken.pop(0)
+            results[i] = LoadResult(paths[i], None, e, tb, [])
+        elif len(broken) == len(pending):
+            workers = 1
+        if broken:
+            logging.warning('A worker process crashed, loading %d files again', len(broken))
+        pending = [i for i, e, tb in broken]
+    return results
+
+
+def load_many(load_func, paths, workers=None, **kwargs):
+    """ Load the files with load_func(path, **kwargs) in worker processes.
+
+    @param load_func a module-level function, it is pickled to the workers
+    @param paths the paths of the files
+    @param workers the number of worker processes, None for the number of CPUs.
+        With 1 worker the files are loaded in this process.
+    @return a list of LoadResult in the order of paths. A failure of a file is
+        reported in its result instead of raised. The files which were pending in
+        the workers when one crashed are loaded again, and only the file which
+        crashed its worker fails with BrokenProcessPool.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+
+    if workers == 1:
+        results = [_load(load_func, path, kwargs) for path in paths]
+    else:
+        results = _loadInPools(load_func, paths, kwargs, workers)
+
+    for r in results:
+        if r.error is not None:
+            logging.error('Failed to load "%s": %s', r.path, r.error)
+    logging.info('Loaded %d of %d files with %d workers', sum(r.error is None for r in results), len(results), workers)
+    return results
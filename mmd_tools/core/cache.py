@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+""" An on-disk cache of parsed MMD files.
+
+The parsed pmx.Model or vmd.File is pickled into the cache directory, keyed by
+the path, size and modification time of the source file (and optionally a hash
+of its content), so a file which is imported again is unpickled instead of
+parsed. The least recently used entries are removed when the cache is larger
+than its size limit.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import tempfile
+
+import mmd_tools
+
+# increment when the pickled classes of the file format modules change
+CACHE_VERSION = 1
+
+_MAGIC = b'MMDCACHE'
+_HEADER = struct.Struct('<8sI')
+_EXTENSION = '.mmdcache'
+
+
+class ModelCache:
+    """ A size-bounded LRU cache of parsed files in a directory.
+
+    Usage:
+        cache = ModelCache(directory, max_size=1024*1024*1024)
+        model = cache.load(pmx.load, filepath, sections=sections)
+    """
+    def __init__(self, directory, max_size=1024*1024*1024, use_hash=False):
+        """
+        @param directory the cache directory, created if it does not exist
+        @param max_size the maximum total size of the cached files in bytes
+        @param use_hash key the files by a hash of their content as well,
+            to detect changes which keep the size and modification time
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.use_hash = use_hash
+
+    def __repr__(self):
+        return '<ModelCache %s, max_size %d>'%(self.directory, self.max_size)
+
+    def key(self, load_func, path, **kwargs):
+        """ The key of the cache entry of load_func(path, **kwargs).
+        """
+        stat = os.stat(path)
+        h = hashlib.sha1()
+        for value in (CACHE_VERSION, mmd_tools.MMD_TOOLS_VERSION, load_func.__module__, load_func.__qualname__,
+                os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns, sorted(kwargs.items(), key=lambda i: i[0])):
+            h.update(repr(value).encode('utf-8', 'replace'))
+            h.update(b'\0')
+        if self.use_hash:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024*1024), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def __entryPath(self, key):
+        return os.path.join(self.directory, key + _EXTENSION)
+
+    def get(self, key):
+        """ The cached object of the key, None if it is not cached or the entry is invalid.
+        """
+        entry_path = self.__entryPath(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                magic, version = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != CACHE_VERSION:
+                    raise ValueError('unsupported cache version')
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning('Removing invalid cache entry "%s": %s', entry_path, e)
+            self.__remove(entry_path)
+            return None
+        os.utime(entry_path) # the modification time orders the entries for the eviction
+        return data
+
+    def put(self, key, data):
+        """ Store data in the cache, and remove the least recently used entries over max_size.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, CACHE_VERSION))
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.__entryPath(key))
+        except Exception:
+            self.__remove(tmp_path)
+            raise
+        self.evict()
+
+    def load(self, load_func, path, **kwargs):
+        """ Return load_func(path, **kwargs), from the cache if it is cached.
+
+        A failure of the cache is logged and the file is loaded as usual.
+        """
+        try:
+            key = self.key(load_func, path, **kwargs)
+        except OSError:
+            return load_func(path, **kwargs) # let load_func report the missing file
+        data = self.get(key)
+        if data is not None:
+            logging.info('Loaded "%s" from the cache', path)
+            return data
+        data = load_func(path, **kwargs)
+        try:
+            self.put(key, data)
+        except Exception as e:
+            logging.warning('Failed to cache "%s": %s', path, e)
+        return data
+
+    def entries(self):
+        """ The (path, size, modification time) of the cache entries, the least recently used first.
+        """
+        ret = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return ret
+        for name in names:
+            if not name.endswith(_EXTENSION):
+                continue
+            entry_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry_path)
+            except FileNotFoundError: # removed by another process
+                continue
+            ret.append((entry_path, stat.st_size, stat.st_mtime_ns))
+        ret.sort(key=lambda i: i[2])
+        return ret
+
+    def size(self):
+        """ The total size of the cache entries in bytes.
+        """
+        return sum(i[1] for i in self.entries())
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is not larger than max_size.
+        """
+        entries = self.entries()
+        total = sum(i[1] for i in entries)
+        for entry_path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            logging.debug('Evicting cache entry "%s"', entry_path)
+            self.__remove(entry_path)
+            total -= size
+
+    def clear(self):
+        """ Remove all cache entries.
+        """
+        for entry_path, _, _ in self.entries():
+            self.__remove(entry_path)
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def from_preferences():
+    """ The ModelCache of the add-on preferences, None if the cache folder is not set.
+    """
+    import bpy
+    from mmd_tools.bpyutils import addon_preferences
+    directory = addon_preferences('model_cache_folder', '')
+    if not directory:
+        return None
+    return ModelCache(bpy.path.abspath(directory),
+        max_size=addon_preferences('model_cache_size', 1024)*1024*1024,
+        use_hash=addon_preferences('model_cache_use_hash', False))
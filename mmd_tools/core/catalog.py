@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+""" A searchable index of the pmx and vmd files of asset libraries.
+
+The metadata of the files (names, section counts, bone and morph names, motion
+length) is read by the parsers without decoding the vertex data, and stored in
+a SQLite database. A rescan only reads the files which were added or modified
+since the last scan.
+
+Usage:
+    with Catalog(db_path) as catalog:
+        catalog.scan([library_folder])
+        for entry in catalog.query(name='miku', morphs=['あ'], min_bones=100):
+            print(entry.path, entry.bone_count)
+"""
+
+import collections
+import logging
+import os
+import sqlite3
+
+from mmd_tools.core import batch, pmx, vmd
+
+SCHEMA_VERSION = 1
+
+EXTENSIONS = ('.pmx', '.vmd')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    file_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    name_e TEXT NOT NULL DEFAULT '',
+    vertex_count INTEGER NOT NULL DEFAULT 0,
+    face_count INTEGER NOT NULL DEFAULT 0,
+    material_count INTEGER NOT NULL DEFAULT 0,
+    bone_count INTEGER NOT NULL DEFAULT 0,
+    morph_count INTEGER NOT NULL DEFAULT 0,
+    rigid_count INTEGER NOT NULL DEFAULT 0,
+    joint_count INTEGER NOT NULL DEFAULT 0,
+    motion_length INTEGER NOT NULL DEFAULT 0,
+    bone_key_count INTEGER NOT NULL DEFAULT 0,
+    morph_key_count INTEGER NOT NULL DEFAULT 0,
+    camera_key_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS bones (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS morphs (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bones_name ON bones(name, file_id);
+CREATE INDEX IF NOT EXISTS bones_file ON bones(file_id);
+CREATE INDEX IF NOT EXISTS morphs_name ON morphs(name, file_id);
+CREATE INDEX IF NOT EXISTS morphs_file ON morphs(file_id);
+CREATE INDEX IF NOT EXISTS files_bone_count ON files(bone_count);
+CREATE INDEX IF NOT EXISTS files_motion_length ON files(motion_length);
+'''
+
+# the columns of the metadata, in the order of the files table
+_COLUMNS = ('file_type', 'name', 'name_e', 'vertex_count', 'face_count', 'material_count', 'bone_count',
+    'morph_count', 'rigid_count', 'joint_count', 'motion_length', 'bone_key_count', 'morph_key_count', 'camera_key_count')
+
+CatalogEntry = collections.namedtuple('CatalogEntry', ('path', 'size', 'mtime_ns') + _COLUMNS + ('error',))
+CatalogEntry.__doc__ = """ A file of the catalog.
+
+For a pmx model bone_count and morph_count are the numbers of bones and morphs
+of the model. For a vmd motion name is the target model name, bone_count and
+morph_count are the numbers of animated bones and morphs, and motion_length is
+the last frame number. error is the message of a file which failed to be read.
+"""
+
+ScanResult = collections.namedtuple('ScanResult', ('added', 'updated', 'removed', 'unchanged', 'failed'))
+
+
+def read_metadata(path):
+    """ Read the metadata of a pmx or vmd file, skipping the vertex and face data.
+
+    @return a dict of the columns of CatalogEntry, and the lists of names 'bones' and 'morphs'
+    """
+    ext = os.path.splitext(path)[1].lower()
+    ret = dict.fromkeys(_COLUMNS, 0)
+    if ext == '.pmx':
+        # columnar morph offsets are decoded as arrays without creating the offset objects
+        model = pmx.load(path, sections=('bones', 'morphs'), columnar=True)
+        # pmx.load() logs a corrupted file and returns the sections read so far
+        missing = [name for name in pmx.Model.SECTIONS if name not in model.section_index]
+        if missing:
+            raise pmx.InvalidFileError('Truncated file, failed to read the %s section'%missing[0])
+        counts = {name: section.count for name, section in model.section_index.items()}
+        ret.update(file_type='pmx', name=model.name, name_e=model.name_e,
+            vertex_count=counts.get('vertices', 0), face_count=counts.get('faces', 0)//3,
+            material_count=counts.get('materials', 0), bone_count=len(model.bones), morph_count=len(model.morphs),
+            rigid_count=counts.get('rigids', 0), joint_count=counts.get('joints', 0))
+        ret['bones'] = [b.name for b in model.bones]
+        ret['morphs'] = [m.name for m in model.morphs]
+    elif ext == '.vmd':
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=path, sections=('boneAnimation', 'shapeKeyAnimation', 'cameraAnimation'))
+        last_frames = [k.frame_number for k in vmd_file.cameraAnimation[-1:]]
+        for anim in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation):
+            for frameKeys in anim.values():
+                records = getattr(frameKeys, 'records', None)
+                if records is not None:
+                    last_frames.append(int(records['frame_number'].max(initial=0)))
+                else:
+                    last_frames.extend(k.frame_number for k in frameKeys)
+        ret.update(file_type='vmd', name=vmd_file.header.model_name,
+            bone_count=len(vmd_file.boneAnimation), morph_count=len(vmd_file.shapeKeyAnimation),
+            motion_length=max(last_frames, default=0),
+            bone_key_count=sum(len(i) for i in vmd_file.boneAnimation.values()),
+            morph_key_count=sum(len(i) for i in vmd_file.shapeKeyAnimation.values()),
+            camera_key_count=len(vmd_file.cameraAnimation))
+        ret['bones'] = list(vmd_file.boneAnimation.keys())
+        ret['morphs'] = list(vmd_file.shapeKeyAnimation.keys())
+    else:
+        raise ValueError('unsupported file type "%s"'%ext)
+    return ret
+
+
+def _scanFolder(folder, extensions, failed_folders=None):
+    """ Yield the (path, size, mtime_ns) of the files of the extensions in folder and its subfolders.
+
+    @param failed_folders a list to append the folders which could not be read to
+    """
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError as e:
+            logging.warning('Failed to scan "%s": %s', current, e.strerror)
+            if failed_folders is not None:
+                failed_folders.append(current)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in extensions:
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+                except OSError:
+                    continue
+
+
+class Catalog:
+    """ The SQLite index of the metadata of pmx and vmd files.
+    """
+    def __init__(self, db_path):
+        """
+        @param db_path the path of the database file, created if it does not exist
+        """
+        self.db_path = db_path
+        self.__db = sqlite3.connect(db_path)
+        self.__db.execute('PRAGMA foreign_keys = ON')
+        version = self.__db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            # the catalog is an index of the files, so it is rebuilt instead of migrated
+            logging.info('Rebuilding the catalog "%s" of schema version %d', db_path, version)
+            self.__db.executescript('DROP TABLE IF EXISTS bones; DROP TABLE IF EXISTS morphs; DROP TABLE IF EXISTS files;')
+        self.__db.executescript(_SCHEMA)
+        self.__db.execute('PRAGMA user_version = %d'%SCHEMA_VERSION)
+        self.__db.commit()
+
+    def __repr__(self):
+        return '<Catalog %s>'%self.db_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+    def close(self):
+        self.__db.close()
+
+    def __len__(self):
+        return self.__db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def scan(self, folders, workers=None, chunk_size=1000):
+        """ Index the pmx and vmd files of the folders and their subfolders.
+
+        Only the files which are new or whose size or modification time changed
+        are read, and the files which no longer exist are removed from the catalog.
+        The files of a folder which is missing or could not be read are kept.
+
+        @param folders the folders to scan
+        @param workers the number of worker processes reading the files, see batch.load_many()
+        @param chunk_size the number of files read before committing them to the database
+        @return a ScanResult of the numbers of files
+        """
+        found = {}
+        failed_folders = []
+        for folder in folders:
+            for path, size, mtime_ns in _scanFolder(os.path.abspath(folder), EXTENSIONS, failed_folders):
+                found[path] = (size, mtime_ns)
+        # an unmounted or unreadable folder must not drop its files from the catalog
+        kept_prefixes = tuple(os.path.join(f, '') for f in failed_folders)
+
+        prefixes = tuple(os.path.join(os.path.abspath(f), '') for f in folders)
+        known = {path: (file_id, size, mtime_ns) for file_id, path, size, mtime_ns in
+            self.__db.execute('SELECT id, path, size, mtime_ns FROM files') if path.startswith(prefixes)}
+
+        removed = [(known[path][0],) for path in known.keys() - found.keys() if not path.startswith(kept_prefixes)]
+        changed = sorted(path for path, stat in found.items() if path not in known or known[path][1:] != stat)
+        with self.__db:
+            self.__db.executemany('DELETE FROM files WHERE id = ?', removed)
+
+        added = updated = failed = 0
+        for i in range(0, len(changed), chunk_size):
+            results = batch.load_many(read_metadata, changed[i:i+chunk_size], workers)
+            with self.__db:
+                for r in results:
+                    if r.path in known:
+                        updated += 1
+                    else:
+                        added += 1
+                    if r.error is not None:
+                        failed += 1
+                    self.__store(r.path, found[r.path], r.data, r.error)
+            logging.info('Scanned %d of %d changed files', min(i + chunk_size, len(changed)), len(changed))
+
+        result = ScanResult(added, updated, len(removed), len(found) - len(changed), failed)
+        logging.info('Catalog scan: %s', result)
+        return result
+
+    def __store(self, path, stat, data, error):
+        db = self.__db
+        db.execute('DELETE FROM files WHERE path = ?', (path,))
+        if data is None:
+            values = {'file_type': os.path.splitext(path)[1].lower()[1:]}
+        else:
+            values = data
+        row = [path, stat[0], stat[1]] + [values.get(c, 0 if c.endswith(('_count', '_length')) else '') for c in _COLUMNS]
+        row.append(None if error is None else str(error))
+        cursor = db.execute('INSERT INTO files (path, size, mtime_ns, %s, error) VALUES (%s)'%(
+            ', '.join(_COLUMNS), ', '.join('?'*len(row))), row)
+        if data is not None:
+            file_id = cursor.lastrowid
+            db.executemany('INSERT INTO bones (file_id, name) VALUES (?, ?)', ((file_id, n) for n in set(data['bones'])))
+            db.executemany('INSERT INTO morphs (file_id, name) VALUES (?, ?)', ((file_id, n) for n in set(data['morphs'])))
+
+    def query(self, name=None, file_type=None, bones=(), morphs=(), min_bones=None, max_bones=None,
+            min_length=None, max_length=None, include_errors=False, limit=None):
+        """ Search the files of the catalog.
+
+        @param name a part of the name, English name or file name (case-insensitive for ASCII)
+        @param file_type 'pmx' or 'vmd', None for both
+        @param bones the names of bones which the files must all have (the animated bones of a motion)
+        @param morphs the names of morphs which the files must all have (the animated morphs of a motion)
+        @param min_bones, max_bones the range of bone_count
+        @param min_length, max_length the range of motion_length
+        @param include_errors include the files which failed to be read
+        @param limit the maximum number of results, None for all
+        @return a list of CatalogEntry sorted by path
+        """
+        conditions, params = [], []
+        if name:
+            pattern = '%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(name LIKE ? ESCAPE '\\' OR name_e LIKE ? ESCAPE '\\' OR path LIKE ? ESCAPE '\\')")
+            params += [pattern]*3
+        if file_type:
+            conditions.append('file_type = ?')
+            params.append(file_type)
+        for table, names in (('bones', bones), ('morphs', morphs)):
+            if isinstance(names, str):
+                names = (names,)
+            for n in names:
+                conditions.append('id IN (SELECT file_id FROM %s WHERE name = ?)'%table)
+                params.append(n)
+        for column, op, value in (('bone_count', '>=', min_bones), ('bone_count', '<=', max_bones),
+                ('motion_length', '>=', min_length), ('motion_length', '<=', max_length)):
+            if value is not None:
+                conditions.append('%s %s ?'%(column, op))
+                params.append(value)
+        if not include_errors:
+            conditions.append('error IS NULL')
+
+        sql = 'SELECT %s FROM files'%', '.join(CatalogEntry._fields)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY path'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [CatalogEntry(*row) for row in self.__db.execute(sql, params)]
+
+    def entry(self, path):
+        """ The CatalogEntry of the file, None if it is not in the catalog.
+        """
+        row = self.__db.execute('SELECT %s FROM files WHERE path = ?'%', '.join(CatalogEntry._fields), (os.path.abspath(path),)).fetchone()
+        return CatalogEntry(*row) if row else None
+
+    def boneNames(self, path):
+        """ The sorted bone names of the file (the animated bones of a motion).
+        """
+        return self.__names('bones', path)
+
+    def morphNames(self, path):
+        """ The sorted morph names of the file (the animated morphs of a motion).
+        """
+        return self.__names('morphs', path)
+
+    def __names(self, table, path):
+        rows = self.__db.execute('SELECT t.name FROM %s t JOIN files f ON t.file_id = f.id WHERE f.path = ? ORDER BY t.name'%table,
+            (os.path.abspath(path),))
+        return [row[0] for row in rows]
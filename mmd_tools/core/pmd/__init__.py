@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
+import mmap
 import struct
 import os
 import re
 import logging
 import collections
 
+from mmd_tools.core import batch
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -88,6 +91,94 @@ class  FileReadStream(FileStream):
         return v
 
 
+class MappedFileReadStream(FileStream):
+    """ A FileReadStream which reads from a memory-mapped file.
+
+    Values are unpacked in place from a memoryview with precompiled structs.
+    """
+    _INT = struct.Struct('<i')
+    _UINT = struct.Struct('<I')
+    _SHORT = struct.Struct('<h')
+    _USHORT = struct.Struct('<H')
+    _FLOAT = struct.Struct('<f')
+    _BYTE = struct.Struct('<B')
+    _SBYTE = struct.Struct('<b')
+    _VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+
+    def __init__(self, path, pmx_header=None):
+        self.__fin = open(path, 'rb')
+        try:
+            self.__mmap = mmap.mmap(self.__fin.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__mmap)
+        except ValueError: # empty file
+            self.__mmap = None
+            self.__view = memoryview(b'')
+        self.__pos = 0
+        FileStream.__init__(self, path, self.__fin)
+
+    def close(self):
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+        FileStream.close(self)
+
+    # READ methods for general types
+    def readInt(self):
+        v, = self._INT.unpack_from(self.__view, self.__pos)
+        self.__pos += 4
+        return v
+
+    def readUnsignedInt(self):
+        v, = self._UINT.unpack_from(self.__view, self.__pos)
+        self.__pos += 4
+        return v
+
+    def readShort(self):
+        v, = self._SHORT.unpack_from(self.__view, self.__pos)
+        self.__pos += 2
+        return v
+
+    def readUnsignedShort(self):
+        v, = self._USHORT.unpack_from(self.__view, self.__pos)
+        self.__pos += 2
+        return v
+
+    def readStr(self, size):
+        buf = self.readBytes(size)
+        if buf[0] == b'\xfd':
+            return ''
+        return buf.split(b'\x00')[0].decode('shift_jis', errors='replace')
+
+    def readFloat(self):
+        v, = self._FLOAT.unpack_from(self.__view, self.__pos)
+        self.__pos += 4
+        return v
+
+    def readVector(self, size):
+        st = self._VECTORS.get(size) or struct.Struct('<'+'f'*size)
+        v = st.unpack_from(self.__view, self.__pos)
+        self.__pos += st.size
+        return v
+
+    def readByte(self):
+        v, = self._BYTE.unpack_from(self.__view, self.__pos)
+        self.__pos += 1
+        return v
+
+    def readBytes(self, length):
+        start = self.__pos
+        self.__pos = min(start + length, len(self.__view))
+        return self.__view[start:self.__pos].tobytes()
+
+    def readSignedByte(self):
+        v, = self._SBYTE.unpack_from(self.__view, self.__pos)
+        self.__pos += 1
+        return v
+
+
 class Header:
     PMD_SIGN = b'Pmd'
     VERSION = 1.0
@@ -593,8 +684,9 @@ class Model:
 
         logging.info('finished importing the model.')
 
-def load(path):
-    with FileReadStream(path) as fs:
+def load(path, use_mmap=False):
+    stream_class = MappedFileReadStream if use_mmap else FileReadStream
+    with stream_class(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmd module')
         logging.info('----------------------------------------')
@@ -614,3 +706,10 @@ def load(path):
         logging.info(' mmd_tools.pmd module')
         logging.info('****************************************')
         return model
+
+def load_many(paths, workers=None, use_mmap=False):
+    """ Load pmd files in worker processes, see batch.load_many().
+
+    @return a list of batch.LoadResult in the order of paths
+    """
+    return batch.load_many(load, paths, workers, use_mmap=use_mmap)
@@ -6,16 +6,15 @@ import re
 import copy
 import logging
 
-import mathutils
-
-import mmd_tools.core.pmx.importer as import_pmx
 import mmd_tools.core.pmd as pmd
 import mmd_tools.core.pmx as pmx
 
-from math import radians
+from math import radians, sqrt
 
 class PMDImporter:
     def execute(self, **args):
+        # the conversion below does not need Blender, only the import into the scene does
+        import mmd_tools.core.pmx.importer as import_pmx
         args['pmx'] = import_pmd_to_pmx(args['filepath'])
         importer = import_pmx.PMXImporter()
         importer.execute(**args)
@@ -125,11 +124,10 @@ def import_pmd_to_pmx(filepath):
             pmx_bone.isMovable = False
         elif bone.type == 8:
             pmx_bone.isMovable = False
-            tail_loc = mathutils.Vector(pmd_model.bones[bone.tail_bone].position)
-            loc = mathutils.Vector(bone.position)
-            vec = tail_loc - loc
-            vec.normalize()
-            pmx_bone.axis=list(vec)
+            tail_loc = pmd_model.bones[bone.tail_bone].position
+            vec = [t - l for t, l in zip(tail_loc, bone.position)]
+            length = sqrt(sum(x*x for x in vec))
+            pmx_bone.axis = [x/length for x in vec] if length > 0 else vec
         elif bone.type == 9:
             pmx_bone.visible = False
             pmx_bone.isMovable = False
@@ -316,7 +314,7 @@ def import_pmd_to_pmx(filepath):
             t = 0
         else:
             t = rigid.bone
-        pmx_rigid.location = mathutils.Vector(pmx_model.bones[t].location) + mathutils.Vector(rigid.location)
+        pmx_rigid.location = [a + b for a, b in zip(pmx_model.bones[t].location, rigid.location)]
         pmx_rigid.rotation = rigid.rotation
 
         pmx_rigid.mass = rigid.mass
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
+import collections
+import collections.abc
+import copy
+import mmap
 import struct
 import os
 import logging
 
+import numpy as np
+
+from mmd_tools.core import batch
+
+# NumPy dtypes of the signed (bone, texture, ...) and unsigned (vertex) indices
+_SIGNED_INDEX_DTYPES = {1: '<i1', 2: '<i2', 4: '<i4'}
+_UNSIGNED_INDEX_DTYPES = {1: '<u1', 2: '<u2', 4: '<u4'}
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -112,6 +124,143 @@ class FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def skip(self, length):
+        self.__fin.seek(length, os.SEEK_CUR)
+
+    def skipStr(self):
+        self.skip(self.readInt())
+
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, pos):
+        self.__fin.seek(pos)
+
+class MappedFileReadStream(FileStream):
+    """ A FileReadStream which reads from a memory-mapped file.
+
+    Values are unpacked in place from a memoryview with precompiled structs,
+    so no intermediate bytes object is created for each field.
+    """
+    _INT = struct.Struct('<i')
+    _SHORT = struct.Struct('<h')
+    _USHORT = struct.Struct('<H')
+    _FLOAT = struct.Struct('<f')
+    _BYTE = struct.Struct('<B')
+    _SBYTE = struct.Struct('<b')
+    _VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+    _SIGNED_INDICES = {1:_SBYTE, 2:_SHORT, 4:_INT}
+    _UNSIGNED_INDICES = {1:_BYTE, 2:_USHORT, 4:struct.Struct('<I')}
+
+    def __init__(self, path, pmx_header=None):
+        self.__fin = open(path, 'rb')
+        try:
+            self.__mmap = mmap.mmap(self.__fin.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__mmap)
+        except ValueError: # empty file
+            self.__mmap = None
+            self.__view = memoryview(b'')
+        self.__pos = 0
+        FileStream.__init__(self, path, self.__fin, pmx_header)
+
+    def close(self):
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+        FileStream.close(self)
+
+    def __readIndex(self, size, typedict):
+        if size not in typedict:
+            raise ValueError('invalid data size %s'%str(size))
+        st = typedict[size]
+        v, = st.unpack_from(self.__view, self.__pos)
+        self.__pos += size
+        return v
+
+    # READ methods for indexes
+    def readVertexIndex(self):
+        return self.__readIndex(self.header().vertex_index_size, self._UNSIGNED_INDICES)
+
+    def readBoneIndex(self):
+        return self.__readIndex(self.header().bone_index_size, self._SIGNED_INDICES)
+
+    def readTextureIndex(self):
+        return self.__readIndex(self.header().texture_index_size, self._SIGNED_INDICES)
+
+    def readMorphIndex(self):
+        return self.__readIndex(self.header().morph_index_size, self._SIGNED_INDICES)
+
+    def readRigidIndex(self):
+        return self.__readIndex(self.header().rigid_index_size, self._SIGNED_INDICES)
+
+    def readMaterialIndex(self):
+        return self.__readIndex(self.header().material_index_size, self._SIGNED_INDICES)
+
+    # READ methods for general types
+    def readInt(self):
+        v, = self._INT.unpack_from(self.__view, self.__pos)
+        self.__pos += 4
+        return v
+
+    def readShort(self):
+        v, = self._SHORT.unpack_from(self.__view, self.__pos)
+        self.__pos += 2
+        return v
+
+    def readUnsignedShort(self):
+        v, = self._USHORT.unpack_from(self.__view, self.__pos)
+        self.__pos += 2
+        return v
+
+    def readStr(self):
+        length = self.readInt()
+        start, end = self.__pos, self.__pos + length
+        if length < 0 or end > len(self.__view):
+            raise struct.error('unpack requires a buffer of %d bytes'%length)
+        self.__pos = end
+        return str(self.__view[start:end], self.header().encoding.charset, errors='replace')
+
+    def readFloat(self):
+        v, = self._FLOAT.unpack_from(self.__view, self.__pos)
+        self.__pos += 4
+        return v
+
+    def readVector(self, size):
+        st = self._VECTORS.get(size) or struct.Struct('<'+'f'*size)
+        v = st.unpack_from(self.__view, self.__pos)
+        self.__pos += st.size
+        return v
+
+    def readByte(self):
+        v, = self._BYTE.unpack_from(self.__view, self.__pos)
+        self.__pos += 1
+        return v
+
+    def readBytes(self, length):
+        start = self.__pos
+        self.__pos = min(start + length, len(self.__view))
+        return self.__view[start:self.__pos].tobytes()
+
+    def readSignedByte(self):
+        v, = self._SBYTE.unpack_from(self.__view, self.__pos)
+        self.__pos += 1
+        return v
+
+    def skip(self, length):
+        self.__pos += length
+
+    def skipStr(self):
+        self.skip(self.readInt())
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos):
+        self.__pos = pos
+
 class FileWriteStream(FileStream):
     def __init__(self, path, pmx_header=None):
         self.__fout = open(path, 'wb')
@@ -179,6 +328,122 @@ class FileWriteStream(FileStream):
     def writeSignedByte(self, v):
         self.__fout.write(struct.pack('<b', int(v)))
 
+    def reserve(self, size):
+        pass
+
+    def flush(self):
+        self.__fout.flush()
+
+class BufferedFileWriteStream(FileStream):
+    """ A FileWriteStream which packs the data into a preallocated buffer.
+
+    The buffer is written to the file by flush(), which Model.save() calls
+    once per section, and grows if the reserved size is not enough.
+    """
+    _INT = struct.Struct('<i')
+    _SHORT = struct.Struct('<h')
+    _USHORT = struct.Struct('<H')
+    _FLOAT = struct.Struct('<f')
+    _BYTE = struct.Struct('<B')
+    _SBYTE = struct.Struct('<b')
+    _VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+    _SIGNED_INDICES = {1:_SBYTE, 2:_SHORT, 4:_INT}
+    _UNSIGNED_INDICES = {1:_BYTE, 2:_USHORT, 4:struct.Struct('<I')}
+
+    def __init__(self, path, pmx_header=None, buffer_size=1<<20):
+        self.__fout = open(path, 'wb')
+        self.__buf = bytearray(buffer_size)
+        self.__pos = 0
+        FileStream.__init__(self, path, self.__fout, pmx_header)
+
+    def reserve(self, size):
+        """ Make sure that the next size bytes fit in the buffer.
+        """
+        required = self.__pos + size
+        if required > len(self.__buf):
+            self.__buf.extend(bytes(max(required, 2*len(self.__buf)) - len(self.__buf)))
+
+    def flush(self):
+        if self.__pos:
+            self.__fout.write(memoryview(self.__buf)[:self.__pos])
+            self.__pos = 0
+
+    def close(self):
+        if self.__fout is not None:
+            self.flush()
+            self.__fout = None
+        FileStream.close(self)
+
+    def __pack(self, st, v):
+        pos = self.__pos
+        if pos + st.size > len(self.__buf):
+            self.reserve(st.size)
+        st.pack_into(self.__buf, pos, v)
+        self.__pos = pos + st.size
+
+    def __writeIndex(self, index, size, typedict):
+        if size not in typedict:
+            raise ValueError('invalid data size %s'%str(size))
+        self.__pack(typedict[size], int(index))
+
+    # WRITE methods for indexes
+    def writeVertexIndex(self, index):
+        return self.__writeIndex(index, self.header().vertex_index_size, self._UNSIGNED_INDICES)
+
+    def writeBoneIndex(self, index):
+        return self.__writeIndex(index, self.header().bone_index_size, self._SIGNED_INDICES)
+
+    def writeTextureIndex(self, index):
+        return self.__writeIndex(index, self.header().texture_index_size, self._SIGNED_INDICES)
+
+    def writeMorphIndex(self, index):
+        return self.__writeIndex(index, self.header().morph_index_size, self._SIGNED_INDICES)
+
+    def writeRigidIndex(self, index):
+        return self.__writeIndex(index, self.header().rigid_index_size, self._SIGNED_INDICES)
+
+    def writeMaterialIndex(self, index):
+        return self.__writeIndex(index, self.header().material_index_size, self._SIGNED_INDICES)
+
+    # WRITE methods for general types
+    def writeInt(self, v):
+        self.__pack(self._INT, int(v))
+
+    def writeShort(self, v):
+        self.__pack(self._SHORT, int(v))
+
+    def writeUnsignedShort(self, v):
+        self.__pack(self._USHORT, int(v))
+
+    def writeStr(self, v):
+        data = v.encode(self.header().encoding.charset)
+        self.writeInt(len(data))
+        self.writeBytes(data)
+
+    def writeFloat(self, v):
+        self.__pack(self._FLOAT, float(v))
+
+    def writeVector(self, v):
+        st = self._VECTORS.get(len(v)) or struct.Struct('<'+'f'*len(v))
+        pos = self.__pos
+        if pos + st.size > len(self.__buf):
+            self.reserve(st.size)
+        st.pack_into(self.__buf, pos, *v)
+        self.__pos = pos + st.size
+
+    def writeByte(self, v):
+        self.__pack(self._BYTE, int(v))
+
+    def writeBytes(self, v):
+        data = memoryview(v).cast('B')
+        size = len(data)
+        self.reserve(size)
+        self.__buf[self.__pos:self.__pos+size] = data
+        self.__pos += size
+
+    def writeSignedByte(self, v):
+        self.__pack(self._SBYTE, int(v))
+
 class Encoding:
     _MAP = [
         (0, 'utf-16-le'),
@@ -315,7 +580,11 @@ class Header:
             self.rigid_index_size,
             )
 
+Section = collections.namedtuple('Section', 'offset size count')
+
 class Model:
+    SECTIONS = ('vertices', 'faces', 'textures', 'materials', 'bones', 'morphs', 'display', 'rigids', 'joints')
+
     def __init__(self):
         self.filepath = ''
         self.header = None
@@ -347,8 +616,28 @@ class Model:
         self.rigids = []
         self.joints = []
 
-    def load(self, fs):
+        # the (offset, size, count) of each section in the loaded file
+        self.section_index = collections.OrderedDict()
+        # the bytes of the sections which were not decoded by load()
+        self.raw_sections = {}
+
+        # columnar mode, see load()
+        self.columnar = False
+        self.vertex_morph_offsets = None
+        self.uv_morph_offsets = None
+
+    def load(self, fs, sections=None, columnar=False):
+        """ Load the model from the stream.
+
+        @param sections the names of the sections (see Model.SECTIONS) to decode,
+            other sections are kept as raw bytes in Model.raw_sections. None for all.
+        @param columnar keep faces in a FaceList and the offsets of vertex/UV morphs
+            in MorphOffsetArrays (vertex_morph_offsets, uv_morph_offsets) instead of
+            creating Python objects. The lists create the objects on demand.
+            Vertices are always backed by VertexArrays (see VertexList.arrays).
+        """
         self.filepath = fs.path()
+        self.columnar = columnar
         self.header = fs.header()
 
         self.name = fs.readStr()
@@ -362,53 +651,92 @@ class Model:
         logging.info('Comment:%s', self.comment)
         logging.info('Comment(english):%s', self.comment_e)
 
-        logging.info('')
-        logging.info('------------------------------')
+        loaders = {
+            'vertices': self.__loadVertices,
+            'faces': self.__loadFaces,
+            'textures': self.__loadTextures,
+            'materials': self.__loadMaterials,
+            'bones': self.__loadBones,
+            'morphs': self.__loadMorphs,
+            'display': self.__loadDisplay,
+            'rigids': self.__loadRigids,
+            'joints': self.__loadJoints,
+            }
+        self.section_index = collections.OrderedDict()
+        self.raw_sections = {}
+        for name in self.SECTIONS:
+            offset = fs.tell()
+            count = fs.readInt()
+            logging.info('')
+            logging.info('------------------------------')
+            if sections is None or name in sections:
+                loaders[name](fs, count)
+            else:
+                self.__skipSection(fs, name, count)
+                size = fs.tell() - offset
+                fs.seek(offset)
+                data = fs.readBytes(size)
+                if len(data) != size:
+                    raise struct.error('unexpected end of %s section'%name)
+                self.raw_sections[name] = data
+                setattr(self, name, [])
+                logging.info(' Skipped %s: %d items, %d bytes', name, count, size)
+            self.section_index[name] = Section(offset, fs.tell() - offset, count)
+
+    @staticmethod
+    def __skipSection(fs, name, count):
+        """ Move the stream to the end of the section without building any objects.
+        """
+        if name == 'vertices':
+            VertexArrays.skip(fs, count)
+        elif name == 'faces':
+            fs.skip(count*fs.header().vertex_index_size)
+        else:
+            skip_record = {
+                'textures': Texture.skip,
+                'materials': Material.skip,
+                'bones': Bone.skip,
+                'morphs': Morph.skip,
+                'display': Display.skip,
+                'rigids': Rigid.skip,
+                'joints': Joint.skip,
+                }[name]
+            for i in range(count):
+                skip_record(fs)
+
+    def __loadVertices(self, fs, count):
         logging.info('Load Vertices')
         logging.info('------------------------------')
-        num_vertices = fs.readInt()
-        self.vertices = []
-        for i in range(num_vertices):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        vertex_arrays = VertexArrays()
+        vertex_arrays.load(fs, count)
+        self.vertices = VertexList(vertex_arrays)
         logging.info('----- Loaded %d vertices', len(self.vertices))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadFaces(self, fs, count):
         logging.info(' Load Faces')
         logging.info('------------------------------')
-        num_faces = fs.readInt()
-        self.faces = []
-        for i in range(int(num_faces/3)):
-            f1 = fs.readVertexIndex()
-            f2 = fs.readVertexIndex()
-            f3 = fs.readVertexIndex()
-            self.faces.append((f3, f2, f1))
+        faces = FaceList.load(fs, count)
+        self.faces = faces if self.columnar else [tuple(f) for f in faces.array.tolist()]
         logging.info(' Load %d faces', len(self.faces))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadTextures(self, fs, count):
         logging.info(' Load Textures')
         logging.info('------------------------------')
-        num_textures = fs.readInt()
         self.textures = []
-        for i in range(num_textures):
+        for i in range(count):
             t = Texture()
             t.load(fs)
             self.textures.append(t)
             logging.info('Texture %d: %s', i, t.path)
         logging.info(' ----- Loaded %d textures', len(self.textures))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadMaterials(self, fs, count):
         logging.info(' Load Materials')
         logging.info('------------------------------')
-        num_materials = fs.readInt()
         self.materials = []
-        for i in range(num_materials):
+        for i in range(count):
             m = Material()
-            m.load(fs, num_textures)
+            m.load(fs, self.section_index['textures'].count)
             self.materials.append(m)
 
             logging.info('Material %d: %s', i, m.name)
@@ -439,13 +767,11 @@ class Model:
 
         logging.info('----- Loaded %d  materials.', len(self.materials))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadBones(self, fs, count):
         logging.info(' Load Bones')
         logging.info('------------------------------')
-        num_bones = fs.readInt()
         self.bones = []
-        for i in range(num_bones):
+        for i in range(count):
             b = Bone()
             b.load(fs)
             self.bones.append(b)
@@ -473,30 +799,29 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d bones.', len(self.bones))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadMorphs(self, fs, count):
         logging.info(' Load Morphs')
         logging.info('------------------------------')
-        num_morph = fs.readInt()
         self.morphs = []
         display_categories = {0: 'System', 1: 'Eyebrow', 2: 'Eye', 3: 'Mouth', 4: 'Other'}
-        for i in range(num_morph):
-            m = Morph.create(fs)
+        for i in range(count):
+            m = Morph.create(fs, self.columnar)
             self.morphs.append(m)
 
             logging.info('%s %d: %s', m.__class__.__name__, i, m.name)
             logging.debug('  Name(english): %s', m.name_e)
             logging.debug('  Category: %s (%d)', display_categories.get(m.category, '#Invalid'), m.category)
             logging.debug('')
+        if self.columnar:
+            self.vertex_morph_offsets = MorphOffsetArrays.join(self.morphs, VertexMorph, VertexMorphOffset, 3)
+            self.uv_morph_offsets = MorphOffsetArrays.join(self.morphs, UVMorph, UVMorphOffset, 4)
         logging.info('----- Loaded %d morphs.', len(self.morphs))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadDisplay(self, fs, count):
         logging.info(' Load Display Items')
         logging.info('------------------------------')
-        num_disp = fs.readInt()
         self.display = []
-        for i in range(num_disp):
+        for i in range(count):
             d = Display()
             d.load(fs)
             self.display.append(d)
@@ -506,15 +831,13 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d display items.', len(self.display))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadRigids(self, fs, count):
         logging.info(' Load Rigid Bodies')
         logging.info('------------------------------')
-        num_rigid = fs.readInt()
         self.rigids = []
         rigid_types = {0: 'Sphere', 1: 'Box', 2: 'Capsule'}
         rigid_modes = {0: 'Static', 1: 'Dynamic', 2: 'Dynamic(track to bone)'}
-        for i in range(num_rigid):
+        for i in range(count):
             r = Rigid()
             r.load(fs)
             self.rigids.append(r)
@@ -535,13 +858,11 @@ class Model:
 
         logging.info('----- Loaded %d rigid bodies.', len(self.rigids))
 
-        logging.info('')
-        logging.info('------------------------------')
+    def __loadJoints(self, fs, count):
         logging.info(' Load Joints')
         logging.info('------------------------------')
-        num_joints = fs.readInt()
         self.joints = []
-        for i in range(num_joints):
+        for i in range(count):
             j = Joint()
             j.load(fs)
             self.joints.append(j)
@@ -575,64 +896,112 @@ comment:
 comment(english):
 %s
 ''', self.name, self.name_e, self.comment, self.comment_e)
+        fs.flush()
 
-        logging.info('exporting vertices... %d', len(self.vertices))
-        fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
-        logging.info('finished exporting vertices.')
-
-        logging.info('exporting faces... %d', len(self.faces))
-        fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
-        logging.info('finished exporting faces.')
-
-        logging.info('exporting textures... %d', len(self.textures))
-        fs.writeInt(len(self.textures))
-        for i in self.textures:
-            i.save(fs)
-        logging.info('finished exporting textures.')
+        if 'vertices' in self.raw_sections:
+            self.__saveRawSection(fs, 'vertices')
+        else:
+            logging.info('exporting vertices... %d', len(self.vertices))
+            header = fs.header()
+            # the size of the largest (BDEF4/SDEF) records
+            fs.reserve(4 + len(self.vertices)*(VertexArrays.weightOffset(header) + 1 + 4*header.bone_index_size + 4*10 + 4))
+            if isinstance(self.vertices, VertexList):
+                self.vertices.save(fs)
+            else:
+                fs.writeInt(len(self.vertices))
+                for i in self.vertices:
+                    i.save(fs)
+            logging.info('finished exporting vertices.')
+            fs.flush()
+
+        if 'faces' in self.raw_sections:
+            self.__saveRawSection(fs, 'faces')
+        else:
+            logging.info('exporting faces... %d', len(self.faces))
+            fs.reserve(4 + len(self.faces)*3*fs.header().vertex_index_size)
+            FaceList.save(fs, self.faces)
+            logging.info('finished exporting faces.')
+            fs.flush()
+
+        if 'textures' in self.raw_sections:
+            self.__saveRawSection(fs, 'textures')
+        else:
+            logging.info('exporting textures... %d', len(self.textures))
+            fs.writeInt(len(self.textures))
+            for i in self.textures:
+                i.save(fs)
+            logging.info('finished exporting textures.')
+            fs.flush()
 
-        logging.info('exporting materials... %d', len(self.materials))
-        fs.writeInt(len(self.materials))
-        for i in self.materials:
-            i.save(fs)
-        logging.info('finished exporting materials.')
+        if 'materials' in self.raw_sections:
+            self.__saveRawSection(fs, 'materials')
+        else:
+            logging.info('exporting materials... %d', len(self.materials))
+            fs.writeInt(len(self.materials))
+            for i in self.materials:
+                i.save(fs)
+            logging.info('finished exporting materials.')
+            fs.flush()
 
-        logging.info('exporting bones... %d', len(self.bones))
-        fs.writeInt(len(self.bones))
-        for i in self.bones:
-            i.save(fs)
-        logging.info('finished exporting bones.')
+        if 'bones' in self.raw_sections:
+            self.__saveRawSection(fs, 'bones')
+        else:
+            logging.info('exporting bones... %d', len(self.bones))
+            fs.writeInt(len(self.bones))
+            for i in self.bones:
+                i.save(fs)
+            logging.info('finished exporting bones.')
+            fs.flush()
 
-        logging.info('exporting morphs... %d', len(self.morphs))
-        fs.writeInt(len(self.morphs))
-        for i in self.morphs:
-            i.save(fs)
-        logging.info('finished exporting morphs.')
+        if 'morphs' in self.raw_sections:
+            self.__saveRawSection(fs, 'morphs')
+        else:
+            logging.info('exporting morphs... %d', len(self.morphs))
+            header = fs.header()
+            fs.reserve(4 + sum(4*2 + 2 + 4 + len(m.offsets)*Morph.offsetSize(header, m.type_index()) for m in self.morphs))
+            fs.writeInt(len(self.morphs))
+            for i in self.morphs:
+                i.save(fs)
+            logging.info('finished exporting morphs.')
+            fs.flush()
 
-        logging.info('exporting display items... %d', len(self.display))
-        fs.writeInt(len(self.display))
-        for i in self.display:
-            i.save(fs)
-        logging.info('finished exporting display items.')
+        if 'display' in self.raw_sections:
+            self.__saveRawSection(fs, 'display')
+        else:
+            logging.info('exporting display items... %d', len(self.display))
+            fs.writeInt(len(self.display))
+            for i in self.display:
+                i.save(fs)
+            logging.info('finished exporting display items.')
+            fs.flush()
 
-        logging.info('exporting rigid bodies... %d', len(self.rigids))
-        fs.writeInt(len(self.rigids))
-        for i in self.rigids:
-            i.save(fs)
-        logging.info('finished exporting rigid bodies.')
+        if 'rigids' in self.raw_sections:
+            self.__saveRawSection(fs, 'rigids')
+        else:
+            logging.info('exporting rigid bodies... %d', len(self.rigids))
+            fs.writeInt(len(self.rigids))
+            for i in self.rigids:
+                i.save(fs)
+            logging.info('finished exporting rigid bodies.')
+            fs.flush()
+
+        if 'joints' in self.raw_sections:
+            self.__saveRawSection(fs, 'joints')
+        else:
+            logging.info('exporting joints... %d', len(self.joints))
+            fs.writeInt(len(self.joints))
+            for i in self.joints:
+                i.save(fs)
+            logging.info('finished exporting joints.')
+            fs.flush()
 
-        logging.info('exporting joints... %d', len(self.joints))
-        fs.writeInt(len(self.joints))
-        for i in self.joints:
-            i.save(fs)
-        logging.info('finished exporting joints.')
         logging.info('finished exporting the model.')
 
+    def __saveRawSection(self, fs, name):
+        data = self.raw_sections[name]
+        logging.info('exporting raw %s... %d bytes', name, len(data))
+        fs.writeBytes(data)
+        fs.flush()
 
     def __repr__(self):
         return '<Model name %s, name_e %s, comment %s, comment_e %s, textures %s>'%(
@@ -777,6 +1146,419 @@ class BoneWeight:
             raise ValueError('invalid weight type %s'%str(self.type))
 
 
+class VertexArrays:
+    """ Vertex attributes of a whole vertex block decoded into NumPy arrays.
+
+    Bone indices and weights are expanded to 4 columns for every weight type
+    (unused bones are -1 with weight 0), so BDEF2/SDEF rows hold (w, 1-w).
+    """
+    # (number of bone indices, number of floats) of each BoneWeight type
+    WEIGHT_LAYOUTS = {
+        BoneWeight.BDEF1: (1, 0),
+        BoneWeight.BDEF2: (2, 1),
+        BoneWeight.BDEF4: (4, 4),
+        BoneWeight.SDEF: (2, 10),
+        }
+
+    def __init__(self, count=0, additional_uvs=0):
+        self.co = np.zeros((count, 3), dtype=np.float32)
+        self.normal = np.zeros((count, 3), dtype=np.float32)
+        self.uv = np.zeros((count, 2), dtype=np.float32)
+        self.additional_uvs = np.zeros((count, additional_uvs, 4), dtype=np.float32)
+        self.weight_type = np.zeros(count, dtype=np.uint8)
+        self.bones = np.full((count, 4), -1, dtype=np.int32)
+        self.weights = np.zeros((count, 4), dtype=np.float32)
+        self.sdef_c = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r0 = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r1 = np.zeros((count, 3), dtype=np.float32)
+        self.edge_scale = np.ones(count, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.co)
+
+    def __repr__(self):
+        return '<VertexArrays count %d, additional_uvs %d>'%(len(self), self.additional_uvs.shape[1])
+
+    @classmethod
+    def __scan(cls, fs, count):
+        """ Find where each of the variable-length records starts.
+
+        @return the bytes of the vertex block and the offsets of the records
+        """
+        header = fs.header()
+        bone_size = header.bone_index_size
+        if bone_size not in _SIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(bone_size))
+        weight_offset = cls.weightOffset(header)
+        record_sizes = [weight_offset + 1 + bone_size*b + 4*f + 4 for t, (b, f) in sorted(cls.WEIGHT_LAYOUTS.items())]
+
+        start = fs.tell()
+        buf = fs.readBytes(count*max(record_sizes))
+        offsets = [0] * count
+        pos = 0
+        try:
+            for i in range(count):
+                offsets[i] = pos
+                pos += record_sizes[buf[pos+weight_offset]]
+        except IndexError:
+            if pos + weight_offset >= len(buf):
+                raise struct.error('unexpected end of vertex data')
+            raise ValueError('invalid weight type %s'%str(buf[pos+weight_offset]))
+        if pos > len(buf):
+            raise struct.error('unexpected end of vertex data')
+        fs.seek(start + pos)
+        return buf[:pos], offsets
+
+    @staticmethod
+    def weightOffset(header):
+        """ The offset of the weight type in a vertex record: co, normal, uv and additional_uvs.
+        """
+        return 4*(8 + 4*header.additional_uvs)
+
+    @classmethod
+    def skip(cls, fs, count):
+        cls.__scan(fs, count)
+
+    def load(self, fs, count):
+        header = fs.header()
+        bone_size = header.bone_index_size
+        weight_offset = self.weightOffset(header)
+        buf, offsets = self.__scan(fs, count)
+
+        raw = np.frombuffer(buf, dtype=np.uint8)
+        offsets = np.array(offsets, dtype=np.intp)
+        def _gather(offs, begin, nbytes, dtype, chunk_size=65536):
+            # gather in chunks to bound the size of the temporary index arrays
+            ret = np.empty((len(offs), nbytes), dtype=np.uint8)
+            columns = np.arange(begin, begin+nbytes)
+            for i in range(0, len(offs), chunk_size):
+                ret[i:i+chunk_size] = raw[offs[i:i+chunk_size, None] + columns]
+            return ret.view(dtype)
+
+        self.__init__(count, header.additional_uvs)
+        floats = _gather(offsets, 0, weight_offset, '<f4')
+        self.co[:] = floats[:, 0:3]
+        self.normal[:] = floats[:, 3:6]
+        self.uv[:] = floats[:, 6:8]
+        self.additional_uvs[:] = floats[:, 8:].reshape(count, header.additional_uvs, 4)
+        self.weight_type[:] = raw[offsets + weight_offset]
+
+        index_dtype = _SIGNED_INDEX_DTYPES[bone_size]
+        for weight_type, (bone_count, float_count) in self.WEIGHT_LAYOUTS.items():
+            mask = (self.weight_type == weight_type)
+            if not mask.any():
+                continue
+            offs = offsets[mask]
+            begin = weight_offset + 1
+            self.bones[mask, :bone_count] = _gather(offs, begin, bone_size*bone_count, index_dtype)
+            begin += bone_size*bone_count
+            values = _gather(offs, begin, 4*float_count, '<f4') if float_count else None
+            begin += 4*float_count
+            self.edge_scale[mask] = _gather(offs, begin, 4, '<f4')[:, 0]
+
+            if weight_type == BoneWeight.BDEF1:
+                self.weights[mask, 0] = 1.0
+            elif weight_type == BoneWeight.BDEF4:
+                self.weights[mask] = values
+            else: # BDEF2, SDEF
+                self.weights[mask, 0] = values[:, 0]
+                self.weights[mask, 1] = 1.0 - values[:, 0]
+                if weight_type == BoneWeight.SDEF:
+                    self.sdef_c[mask] = values[:, 1:4]
+                    self.sdef_r0[mask] = values[:, 4:7]
+                    self.sdef_r1[mask] = values[:, 7:10]
+
+    def save(self, fs):
+        """ Write the vertex records, identical to what Vertex.save() writes for each vertex.
+        """
+        header = fs.header()
+        bone_size = header.bone_index_size
+        if bone_size not in _SIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(bone_size))
+        count = len(self)
+        add_uv_count = self.additional_uvs.shape[1]
+        floats = np.zeros((count, 8 + 4*max(add_uv_count, header.additional_uvs)), dtype='<f4')
+        floats[:, 0:3] = self.co
+        floats[:, 3:6] = self.normal
+        floats[:, 6:8] = self.uv
+        floats[:, 8:8+4*add_uv_count] = self.additional_uvs.reshape(count, 4*add_uv_count)
+        weight_offset = 4*floats.shape[1]
+
+        record_sizes = np.zeros(max(self.WEIGHT_LAYOUTS)+1, dtype=np.intp)
+        for weight_type, (bone_count, float_count) in self.WEIGHT_LAYOUTS.items():
+            record_sizes[weight_type] = weight_offset + 1 + bone_size*bone_count + 4*float_count + 4
+        sizes = record_sizes[self.weight_type]
+        offsets = np.zeros(count, dtype=np.intp)
+        np.cumsum(sizes[:-1], out=offsets[1:])
+        raw = np.zeros(int(sizes.sum()), dtype=np.uint8)
+        def _scatter(offs, begin, values, chunk_size=65536):
+            # scatter in chunks to bound the size of the temporary index arrays
+            if len(offs) == 0:
+                return
+            values = np.ascontiguousarray(values).view(np.uint8).reshape(len(offs), -1)
+            columns = np.arange(begin, begin+values.shape[1])
+            for i in range(0, len(offs), chunk_size):
+                raw[offs[i:i+chunk_size, None] + columns] = values[i:i+chunk_size]
+
+        _scatter(offsets, 0, floats)
+        raw[offsets + weight_offset] = self.weight_type
+        bone_limit = 1 << (8*bone_size - 1)
+        for weight_type, (bone_count, float_count) in self.WEIGHT_LAYOUTS.items():
+            mask = (self.weight_type == weight_type)
+            if not mask.any():
+                continue
+            offs = offsets[mask]
+            bones = self.bones[mask, :bone_count]
+            if bones.min() < -bone_limit or bones.max() >= bone_limit:
+                raise struct.error('bone index out of range')
+            begin = weight_offset + 1
+            _scatter(offs, begin, bones.astype(_SIGNED_INDEX_DTYPES[bone_size]))
+            begin += bone_size*bone_count
+            if weight_type == BoneWeight.BDEF4:
+                _scatter(offs, begin, self.weights[mask].astype('<f4'))
+            elif weight_type == BoneWeight.SDEF:
+                _scatter(offs, begin, np.column_stack((self.weights[mask, 0], self.sdef_c[mask], self.sdef_r0[mask], self.sdef_r1[mask])).astype('<f4'))
+            elif weight_type == BoneWeight.BDEF2:
+                _scatter(offs, begin, self.weights[mask, 0].astype('<f4'))
+            begin += 4*float_count
+            _scatter(offs, begin, self.edge_scale[mask].astype('<f4'))
+
+        fs.writeInt(count)
+        fs.writeBytes(raw)
+
+    @classmethod
+    def fromVertices(cls, vertices, additional_uvs=None):
+        """ Pack Vertex objects into arrays, the inverse of vertices().
+
+        @param additional_uvs the number of additional uvs, None for the most of the vertices
+        """
+        if additional_uvs is None:
+            additional_uvs = max((len(v.additional_uvs) for v in vertices), default=0)
+        ret = cls(len(vertices), additional_uvs)
+        co, normal, uv, add_uvs, edge_scale = [], [], [], [], []
+        for i, v in enumerate(vertices):
+            co.append(v.co)
+            normal.append(v.normal)
+            uv.append(v.uv)
+            edge_scale.append(v.edge_scale)
+            for j, add_uv in enumerate(v.additional_uvs[:additional_uvs]):
+                ret.additional_uvs[i, j] = add_uv
+            weight = v.weight
+            bones = weight.bones
+            ret.weight_type[i] = weight.type
+            ret.bones[i, :len(bones)] = bones
+            if weight.type == BoneWeight.BDEF1:
+                ret.weights[i, 0] = 1.0
+            elif weight.type == BoneWeight.BDEF4:
+                ret.weights[i] = weight.weights
+            elif weight.type == BoneWeight.SDEF:
+                w = weight.weights
+                ret.weights[i, :2] = (w.weight, 1.0 - w.weight)
+                ret.sdef_c[i], ret.sdef_r0[i], ret.sdef_r1[i] = w.c, w.r0, w.r1
+            else:
+                ret.weights[i, :2] = (weight.weights[0], 1.0 - weight.weights[0])
+        if len(vertices):
+            ret.co[:], ret.normal[:], ret.uv[:], ret.edge_scale[:] = co, normal, uv, edge_scale
+        return ret
+
+    def vertex(self, index):
+        """ Create a Vertex object of the given index.
+        """
+        return self.vertices(index, index+1)[0]
+
+    def vertices(self, start=0, stop=None):
+        """ Create Vertex objects of the given range, identical to what Vertex.load() returns.
+        """
+        s = slice(start, stop)
+        weight_types = self.weight_type[s].tolist()
+        bones = self.bones[s].tolist()
+        weights = self.weights[s].tolist()
+        sdef = zip(self.sdef_c[s].tolist(), self.sdef_r0[s].tolist(), self.sdef_r1[s].tolist())
+        additional_uvs = self.additional_uvs[s].tolist()
+        ret = []
+        for co, normal, uv, add_uvs, weight_type, b, w, (c, r0, r1), edge_scale in zip(
+                self.co[s].tolist(), self.normal[s].tolist(), self.uv[s].tolist(), additional_uvs,
+                weight_types, bones, weights, sdef, self.edge_scale[s].tolist()):
+            v = Vertex()
+            v.co = tuple(co)
+            v.normal = tuple(normal)
+            v.uv = tuple(uv)
+            v.additional_uvs = [tuple(i) for i in add_uvs]
+            v.weight = BoneWeight()
+            v.weight.type = weight_type
+            if weight_type == BoneWeight.BDEF1:
+                v.weight.bones = b[:1]
+            elif weight_type == BoneWeight.BDEF2:
+                v.weight.bones = b[:2]
+                v.weight.weights = w[:1]
+            elif weight_type == BoneWeight.BDEF4:
+                v.weight.bones = b
+                v.weight.weights = tuple(w)
+            else:
+                v.weight.bones = b[:2]
+                v.weight.weights = BoneWeightSDEF(w[0], tuple(c), tuple(r0), tuple(r1))
+            v.edge_scale = edge_scale
+            ret.append(v)
+        return ret
+
+class VertexList(collections.abc.MutableSequence):
+    """ A list of Vertex objects backed by VertexArrays.
+
+    Vertex objects are created on first access. The arrays are kept available
+    as long as the list itself is not modified, while modifying a Vertex
+    object (e.g. by the importer) does not affect the arrays.
+    """
+    def __init__(self, arrays):
+        self.__arrays = arrays
+        self.__items = [None] * len(arrays)
+
+    @property
+    def arrays(self):
+        """ The VertexArrays of this list, or None if the list was modified.
+        """
+        return self.__arrays
+
+    def __materialize(self, start=0, stop=None):
+        items = self.__items
+        start, stop, _ = slice(start, stop).indices(len(items))
+        if self.__arrays is not None and None in items[start:stop]:
+            for i, v in enumerate(self.__arrays.vertices(start, stop), start):
+                if items[i] is None:
+                    items[i] = v
+        return items
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __iter__(self):
+        return iter(self.__materialize())
+
+    def __getitem__(self, index):
+        items = self.__items
+        if isinstance(index, slice):
+            return self.__materialize()[index]
+        v = items[index]
+        if v is None:
+            v = items[index] = self.__arrays.vertex(index % len(items))
+        return v
+
+    def __setitem__(self, index, value):
+        self.__materialize()[index] = value
+        self.__arrays = None
+
+    def __delitem__(self, index):
+        del self.__materialize()[index]
+        self.__arrays = None
+
+    def insert(self, index, value):
+        self.__materialize().insert(index, value)
+        self.__arrays = None
+
+    def save(self, fs):
+        """ Write the number of vertices and the vertices.
+
+        The arrays are used if no Vertex object was created, since those could have been modified.
+        """
+        if self.__arrays is not None and self.__items.count(None) == len(self.__items):
+            self.__arrays.save(fs)
+            return
+        fs.writeInt(len(self))
+        for i in self:
+            i.save(fs)
+
+    def __repr__(self):
+        return '<VertexList count %d>'%len(self)
+
+
+class FaceList(collections.abc.MutableSequence):
+    """ A list of faces backed by an (N, 3) uint32 array.
+
+    Faces are returned as (f3, f2, f1) tuples like the faces of a fully
+    decoded model. The array is dropped as soon as the list itself is modified.
+    """
+    def __init__(self, array):
+        self.__array = array
+        self.__items = None
+
+    @classmethod
+    def load(cls, fs, count):
+        """ Read a face block of count vertex indices, swapping (f1, f2, f3) to (f3, f2, f1).
+        """
+        index_size = fs.header().vertex_index_size
+        if index_size not in _UNSIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(index_size))
+        face_count = int(count/3)
+        data = fs.readBytes(face_count*3*index_size)
+        if len(data) != face_count*3*index_size:
+            raise struct.error('unexpected end of face data')
+        indices = np.frombuffer(data, dtype=_UNSIGNED_INDEX_DTYPES[index_size]).reshape(face_count, 3)
+        return cls(indices[:, ::-1].astype(np.uint32))
+
+    @staticmethod
+    def save(fs, faces):
+        """ Write the number of indices and the indices of faces, a FaceList or a list of (f3, f2, f1).
+        """
+        index_size = fs.header().vertex_index_size
+        if index_size not in _UNSIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(index_size))
+        array = faces.array if isinstance(faces, FaceList) else None
+        if array is None:
+            array = np.array(faces, dtype=np.int64).reshape(-1, 3)
+        if len(array) and (array.min() < 0 or array.max() >= 1 << 8*index_size):
+            raise struct.error('vertex index out of range')
+        fs.writeInt(len(array)*3)
+        fs.writeBytes(array[:, ::-1].astype(_UNSIGNED_INDEX_DTYPES[index_size]).tobytes())
+
+    @property
+    def array(self):
+        """ The (N, 3) uint32 array of this list, or None if the list was modified.
+        """
+        return self.__array
+
+    def __materialize(self):
+        if self.__items is None:
+            self.__items = [tuple(f) for f in self.__array.tolist()]
+            self.__array = None
+        return self.__items
+
+    def __len__(self):
+        if self.__items is None:
+            return len(self.__array)
+        return len(self.__items)
+
+    def __iter__(self):
+        i = 0
+        if self.__items is None:
+            for i, f in enumerate(self.__array.tolist()):
+                if self.__items is not None: # modified while iterating
+                    break
+                yield tuple(f)
+            else:
+                return
+        while i < len(self.__items):
+            yield self.__items[i]
+            i += 1
+
+    def __getitem__(self, index):
+        if self.__items is None:
+            if isinstance(index, slice):
+                return [tuple(f) for f in self.__array[index].tolist()]
+            return tuple(self.__array[index].tolist())
+        return self.__items[index]
+
+    def __setitem__(self, index, value):
+        self.__materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self.__materialize()[index]
+
+    def insert(self, index, value):
+        self.__materialize().insert(index, value)
+
+    def __repr__(self):
+        return '<FaceList count %d>'%len(self)
+
+
 class Texture:
     def __init__(self):
         self.path = ''
@@ -790,6 +1572,10 @@ class Texture:
         if not os.path.isabs(self.path):
             self.path = os.path.normpath(os.path.join(os.path.dirname(fs.path()), self.path))
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+
     def save(self, fs):
         try:
             relPath = os.path.relpath(self.path, os.path.dirname(fs.path()))
@@ -893,6 +1679,17 @@ class Material:
         self.comment = fs.readStr()
         self.vertex_count = fs.readInt()
 
+    @staticmethod
+    def skip(fs):
+        texture_index_size = fs.header().texture_index_size
+        fs.skipStr()
+        fs.skipStr()
+        # diffuse, specular, shininess, ambient, flags, edge_color, edge_size, texture, sphere_texture, sphere_texture_mode
+        fs.skip(4*4 + 4*3 + 4 + 4*3 + 1 + 4*4 + 4 + 2*texture_index_size + 1)
+        fs.skip(1 if fs.readSignedByte() == 1 else texture_index_size)
+        fs.skipStr()
+        fs.skip(4)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1045,6 +1842,29 @@ class Bone:
                 link.load(fs)
                 self.ik_links.append(link)
 
+    @staticmethod
+    def skip(fs):
+        bone_index_size = fs.header().bone_index_size
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(4*3 + bone_index_size + 4)
+        flags = fs.readShort()
+        fs.skip(bone_index_size if flags & 0x0001 else 4*3)
+        if flags & 0x0300:
+            fs.skip(bone_index_size + 4)
+        if flags & 0x0400:
+            fs.skip(4*3)
+        if flags & 0x0800:
+            fs.skip(4*6)
+        if flags & 0x2000:
+            fs.skip(4)
+        if flags & 0x0020:
+            fs.skip(bone_index_size + 4 + 4)
+            for i in range(fs.readInt()):
+                fs.skip(bone_index_size)
+                if fs.readByte() == 1:
+                    fs.skip(4*6)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1148,7 +1968,11 @@ class Morph:
         raise NotImplementedError
 
     @staticmethod
-    def create(fs):
+    def create(fs, columnar=False):
+        """ Read a morph.
+
+        @param columnar load the offsets of vertex and UV morphs as a MorphOffsetList
+        """
         _CLASSES = {
             0: GroupMorph,
             1: VertexMorph,
@@ -1167,9 +1991,36 @@ class Morph:
         category = fs.readSignedByte()
         typeIndex = fs.readSignedByte()
         ret = _CLASSES[typeIndex](name, name_e, category, type_index = typeIndex)
-        ret.load(fs)
+        if columnar and isinstance(ret, (VertexMorph, UVMorph)):
+            ret.loadArrays(fs)
+        else:
+            ret.load(fs)
         return ret
 
+    @staticmethod
+    def offsetSize(header, typeIndex):
+        """ The size in bytes of an offset of the morphs of the given type.
+        """
+        if typeIndex == 0:
+            return header.morph_index_size + 4
+        elif typeIndex == 1:
+            return header.vertex_index_size + 4*3
+        elif typeIndex == 2:
+            return header.bone_index_size + 4*7
+        elif 3 <= typeIndex <= 7:
+            return header.vertex_index_size + 4*4
+        elif typeIndex == 8:
+            return header.material_index_size + 1 + 4*28
+        raise ValueError('invalid morph type %s'%str(typeIndex))
+
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(1)
+        offset_size = Morph.offsetSize(fs.header(), fs.readSignedByte())
+        fs.skip(fs.readInt()*offset_size)
+
     def load(self, fs):
         """ Implement for loading morph data.
         """
@@ -1180,6 +2031,9 @@ class Morph:
         fs.writeStr(self.name_e)
         fs.writeSignedByte(self.category)
         fs.writeSignedByte(self.type_index())
+        if isinstance(self.offsets, MorphOffsetList):
+            self.offsets.save(fs)
+            return
         fs.writeInt(len(self.offsets))
         for i in self.offsets:
             i.save(fs)
@@ -1198,6 +2052,9 @@ class VertexMorph(Morph):
             t.load(fs)
             self.offsets.append(t)
 
+    def loadArrays(self, fs):
+        self.offsets = MorphOffsetList.load(fs, VertexMorphOffset, 3)
+
 class VertexMorphOffset:
     def __init__(self):
         self.index = 0
@@ -1227,6 +2084,9 @@ class UVMorph(Morph):
             t.load(fs)
             self.offsets.append(t)
 
+    def loadArrays(self, fs):
+        self.offsets = MorphOffsetList.load(fs, UVMorphOffset, 4)
+
 class UVMorphOffset:
     def __init__(self):
         self.index = 0
@@ -1360,6 +2220,131 @@ class GroupMorphOffset:
         fs.writeFloat(self.factor)
 
 
+class MorphOffsetList(collections.abc.MutableSequence):
+    """ A list of VertexMorphOffset or UVMorphOffset objects backed by arrays.
+
+    The offset objects are created on first access. The arrays are kept
+    available as long as the list itself is not modified.
+    """
+    def __init__(self, offset_class, index, offset):
+        self.__offset_class = offset_class
+        self.__arrays = (index, offset)
+        self.__items = None
+
+    @classmethod
+    def load(cls, fs, offset_class, width):
+        """ Read the offsets of a morph, each of them is a vertex index and a vector of the given width.
+        """
+        index_size = fs.header().vertex_index_size
+        if index_size not in _UNSIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(index_size))
+        dtype = np.dtype([('index', _UNSIGNED_INDEX_DTYPES[index_size]), ('offset', '<f4', (width,))])
+        count = fs.readInt()
+        data = fs.readBytes(count*dtype.itemsize)
+        if len(data) != count*dtype.itemsize:
+            raise struct.error('unexpected end of morph data')
+        records = np.frombuffer(data, dtype=dtype)
+        return cls(offset_class, records['index'].astype(np.uint32), records['offset'].astype(np.float32))
+
+    @property
+    def arrays(self):
+        """ The (index, offset) arrays of this list, or None if the list was modified.
+        """
+        return self.__arrays
+
+    def __materialize(self):
+        if self.__items is None:
+            index, offset = self.__arrays
+            self.__items = []
+            for i, o in zip(index.tolist(), offset.tolist()):
+                x = self.__offset_class()
+                x.index = i
+                x.offset = tuple(o)
+                self.__items.append(x)
+        return self.__items
+
+    def __len__(self):
+        if self.__items is None:
+            return len(self.__arrays[0])
+        return len(self.__items)
+
+    def __getitem__(self, index):
+        return self.__materialize()[index]
+
+    def __setitem__(self, index, value):
+        self.__materialize()[index] = value
+        self.__arrays = None
+
+    def __delitem__(self, index):
+        del self.__materialize()[index]
+        self.__arrays = None
+
+    def insert(self, index, value):
+        self.__materialize().insert(index, value)
+        self.__arrays = None
+
+    def save(self, fs):
+        """ Write the number of offsets and the offsets.
+
+        The arrays are used if no offset object was created, since those could have been modified.
+        """
+        if self.__items is not None:
+            fs.writeInt(len(self))
+            for i in self.__items:
+                i.save(fs)
+            return
+        index_size = fs.header().vertex_index_size
+        if index_size not in _UNSIGNED_INDEX_DTYPES:
+            raise ValueError('invalid data size %s'%str(index_size))
+        index, offset = self.__arrays
+        if len(index) and index.max() >= 1 << 8*index_size:
+            raise struct.error('vertex index out of range')
+        records = np.empty(len(index), dtype=[('index', _UNSIGNED_INDEX_DTYPES[index_size]), ('offset', '<f4', offset.shape[1:])])
+        records['index'] = index
+        records['offset'] = offset
+        fs.writeInt(len(records))
+        fs.writeBytes(records.view(np.uint8))
+
+    def __repr__(self):
+        return '<MorphOffsetList count %d>'%len(self)
+
+class MorphOffsetArrays:
+    """ The offsets of all morphs of a type stored as CSR arrays.
+
+    The offsets of morphs[n] are index[indptr[n]:indptr[n+1]] and
+    offset[indptr[n]:indptr[n+1]]. The offsets lists of those morphs share
+    the memory of these arrays.
+    """
+    def __init__(self, morphs, indptr, index, offset):
+        self.morphs = morphs
+        self.indptr = indptr
+        self.index = index
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.morphs)
+
+    def __repr__(self):
+        return '<MorphOffsetArrays morphs %d, offsets %d>'%(len(self.morphs), len(self.index))
+
+    @classmethod
+    def join(cls, morphs, morph_class, offset_class, width):
+        """ Join the offsets of the morph_class morphs loaded as MorphOffsetList.
+
+        @param morphs the morphs of a model
+        @return the MorphOffsetArrays, where morphs are the indices of the joined morphs
+        """
+        targets = [n for n, m in enumerate(morphs) if isinstance(m, morph_class) and isinstance(m.offsets, MorphOffsetList) and m.offsets.arrays is not None]
+        arrays = [morphs[n].offsets.arrays for n in targets]
+        indptr = np.zeros(len(targets)+1, dtype=np.int64)
+        np.cumsum([len(i) for i, o in arrays], out=indptr[1:])
+        index = np.concatenate([i for i, o in arrays] or [np.zeros(0, dtype=np.uint32)])
+        offset = np.concatenate([o for i, o in arrays] or [np.zeros((0, width), dtype=np.float32)])
+        for n, begin, end in zip(targets, indptr[:-1].tolist(), indptr[1:].tolist()):
+            morphs[n].offsets = MorphOffsetList(offset_class, index[begin:end], offset[begin:end])
+        return cls(np.array(targets, dtype=np.int32), indptr, index, offset)
+
+
 class Display:
     def __init__(self):
         self.name = ''
@@ -1394,6 +2379,21 @@ class Display:
             self.data.append((disp_type, index))
         logging.debug('the number of display elements: %d', len(self.data))
 
+    @staticmethod
+    def skip(fs):
+        header = fs.header()
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(1)
+        for i in range(fs.readInt()):
+            disp_type = fs.readByte()
+            if disp_type == 0:
+                fs.skip(header.bone_index_size)
+            elif disp_type == 1:
+                fs.skip(header.morph_index_size)
+            else:
+                raise Exception('invalid value.')
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1473,6 +2473,14 @@ class Rigid:
 
         self.mode = fs.readSignedByte()
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+        fs.skipStr()
+        # bone, collision_group_number, collision_group_mask, type, size, location, rotation,
+        # mass, velocity_attenuation, rotation_attenuation, bounce, friction, mode
+        fs.skip(fs.header().bone_index_size + 1 + 2 + 1 + 4*9 + 4*5 + 1)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1558,6 +2566,13 @@ class Joint:
         self.spring_constant = fs.readVector(3)
         self.spring_rotation_constant = fs.readVector(3)
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+        fs.skipStr()
+        # mode, src_rigid, dest_rigid, location, rotation, limits, springs
+        fs.skip(1 + 2*fs.header().rigid_index_size + 4*3*8)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1586,8 +2601,16 @@ class Joint:
 
 
 
-def load(path):
-    with FileReadStream(path) as fs:
+def load(path, use_mmap=False, sections=None, columnar=False):
+    """ Load a pmx file.
+
+    @param use_mmap read the file through a memory map instead of a buffered file stream
+    @param sections the names of the sections (see Model.SECTIONS) to decode, None for all.
+        The other sections are kept as raw bytes, so the model can still be saved.
+    @param columnar load faces and vertex/UV morph offsets into NumPy arrays, see Model.load()
+    """
+    stream_class = MappedFileReadStream if use_mmap else FileReadStream
+    with stream_class(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmx module')
         logging.info('----------------------------------------')
@@ -1599,7 +2622,7 @@ def load(path):
         fs.setHeader(header)
         model = Model()
         try:
-            model.load(fs)
+            model.load(fs, sections, columnar)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
@@ -1610,9 +2633,23 @@ def load(path):
         return model
 
 def save(path, model, add_uv_count=0):
-    with FileWriteStream(path) as fs:
-        header = Header(model)
-        header.additional_uvs = max(0, min(4, add_uv_count)) # UV1~UV4
+    with BufferedFileWriteStream(path) as fs:
+        if model.raw_sections:
+            # the raw sections are encoded with the index sizes of the loaded file
+            header = copy.copy(model.header)
+            if 'vertices' not in model.raw_sections:
+                header.additional_uvs = max(0, min(4, add_uv_count)) # UV1~UV4
+        else:
+            header = Header(model)
+            header.additional_uvs = max(0, min(4, add_uv_count)) # UV1~UV4
         header.save(fs)
         fs.setHeader(header)
         model.save(fs)
+
+def load_many(paths, workers=None, use_mmap=False, sections=None, columnar=True):
+    """ Load pmx files in worker processes, see batch.load_many().
+
+    The models are columnar by default, so they are compact to send back from the workers.
+    @return a list of batch.LoadResult in the order of paths
+    """
+    return batch.load_many(load, paths, workers, use_mmap=use_mmap, sections=sections, columnar=columnar)
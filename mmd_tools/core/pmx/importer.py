@@ -4,10 +4,12 @@ import logging
 import os
 import time
 
+import bmesh
 import bpy
+import numpy as np
 from mathutils import Matrix, Vector
 from mmd_tools import bpyutils, utils
-from mmd_tools.core import pmx
+from mmd_tools.core import cache, pmx
 from mmd_tools.core.bone import FnBone
 from mmd_tools.core.material import FnMaterial
 from mmd_tools.core.model import FnModel, Model
@@ -17,6 +19,57 @@ from mmd_tools.operators.display_item import DisplayItemQuickSetup
 from mmd_tools.operators.misc import MoveObject
 
 
+# the weights shared by at least this many vertices of a vertex group are added
+# by one VertexGroup.add() call, the others are written through a bmesh deform layer
+_BULK_WEIGHT_MIN_VERTICES = 8
+
+def _assignVertexGroupWeights(obj, groups, vertices, weights):
+    """ Assign weights to the vertex groups of a mesh object which has no weights yet.
+
+    @param groups the vertex group index of each weight
+    @param vertices the vertex index of each weight, unique for each group
+    @param weights the weights
+    """
+    if len(groups) < 1:
+        return
+    weights = np.asarray(weights, dtype=np.float32)
+    order = np.lexsort((vertices, weights, groups))
+    groups, vertices, weights = groups[order], vertices[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (weights[1:] != weights[:-1])])
+    counts = np.diff(np.r_[starts, len(groups)])
+
+    bulk = counts >= _BULK_WEIGHT_MIN_VERTICES
+    vertex_groups = obj.vertex_groups
+    for start, count in zip(starts[bulk].tolist(), counts[bulk].tolist()):
+        vertex_groups[int(groups[start])].add(index=vertices[start:start+count].tolist(), weight=float(weights[start]), type='REPLACE')
+
+    rest = np.repeat(~bulk, counts)
+    if rest.any():
+        bm = bmesh.new()
+        bm.from_mesh(obj.data)
+        deform_layer = bm.verts.layers.deform.verify()
+        bm.verts.ensure_lookup_table()
+        bm_verts = bm.verts
+        for g, v, w in zip(groups[rest].tolist(), vertices[rest].tolist(), weights[rest].tolist()):
+            bm_verts[v][deform_layer][g] = w
+        bm.to_mesh(obj.data)
+        bm.free()
+    logging.info('Assigned %d vertex weights (%d by %d VertexGroup.add() calls)', len(groups), len(groups) - rest.sum(), bulk.sum())
+
+def _morphOffsetArrays(offsets, width):
+    """ The (index, offset) arrays of the offsets of a vertex or UV morph.
+
+    @param offsets a MorphOffsetList or a list of offset objects
+    @param width the number of components of an offset
+    """
+    arrays = getattr(offsets, 'arrays', None)
+    if arrays is not None:
+        return arrays
+    index = np.fromiter((x.index for x in offsets), dtype=np.intp, count=len(offsets))
+    offset = np.array([x.offset for x in offsets], dtype=np.float32).reshape(-1, width)
+    return index, offset
+
+
 class PMXImporter:
     CATEGORIES = {
         0: 'SYSTEM',
@@ -35,6 +88,14 @@ class PMXImporter:
         7: 'uv_morphs',
         8: 'material_morphs',
         }
+    # the pmx sections required by each import type
+    TYPE_SECTIONS = {
+        'MESH': ('vertices', 'faces', 'textures', 'materials', 'bones'),
+        'ARMATURE': ('bones',),
+        'PHYSICS': ('rigids', 'joints'),
+        'MORPHS': ('morphs',),
+        'DISPLAY': ('display', 'morphs'),
+        }
 
     def __init__(self):
         self.__model = None
@@ -54,7 +115,8 @@ class PMXImporter:
         self.__materialTable = []
         self.__imageTable = {}
 
-        self.__sdefVertices = {} # pmx vertices
+        self.__vertex_arrays = None
+        self.__sdefVertices = None # the (indices, c, r0, r1) arrays of SDEF vertices
         self.__blender_ik_links = set()
         self.__vertex_map = None
 
@@ -103,75 +165,94 @@ class PMXImporter:
         self.__targetScene.active_object = self.__meshObj
         bpy.ops.object.shape_key_add()
 
+    def __basisCoordinates(self):
+        """ The (N, 3) float32 array of the vertex coordinates of the basis shape key.
+        """
+        reference_key = self.__meshObj.data.shape_keys.reference_key
+        co = np.empty(len(reference_key.data)*3, dtype=np.float32)
+        reference_key.data.foreach_get('co', co)
+        return co.reshape(-1, 3)
+
     def __importVertexGroup(self):
         vgroups = self.__meshObj.vertex_groups
         self.__vertexGroupTable = [vgroups.new(name=i.name) for i in self.__model.bones] or [vgroups.new(name='NO BONES')]
 
+    def __vertexArrays(self):
+        """ The VertexArrays of all pmx vertices.
+        """
+        if self.__vertex_arrays is None:
+            pmx_vertices = self.__model.vertices
+            arrays = getattr(pmx_vertices, 'arrays', None)
+            if arrays is None: # the vertices were created or cleaned
+                header = self.__model.header
+                arrays = pmx.VertexArrays.fromVertices(pmx_vertices, header.additional_uvs if header else None)
+            self.__vertex_arrays = arrays
+        return self.__vertex_arrays
+
     def __importVertices(self):
         self.__importVertexGroup()
 
-        pmxModel = self.__model
-        pmx_vertices = pmxModel.vertices
-        vertex_count = len(pmx_vertices)
+        arrays = self.__vertexArrays()
         vertex_map = self.__vertex_map
         if vertex_map:
-            indices = collections.OrderedDict(vertex_map).keys()
-            pmx_vertices = tuple(pmxModel.vertices[x] for x in indices)
-            vertex_count = len(indices)
+            indices = np.fromiter(collections.OrderedDict(vertex_map).keys(), dtype=np.intp)
+            _take = lambda a: a[indices]
+        else:
+            _take = lambda a: a
+        weight_type = _take(arrays.weight_type)
+        vertex_count = len(weight_type)
         if vertex_count < 1:
             return
 
         mesh = self.__meshObj.data
         mesh.vertices.add(count=vertex_count)
-        mesh.vertices.foreach_set('co', tuple(i for pv in pmx_vertices for i in (Vector(pv.co).xzy * self.__scale)))
+        mesh.vertices.foreach_set('co', (_take(arrays.co)[:, (0, 2, 1)] * self.__scale).astype(np.float32).ravel())
+
+        bones, weights = _take(arrays.bones).copy(), _take(arrays.weights).copy()
+        sdef = np.flatnonzero(weight_type == pmx.BoneWeight.SDEF)
+        sdef_c, sdef_r0, sdef_r1 = _take(arrays.sdef_c)[sdef], _take(arrays.sdef_r0)[sdef], _take(arrays.sdef_r1)[sdef]
+        swap = bones[sdef, 0] > bones[sdef, 1]
+        bones[sdef[swap], :2] = bones[sdef[swap], 1::-1]
+        weights[sdef[swap], :2] = weights[sdef[swap], 1::-1]
+        sdef_r0[swap], sdef_r1[swap] = sdef_r1[swap], sdef_r0[swap].copy()
+        self.__sdefVertices = (sdef, sdef_c, sdef_r0, sdef_r1)
+
+        # the weights of (vertex, bone) pairs, the weights of a bone used twice by a vertex are added
+        vertex_group_indices = np.array([g.index for g in self.__vertexGroupTable], dtype=np.intp)
+        used = bones >= 0
+        if used.any() and bones[used].max() >= len(vertex_group_indices):
+            raise IndexError('bone index %d out of range'%bones[used].max())
+        keys = np.flatnonzero(used)//4*len(vertex_group_indices) + bones[used]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        pair_weights = np.minimum(np.bincount(inverse, np.clip(weights[used], 0.0, 1.0), minlength=len(keys)), 1.0)
+        pair_vertices, pair_bones = np.divmod(keys, len(vertex_group_indices))
 
-        vertex_group_table = self.__vertexGroupTable
         vg_edge_scale = self.__meshObj.vertex_groups.new(name='mmd_edge_scale')
         vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
-        for i, pv in enumerate(pmx_vertices):
-            pv_bones, pv_weights, idx = pv.weight.bones, pv.weight.weights, (i,)
-
-            vg_edge_scale.add(index=idx, weight=pv.edge_scale, type='REPLACE')
-            vg_vertex_order.add(index=idx, weight=i/vertex_count, type='REPLACE')
-
-            if isinstance(pv_weights, pmx.BoneWeightSDEF):
-                if pv_bones[0] > pv_bones[1]:
-                    pv_bones.reverse()
-                    pv_weights.weight = 1.0 - pv_weights.weight
-                    pv_weights.r0, pv_weights.r1 = pv_weights.r1, pv_weights.r0
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights.weight, type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights.weight, type='ADD')
-                self.__sdefVertices[i] = pv
-            elif len(pv_bones) == 1:
-                bone_index = pv_bones[0]
-                if bone_index >= 0:
-                    vertex_group_table[bone_index].add(index=idx, weight=1.0, type='ADD')
-            elif len(pv_bones) == 2:
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights[0], type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights[0], type='ADD')
-            elif len(pv_bones) == 4:
-                for bone, weight in zip(pv_bones, pv_weights):
-                    vertex_group_table[bone].add(index=idx, weight=weight, type='ADD')
-            else:
-                raise Exception('unkown bone weight type.')
+        vertex_indices = np.arange(vertex_count)
+        _assignVertexGroupWeights(self.__meshObj,
+            np.concatenate((vertex_group_indices[pair_bones], np.full(vertex_count, vg_edge_scale.index), np.full(vertex_count, vg_vertex_order.index))),
+            np.concatenate((pair_vertices, vertex_indices, vertex_indices)),
+            np.concatenate((pair_weights, np.clip(_take(arrays.edge_scale), 0.0, 1.0), vertex_indices/vertex_count)))
 
         vg_edge_scale.lock_weight = True
         vg_vertex_order.lock_weight = True
 
     def __storeVerticesSDEF(self):
-        if len(self.__sdefVertices) < 1:
+        if self.__sdefVertices is None or len(self.__sdefVertices[0]) < 1:
             return
 
         self.__createBasisShapeKey()
         sdefC = self.__meshObj.shape_key_add(name='mmd_sdef_c')
         sdefR0 = self.__meshObj.shape_key_add(name='mmd_sdef_r0')
         sdefR1 = self.__meshObj.shape_key_add(name='mmd_sdef_r1')
-        for i, pv in self.__sdefVertices.items():
-            w = pv.weight.weights
-            sdefC.data[i].co = Vector(w.c).xzy * self.__scale
-            sdefR0.data[i].co = Vector(w.r0).xzy * self.__scale
-            sdefR1.data[i].co = Vector(w.r1).xzy * self.__scale
-        logging.info('Stored %d SDEF vertices', len(self.__sdefVertices))
+        indices, c, r0, r1 = self.__sdefVertices
+        basis_co = self.__basisCoordinates()
+        for shapeKey, values in ((sdefC, c), (sdefR0, r0), (sdefR1, r1)):
+            co = basis_co.copy()
+            co[indices] = values[:, (0, 2, 1)] * self.__scale
+            shapeKey.data.foreach_set('co', co.ravel())
+        logging.info('Stored %d SDEF vertices', len(indices))
 
     def __importTextures(self):
         pmxModel = self.__model
@@ -579,51 +660,63 @@ class PMXImporter:
         pmxModel = self.__model
         mesh = self.__meshObj.data
         vertex_map = self.__vertex_map
+        arrays = self.__vertexArrays()
 
-        loop_indices_orig = tuple(i for f in pmxModel.faces for i in f)
-        loop_indices = tuple(vertex_map[i][1] for i in loop_indices_orig) if vertex_map else loop_indices_orig
-        material_indices = tuple(i for i, c in enumerate(self.__materialFaceCountTable) for x in range(c))
+        faces = getattr(pmxModel.faces, 'array', None)
+        if faces is None:
+            faces = np.array(pmxModel.faces, dtype=np.intp).reshape(-1, 3)
+        face_count = len(faces)
+        loop_indices_orig = faces.ravel().astype(np.intp)
+        if vertex_map:
+            loop_indices = np.fromiter((i[1] for i in vertex_map), dtype=np.int32, count=len(vertex_map))[loop_indices_orig]
+        else:
+            loop_indices = loop_indices_orig.astype(np.int32)
+        material_indices = np.repeat(np.arange(len(self.__materialFaceCountTable), dtype=np.int32), self.__materialFaceCountTable)
 
-        mesh.loops.add(len(pmxModel.faces)*3)
+        mesh.loops.add(face_count*3)
         mesh.loops.foreach_set('vertex_index', loop_indices)
 
-        mesh.polygons.add(len(pmxModel.faces))
-        mesh.polygons.foreach_set('loop_start', tuple(range(0, len(mesh.loops), 3)))
-        mesh.polygons.foreach_set('loop_total', (3,)*len(pmxModel.faces))
-        mesh.polygons.foreach_set('use_smooth', (True,)*len(pmxModel.faces))
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set('loop_start', np.arange(0, face_count*3, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('loop_total', np.full(face_count, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('use_smooth', np.ones(face_count, dtype=bool))
         mesh.polygons.foreach_set('material_index', material_indices)
 
+        def _loop_uvs(uvs):
+            # the (u, 1-v) of each loop, flattened
+            loop_uvs = uvs[loop_indices_orig].astype(np.float32)
+            loop_uvs[:, 1] = 1.0 - loop_uvs[:, 1]
+            return loop_uvs.ravel()
+
         uv_textures, uv_layers = getattr(mesh, 'uv_textures', mesh.uv_layers), mesh.uv_layers
         uv_tex = uv_textures.new()
         uv_layer = uv_layers[uv_tex.name]
-        uv_table = {vi:self.flipUV_V(v.uv) for vi, v in enumerate(pmxModel.vertices)}
-        uv_layer.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i]))
+        uv_layer.data.foreach_set('uv', _loop_uvs(arrays.uv))
 
         if hasattr(mesh, 'uv_textures'):
-            for bf, mi in zip(uv_tex.data, material_indices):
+            for bf, mi in zip(uv_tex.data, material_indices.tolist()):
                 bf.image = self.__imageTable.get(mi, None)
 
         if pmxModel.header and pmxModel.header.additional_uvs:
             logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
             zw_data_map = collections.OrderedDict()
-            split_uvzw = lambda uvi: (self.flipUV_V(uvi[:2]), uvi[2:])
             for i in range(pmxModel.header.additional_uvs):
                 add_uv = uv_layers[uv_textures.new(name='UV'+str(i+1)).name]
                 logging.info(' - %s...(uv channels)', add_uv.name)
-                uv_table = {vi:split_uvzw(v.additional_uvs[i]) for vi, v in enumerate(pmxModel.vertices)}
-                add_uv.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i][0]))
-                if not any(any(s[1]) for s in uv_table.values()):
+                add_uv.data.foreach_set('uv', _loop_uvs(arrays.additional_uvs[:, i, :2]))
+                zw = arrays.additional_uvs[:, i, 2:]
+                if not zw.any():
                     logging.info('\t- zw are all zeros: %s', add_uv.name)
                 else:
-                    zw_data_map['_'+add_uv.name] = {k:self.flipUV_V(v[1]) for k, v in uv_table.items()}
-            for name, zw_table in zw_data_map.items():
+                    zw_data_map['_'+add_uv.name] = zw
+            for name, zw in zw_data_map.items():
                 logging.info(' - %s...(zw channels of %s)', name, name[1:])
                 add_zw = uv_textures.new(name=name)
                 if add_zw is None:
                     logging.warning('\t* Lost zw channels')
                     continue
                 add_zw = uv_layers[add_zw.name]
-                add_zw.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in zw_table[i]))
+                add_zw.data.foreach_set('uv', _loop_uvs(zw))
 
         if bpy.app.version >= (2, 80, 0):
             self.__fixOverlappingFaceMaterials(mesh.materials, mesh.vertices, loop_indices, material_indices)
@@ -632,42 +725,50 @@ class PMXImporter:
         # This is not the best way to setup blend_method, might just work for some common cases. And FnMaterial.update_alpha() is still using 'HASHED'.
         # For EEVEE, basically users should know which blend_method is best for each material of their models.
         # For Cycles, users have to offset or delete those z-fighting faces to fix it manually.
-        check = {}
-        mi_skip = -1
-        _vi_cache = {}
-        def _rounded_co_vi(vi):
-            if vi not in _vi_cache:
-                vco = vertices[vi].co
-                _vi_cache[vi] = (round(vco[0], 6), round(vco[1], 6), round(vco[2], 6))
-            return _vi_cache[vi]
-
+        material_indices = np.asarray(material_indices)
         assert(len(loop_indices) == len(material_indices)*3)
-        for i, mi in enumerate(material_indices):
-            if mi <= mi_skip:
-                continue
-            si = 3*i
-            verts = tuple(sorted((_rounded_co_vi(loop_indices[si]), _rounded_co_vi(loop_indices[si+1]), _rounded_co_vi(loop_indices[si+2]))))
-            if verts not in check:
-                check[verts] = mi
-            elif check[verts] < mi:
+        if len(material_indices) < 2:
+            return
+
+        co = np.empty(len(vertices)*3, dtype=np.float32)
+        vertices.foreach_get('co', co)
+        # the ids of the rounded coordinates follow their sorted order, so sorting the ids of a triangle sorts its vertex rows
+        co_ids = np.unique(np.round(co.reshape(-1, 3).astype(np.float64), 6), axis=0, return_inverse=True)[1].reshape(-1)
+        face_keys = np.sort(co_ids[np.asarray(loop_indices)].reshape(-1, 3), axis=1)
+        _, first_faces, face_key_ids = np.unique(face_keys, axis=0, return_index=True, return_inverse=True)
+        face_key_ids = face_key_ids.reshape(-1)
+        if not (material_indices[first_faces][face_key_ids] < material_indices).any():
+            return
+
+        # the faces of a material are compared with the faces of previous materials, up to its first overlapping face
+        known_keys = np.zeros(len(first_faces), dtype=bool)
+        bounds = np.flatnonzero(material_indices[1:] != material_indices[:-1]) + 1
+        for begin, end in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(material_indices)].tolist()):
+            key_ids = face_key_ids[begin:end]
+            overlapping = known_keys[key_ids]
+            if overlapping.any():
+                mi = int(material_indices[begin])
                 logging.debug(' >> fix blend method of material: %s', materials[mi].name)
                 materials[mi].blend_method = 'BLEND'
                 materials[mi].show_transparent_back = False
-                mi_skip = mi
+                key_ids = key_ids[:overlapping.argmax()]
+            known_keys[key_ids] = True
 
     def __importVertexMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
         self.__createBasisShapeKey()
+        basis_co = self.__basisCoordinates().astype(np.float64)
         for morph in (x for x in self.__model.morphs if isinstance(x, pmx.VertexMorph)):
             shapeKey = self.__meshObj.shape_key_add(name=morph.name)
             vtx_morph = mmd_root.vertex_morphs.add()
             vtx_morph.name = morph.name
             vtx_morph.name_e = morph.name_e
             vtx_morph.category = categories.get(morph.category, 'OTHER')
-            for md in morph.offsets:
-                shapeKeyPoint = shapeKey.data[md.index]
-                shapeKeyPoint.co += Vector(md.offset).xzy * self.__scale
+            index, offset = _morphOffsetArrays(morph.offsets, 3)
+            co = basis_co.copy()
+            np.add.at(co, index, offset[:, (0, 2, 1)] * self.__scale)
+            shapeKey.data.foreach_set('co', co.astype(np.float32).ravel())
 
     def __importMaterialMorphs(self):
         mmd_root = self.__root.mmd_root
@@ -813,13 +914,18 @@ class PMXImporter:
             used_names.add(m.name)
 
     def execute(self, **args):
+        types = args.get('types', set())
         if 'pmx' in args:
             self.__model = args['pmx']
         else:
-            self.__model = pmx.load(args['filepath'])
+            sections = {s for t in types for s in self.TYPE_SECTIONS.get(t, ())}
+            model_cache = cache.from_preferences()
+            if model_cache:
+                self.__model = model_cache.load(pmx.load, args['filepath'], sections=sorted(sections))
+            else:
+                self.__model = pmx.load(args['filepath'], sections=sections)
         self.__fixRepeatedMorphName()
 
-        types = args.get('types', set())
         clean_model = args.get('clean_model', False)
         remove_doubles = args.get('remove_doubles', False)
         self.__scale = args.get('scale', 1.0)
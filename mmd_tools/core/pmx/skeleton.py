@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+""" Pose the bones of a PMX model without Blender.
+
+The bones are transformed like MMD does, in the coordinates of the model:
+a bone has no rest rotation, its head is at Bone.location and the pose
+(VMD location and rotation) is applied at the head in the axes of the parent.
+The frames are solved together, each array has the frames as its first axis.
+"""
+
+import logging
+
+import numpy as np
+
+from mmd_tools.core.vmd.evaluator import _slerp
+
+
+def _normalized(v):
+    length = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(length > 0, length, 1.0)
+
+def _quatMultiply(a, b):
+    """ The quaternion products a*b of quaternions in x, y, z, w.
+    """
+    ax, ay, az, aw = np.moveaxis(a, -1, 0)
+    bx, by, bz, bw = np.moveaxis(b, -1, 0)
+    return np.stack((
+        aw*bx + ax*bw + ay*bz - az*by,
+        aw*by - ax*bz + ay*bw + az*bx,
+        aw*bz + ax*by - ay*bx + az*bw,
+        aw*bw - ax*bx - ay*by - az*bz,
+        ), axis=-1)
+
+def _quatConjugate(q):
+    return q * (-1.0, -1.0, -1.0, 1.0)
+
+def _quatToMatrix(q):
+    """ The rotation matrices of unit quaternions in x, y, z, w, for column vectors.
+    """
+    x, y, z, w = np.moveaxis(q, -1, 0)
+    xx, yy, zz = x*x, y*y, z*z
+    xy, xz, yz = x*y, x*z, y*z
+    wx, wy, wz = w*x, w*y, w*z
+    return np.stack((
+        1 - 2*(yy + zz), 2*(xy - wz), 2*(xz + wy),
+        2*(xy + wz), 1 - 2*(xx + zz), 2*(yz - wx),
+        2*(xz - wy), 2*(yz + wx), 1 - 2*(xx + yy),
+        ), axis=-1).reshape(q.shape[:-1] + (3, 3))
+
+def _axisAngleToQuat(axis, angle):
+    half = np.asarray(angle) * 0.5
+    return np.concatenate((axis * np.sin(half)[..., None], np.cos(half)[..., None]), axis=-1)
+
+def _eulerToQuat(angles):
+    """ The quaternions of the rotations Rx*Ry*Rz of the angles (x, y, z).
+    """
+    half = angles * 0.5
+    s, c = np.sin(half), np.cos(half)
+    zero = np.zeros(angles.shape[:-1])
+    qx = np.stack((s[..., 0], zero, zero, c[..., 0]), axis=-1)
+    qy = np.stack((zero, s[..., 1], zero, c[..., 1]), axis=-1)
+    qz = np.stack((zero, zero, s[..., 2], c[..., 2]), axis=-1)
+    return _quatMultiply(_quatMultiply(qx, qy), qz)
+
+def _matrixToEuler(m):
+    """ The angles (x, y, z) of the rotation matrices Rx*Ry*Rz.
+    """
+    return np.stack((
+        np.arctan2(-m[..., 1, 2], m[..., 2, 2]),
+        np.arcsin(np.clip(m[..., 0, 2], -1.0, 1.0)),
+        np.arctan2(-m[..., 0, 1], m[..., 0, 0]),
+        ), axis=-1)
+
+def _toLocal(rotations, origins, points):
+    """ The points in the spaces of the global transforms (rotations, origins).
+    """
+    return np.einsum('fji,fj->fi', rotations, points - origins)
+
+
+class _IKLink:
+    def __init__(self, index, ik_link):
+        self.index = index
+        self.minimum = self.maximum = None
+        self.plane_axis = None
+        if ik_link.minimumAngle is not None and ik_link.maximumAngle is not None:
+            self.minimum = np.array(ik_link.minimumAngle, dtype=np.float64)
+            self.maximum = np.array(ik_link.maximumAngle, dtype=np.float64)
+            # only one axis is free: rotate the link on its plane
+            free = (self.minimum != 0) | (self.maximum != 0)
+            fixed = (self.minimum == 0) | (self.maximum == 0)
+            for axis in range(3):
+                if free[axis] and fixed[(axis + 1)%3] and fixed[(axis + 2)%3]:
+                    self.plane_axis = axis
+                    break
+        self.affected = [] # the bones of the chain to update after rotating the link
+
+
+class _IKChain:
+    def __init__(self, index, bone, links):
+        self.index = index
+        self.target = bone.target
+        self.loop_count = max(int(bone.loopCount), 0)
+        self.limit_angle = float(bone.rotationConstraint)
+        self.links = links
+        self.chain = []   # the links and the bones between them and the target
+        self.subtree = [] # the bones to update after solving
+
+
+class SkeletonSolver:
+    """ Compute the global bone transforms of poses, including append (付与) transforms and CCD IK.
+
+    The bones are processed in the order of transform_order (transAfterPhis last), an append bone
+    takes the ratio of the local transform of its source bone, and an IK bone rotates its links
+    (within their angle limits and rotationConstraint per iteration) for at most loopCount
+    iterations to bring its target to the IK bone.
+    """
+    def __init__(self, bones):
+        """
+        @param bones the list of pmx.Bone of a model
+        """
+        self.__bones = bones
+        count = len(bones)
+        self.__rest = np.array([b.location for b in bones], dtype=np.float64).reshape(count, 3)
+
+        parents = [b.parent if b.parent is not None and 0 <= b.parent < count else -1 for b in bones]
+        for i in range(count):
+            # a broken hierarchy is solved as separated roots
+            p, steps = parents[i], 0
+            while p >= 0 and steps <= count:
+                p, steps = parents[p], steps + 1
+            if p >= 0:
+                parents[i] = -1
+        self.__parents = parents
+        self.__parent_array = np.array(parents, dtype=np.int64)
+        self.__offsets = self.__rest.copy()
+        for i, p in enumerate(parents):
+            if p >= 0:
+                self.__offsets[i] -= self.__rest[p]
+
+        def _depth(i):
+            d, p = 0, parents[i]
+            while p >= 0:
+                d, p = d + 1, parents[p]
+            return d
+        depths = [_depth(i) for i in range(count)]
+        self.__depths = np.array(depths, dtype=np.int64)
+        self.__topo_order = sorted(range(count), key=lambda i: (depths[i], i))
+        self.__topo_rank = {i: rank for rank, i in enumerate(self.__topo_order)}
+        self.__children = [[] for _ in range(count)]
+        for i, p in enumerate(parents):
+            if p >= 0:
+                self.__children[p].append(i)
+
+        self.__order = sorted(range(count), key=lambda i: (bones[i].transAfterPhis, bones[i].transform_order, i))
+
+        self.__appends = {}
+        for i, b in enumerate(bones):
+            if (b.hasAdditionalRotate or b.hasAdditionalLocation) and b.additionalTransform:
+                source, ratio = b.additionalTransform
+                if 0 <= source < count and source != i:
+                    self.__appends[i] = (source, float(ratio), b.hasAdditionalRotate, b.hasAdditionalLocation, self.__subtree([i]))
+
+        self.__iks = {}
+        for i, b in enumerate(bones):
+            if not b.isIK or b.target is None or not 0 <= b.target < count:
+                continue
+            links = [_IKLink(l.target, l) for l in b.ik_links if l.target is not None and 0 <= l.target < count]
+            if not links:
+                continue
+            self.__iks[i] = self.__makeIKChain(i, b, links)
+        logging.debug('skeleton of %d bones: %d append bones, %d IK bones', count, len(self.__appends), len(self.__iks))
+
+    def __subtree(self, roots):
+        ret = set()
+        stack = list(roots)
+        while stack:
+            i = stack.pop()
+            if i not in ret:
+                ret.add(i)
+                stack.extend(self.__children[i])
+        return sorted(ret, key=self.__topo_rank.get)
+
+    def __makeIKChain(self, index, bone, links):
+        ik = _IKChain(index, bone, links)
+        link_indices = set(l.index for l in links)
+        # the path from the target up to the topmost link
+        path = []
+        p = ik.target
+        while p >= 0:
+            path.append(p)
+            p = self.__parents[p]
+        chain = set(link_indices)
+        for link in links:
+            if link.index in path:
+                chain.update(path[:path.index(link.index)])
+        ik.chain = sorted(chain, key=self.__topo_rank.get)
+        for link in links:
+            descendants = set(self.__subtree([link.index]))
+            link.affected = [i for i in ik.chain if i in descendants]
+        ik.subtree = self.__subtree(link_indices)
+        return ik
+
+    def solve(self, locations, rotations, use_append=True, use_ik=True):
+        """ Solve the poses of the frames.
+
+        @param locations the VMD locations of the bones, array of shape (F, B, 3)
+        @param rotations the VMD rotations of the bones in x, y, z, w, array of shape (F, B, 4)
+        @param use_append apply the append transforms
+        @param use_ik solve the IK bones
+        @return the global matrices of the bones, array of shape (F, B, 4, 4).
+            The translations are the positions of the bone heads.
+        """
+        count = len(self.__bones)
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, count, 3)
+        rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, count, 4)
+        num_frames = len(locations)
+
+        identity = np.zeros((count, num_frames, 4))
+        identity[..., 3] = 1.0
+        self.__loc_anim = np.ascontiguousarray(locations.transpose(1, 0, 2))
+        self.__rot_anim = _normalized(np.ascontiguousarray(rotations.transpose(1, 0, 2)))
+        self.__loc_append = np.zeros((count, num_frames, 3))
+        self.__rot_append = identity.copy()
+        self.__rot_ik = identity
+        self.__global_rotations = np.empty((count, num_frames, 3, 3))
+        self.__global_locations = np.empty((count, num_frames, 3))
+        try:
+            self.__update(self.__topo_order)
+            for i in self.__order:
+                if use_append and i in self.__appends:
+                    self.__applyAppend(i, *self.__appends[i])
+                if use_ik and i in self.__iks:
+                    self.__solveIK(self.__iks[i])
+
+            matrices = np.zeros((num_frames, count, 4, 4))
+            matrices[..., :3, :3] = self.__global_rotations.transpose(1, 0, 2, 3)
+            matrices[..., :3, 3] = self.__global_locations.transpose(1, 0, 2)
+            matrices[..., 3, 3] = 1.0
+            return matrices
+        finally:
+            self.__loc_anim = self.__rot_anim = self.__loc_append = self.__rot_append = self.__rot_ik = None
+            self.__global_rotations = self.__global_locations = None
+
+    def solveMotion(self, evaluator, frames, use_append=True, use_ik=True):
+        """ Solve the poses of a motion at the frames.
+
+        @param evaluator a vmd.evaluator.VMDEvaluator of the motion
+        @param frames the frame numbers
+        @return the global matrices of the bones, array of shape (F, B, 4, 4)
+        """
+        frames = np.atleast_1d(np.asarray(frames, dtype=np.float64))
+        count = len(self.__bones)
+        locations = np.zeros((len(frames), count, 3))
+        rotations = np.zeros((len(frames), count, 4))
+        rotations[..., 3] = 1.0
+        poses = evaluator.evaluateBones(frames, names=set(b.name for b in self.__bones))
+        for i, b in enumerate(self.__bones):
+            if b.name in poses:
+                locations[:, i], rotations[:, i] = poses[b.name]
+        return self.solve(locations, rotations, use_append=use_append, use_ik=use_ik)
+
+    def __localRotation(self, i):
+        return _quatMultiply(_quatMultiply(self.__rot_ik[i], self.__rot_anim[i]), self.__rot_append[i])
+
+    def __update(self, indices):
+        """ Update the global transforms of the bones (sorted by depth), a level of depth at once.
+        """
+        if len(indices) == 0:
+            return
+        global_rotations, global_locations = self.__global_rotations, self.__global_locations
+        indices = np.asarray(indices)
+        rotations = _quatToMatrix(self.__localRotation(indices))
+        locations = self.__offsets[indices][:, None, :] + self.__loc_anim[indices] + self.__loc_append[indices]
+        depths = self.__depths[indices]
+        bounds = np.flatnonzero(np.diff(depths)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(indices)]))):
+            level = indices[start:end]
+            if depths[start] == 0:
+                global_rotations[level] = rotations[start:end]
+                global_locations[level] = locations[start:end]
+                continue
+            parents = self.__parent_array[level]
+            parent_rotations = global_rotations[parents]
+            global_rotations[level] = np.matmul(parent_rotations, rotations[start:end])
+            global_locations[level] = np.einsum('bfij,bfj->bfi', parent_rotations, locations[start:end]) + global_locations[parents]
+
+    def __applyAppend(self, i, source, ratio, rotate, move, subtree):
+        num_frames = self.__rot_anim.shape[1]
+        if rotate:
+            identity = np.zeros((num_frames, 4))
+            identity[:, 3] = 1.0
+            self.__rot_append[i] = _slerp(identity, self.__localRotation(source), np.full(num_frames, ratio))
+        if move:
+            self.__loc_append[i] = (self.__loc_anim[source] + self.__loc_append[source]) * ratio
+        self.__update(subtree)
+
+    def __solveIK(self, ik):
+        num_frames = self.__rot_anim.shape[1]
+        rot_ik, rot_anim = self.__rot_ik, self.__rot_anim
+        global_rotations, global_locations = self.__global_rotations, self.__global_locations
+        for link in ik.links:
+            rot_ik[link.index] = (0.0, 0.0, 0.0, 1.0)
+        self.__update(ik.chain)
+
+        limit_angle = ik.limit_angle
+        prev_angles = {link.index: np.zeros((num_frames, 3)) for link in ik.links}
+        plane_angles = {link.index: np.zeros(num_frames) for link in ik.links}
+        best_distances = np.full(num_frames, np.inf)
+        best_rotations = {link.index: rot_ik[link.index].copy() for link in ik.links}
+        active = np.ones(num_frames, dtype=bool)
+        for iteration in range(ik.loop_count):
+            ik_location = global_locations[ik.index]
+            for link in ik.links:
+                j = link.index
+                if j == ik.target:
+                    continue
+                local_ik = _normalized(_toLocal(global_rotations[j], global_locations[j], ik_location))
+                local_target = _normalized(_toLocal(global_rotations[j], global_locations[j], global_locations[ik.target]))
+                angle = np.arccos(np.clip(np.einsum('fi,fi->f', local_target, local_ik), -1.0, 1.0))
+                angle = np.minimum(angle, limit_angle)
+                valid = active.copy()
+
+                if link.plane_axis is not None:
+                    k = link.plane_axis
+                    axis = np.zeros(3)
+                    axis[k] = 1.0
+                    # rotate to the side which brings the target closer
+                    dot1 = np.einsum('fij,fj,fi->f', _quatToMatrix(_axisAngleToQuat(axis, angle)), local_target, local_ik)
+                    dot2 = np.einsum('fij,fj,fi->f', _quatToMatrix(_axisAngleToQuat(axis, -angle)), local_target, local_ik)
+                    new_angle = plane_angles[j] + np.where(dot1 > dot2, angle, -angle)
+                    lower, upper = link.minimum[k], link.maximum[k]
+                    if iteration == 0:
+                        outside = (new_angle < lower) | (new_angle > upper)
+                        half = (lower + upper) * 0.5
+                        flip = outside & (((-new_angle > lower) & (-new_angle < upper)) | (np.abs(half - new_angle) > np.abs(half + new_angle)))
+                        new_angle = np.where(flip, -new_angle, new_angle)
+                    new_angle = np.clip(new_angle, lower, upper)
+                    plane_angles[j] = np.where(valid, new_angle, plane_angles[j])
+                    chain_rotation = _axisAngleToQuat(axis, new_angle)
+                else:
+                    axis = np.cross(local_target, local_ik)
+                    valid &= (np.degrees(angle) >= 1e-3) & (np.linalg.norm(axis, axis=-1) > 0)
+                    rotation = _axisAngleToQuat(_normalized(axis), angle)
+                    chain_rotation = _quatMultiply(_quatMultiply(rot_ik[j], rot_anim[j]), rotation)
+                    if link.minimum is not None:
+                        angles = np.clip(_matrixToEuler(_quatToMatrix(chain_rotation)), link.minimum, link.maximum)
+                        angles = np.clip(angles - prev_angles[j], -limit_angle, limit_angle) + prev_angles[j]
+                        prev_angles[j] = np.where(valid[:, None], angles, prev_angles[j])
+                        chain_rotation = _eulerToQuat(angles)
+
+                new_rotation = _quatMultiply(chain_rotation, _quatConjugate(rot_anim[j]))
+                rot_ik[j] = np.where(valid[:, None], new_rotation, rot_ik[j])
+                self.__update(link.affected)
+
+            distances = np.linalg.norm(global_locations[ik.target] - ik_location, axis=-1)
+            improved = active & (distances < best_distances)
+            best_distances[improved] = distances[improved]
+            for link in ik.links:
+                best_rotations[link.index][improved] = rot_ik[link.index][improved]
+            active = improved
+            if not active.any():
+                break
+
+        for link in ik.links:
+            rot_ik[link.index] = best_rotations[link.index]
+        self.__update(ik.subtree)
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 import collections
+import collections.abc
 import logging
+import os
 import struct
 
+import numpy as np
+
+from mmd_tools.core import batch
+
 
 class InvalidFileError(Exception):
     pass
@@ -36,6 +42,13 @@ class Header:
 
 
 class BoneFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('location', '<f4', (3,)),
+        ('rotation', '<f4', (4,)),
+        ('interp', 'i1', (64,)),
+        ])
+
     def __init__(self):
         self.frame_number = 0
         self.location = []
@@ -50,6 +63,34 @@ class BoneFrameKey:
             self.rotation = (0, 0, 0, 1)
         self.interp = list(struct.unpack('<64b', fin.read(64)))
 
+    @classmethod
+    def fromRecords(cls, records):
+        """ Create the frame keys of the structured records (fixed by BoneAnimation.fixRecords()).
+        """
+        ret = []
+        for frame_number, location, rotation, interp in zip(records['frame_number'].tolist(),
+                records['location'].tolist(), records['rotation'].tolist(), records['interp'].tolist()):
+            k = cls()
+            k.frame_number = frame_number
+            k.location = location
+            k.rotation = rotation
+            k.interp = interp
+            ret.append(k)
+        return ret
+
+    @classmethod
+    def toRecords(cls, frameKeys, dtype=None):
+        """ Pack the frame keys into a structured array of DTYPE (or a dtype including its fields).
+        """
+        records = np.zeros(len(frameKeys), dtype=dtype or cls.DTYPE)
+        if len(records) == 0:
+            return records
+        records['frame_number'] = [k.frame_number for k in frameKeys]
+        records['location'] = [k.location for k in frameKeys]
+        records['rotation'] = [k.rotation for k in frameKeys]
+        records['interp'] = [k.interp for k in frameKeys]
+        return records
+
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
         fin.write(struct.pack('<fff', *self.location))
@@ -65,6 +106,11 @@ class BoneFrameKey:
 
 
 class ShapeKeyFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('weight', '<f4'),
+        ])
+
     def __init__(self):
         self.frame_number = 0
         self.weight = 0.0
@@ -73,6 +119,29 @@ class ShapeKeyFrameKey:
         self.frame_number, = struct.unpack('<L', fin.read(4))
         self.weight, = struct.unpack('<f', fin.read(4))
 
+    @classmethod
+    def fromRecords(cls, records):
+        """ Create the frame keys of the structured records, identical to what load() creates.
+        """
+        ret = []
+        for frame_number, weight in zip(records['frame_number'].tolist(), records['weight'].tolist()):
+            k = cls()
+            k.frame_number = frame_number
+            k.weight = weight
+            ret.append(k)
+        return ret
+
+    @classmethod
+    def toRecords(cls, frameKeys, dtype=None):
+        """ Pack the frame keys into a structured array of DTYPE (or a dtype including its fields).
+        """
+        records = np.zeros(len(frameKeys), dtype=dtype or cls.DTYPE)
+        if len(records) == 0:
+            return records
+        records['frame_number'] = [k.frame_number for k in frameKeys]
+        records['weight'] = [k.weight for k in frameKeys]
+        return records
+
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
         fin.write(struct.pack('<f', self.weight))
@@ -85,6 +154,16 @@ class ShapeKeyFrameKey:
 
 
 class CameraKeyFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('distance', '<f4'),
+        ('location', '<f4', (3,)),
+        ('rotation', '<f4', (3,)),
+        ('interp', 'i1', (24,)),
+        ('angle', '<u4'),
+        ('orthographic', 'i1'),
+        ])
+
     def __init__(self):
         self.frame_number = 0
         self.distance = 0.0
@@ -113,6 +192,22 @@ class CameraKeyFrameKey:
         fin.write(struct.pack('<L', self.angle))
         fin.write(struct.pack('<b', 0 if self.persp else 1))
 
+    @classmethod
+    def toRecords(cls, frameKeys, dtype=None):
+        """ Pack the frame keys into a structured array of DTYPE (or a dtype including its fields).
+        """
+        records = np.zeros(len(frameKeys), dtype=dtype or cls.DTYPE)
+        if len(records) == 0:
+            return records
+        records['frame_number'] = [k.frame_number for k in frameKeys]
+        records['distance'] = [k.distance for k in frameKeys]
+        records['location'] = [k.location for k in frameKeys]
+        records['rotation'] = [k.rotation for k in frameKeys]
+        records['interp'] = [k.interp for k in frameKeys]
+        records['angle'] = [k.angle for k in frameKeys]
+        records['orthographic'] = [0 if k.persp else 1 for k in frameKeys]
+        return records
+
     def __repr__(self):
         return '<CameraKeyFrameKey frame %s, distance %s, loc %s, rot %s, angle %s, persp %s>'%(
             str(self.frame_number),
@@ -125,6 +220,12 @@ class CameraKeyFrameKey:
 
 
 class LampKeyFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('color', '<f4', (3,)),
+        ('direction', '<f4', (3,)),
+        ])
+
     def __init__(self):
         self.frame_number = 0
         self.color = []
@@ -140,6 +241,18 @@ class LampKeyFrameKey:
         fin.write(struct.pack('<fff', *self.color))
         fin.write(struct.pack('<fff', *self.direction))
 
+    @classmethod
+    def toRecords(cls, frameKeys, dtype=None):
+        """ Pack the frame keys into a structured array of DTYPE (or a dtype including its fields).
+        """
+        records = np.zeros(len(frameKeys), dtype=dtype or cls.DTYPE)
+        if len(records) == 0:
+            return records
+        records['frame_number'] = [k.frame_number for k in frameKeys]
+        records['color'] = [k.color for k in frameKeys]
+        records['direction'] = [k.direction for k in frameKeys]
+        return records
+
     def __repr__(self):
         return '<LampKeyFrameKey frame %s, color %s, direction %s>'%(
             str(self.frame_number),
@@ -209,32 +322,156 @@ class PropertyFrameKey:
             )
 
 
+class FrameKeyList(collections.abc.MutableSequence):
+    """ A list of frame keys backed by a structured array of the records (see _AnimationBase.recordDType()).
+
+    The frame key objects are created on first access. The array is kept
+    available as long as the list itself is not modified.
+    """
+    def __init__(self, frame_class, records):
+        self.__frame_class = frame_class
+        self.__records = records
+        self.__items = None
+
+    @property
+    def records(self):
+        """ The structured array of this list, or None if the list was modified.
+        """
+        return self.__records
+
+    def __materialize(self):
+        if self.__items is None:
+            self.__items = self.__frame_class.fromRecords(self.__records)
+        return self.__items
+
+    def __len__(self):
+        if self.__items is None:
+            return len(self.__records)
+        return len(self.__items)
+
+    def __getitem__(self, index):
+        return self.__materialize()[index]
+
+    def __setitem__(self, index, value):
+        self.__materialize()[index] = value
+        self.__records = None
+
+    def __delitem__(self, index):
+        del self.__materialize()[index]
+        self.__records = None
+
+    def insert(self, index, value):
+        self.__materialize().insert(index, value)
+        self.__records = None
+
+    def sort(self, key=None, reverse=False):
+        self.__materialize().sort(key=key, reverse=reverse)
+        self.__records = None
+
+    def toRecords(self, dtype):
+        """ Pack the frame keys into a structured array of dtype.
+
+        The array is used if no frame key object was created, since those could have been modified.
+        """
+        if self.__items is None and self.__records.dtype == dtype:
+            return self.__records.copy()
+        return self.__frame_class.toRecords(self.__materialize(), dtype)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return '<FrameKeyList %s count %d>'%(self.__frame_class.__name__, len(self))
+
+
 class _AnimationBase(collections.defaultdict):
+    """ The frame keys of each name (bone or shape key).
+
+    The frame keys loaded from a file are kept in a FrameKeyList of each name,
+    so their structured arrays are available in FrameKeyList.records.
+    """
     def __init__(self):
         collections.defaultdict.__init__(self, list)
 
+    def __reduce__(self):
+        # defaultdict pickles its default_factory as the argument of __init__()
+        return (self.__class__, (), None, None, iter(self.items()))
+
     @staticmethod
     def frameClass():
         raise NotImplementedError
 
+    @classmethod
+    def recordDType(cls):
+        """ The dtype of the records in the file: the name and the frame key.
+        """
+        return np.dtype([('name', 'S15')] + cls.frameClass().DTYPE.descr)
+
     def load(self, fin):
         count, = struct.unpack('<L', fin.read(4))
         logging.info('loading %s... %d', self.__class__.__name__, count)
-        for i in range(count):
-            name = _toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
-            cls = self.frameClass()
-            frameKey = cls()
-            frameKey.load(fin)
-            self[name].append(frameKey)
+        dtype = self.recordDType()
+        # a corrupt count must not allocate more than the rest of the file
+        position = fin.tell()
+        available = (fin.seek(0, os.SEEK_END) - position)//dtype.itemsize
+        fin.seek(position)
+        data = bytearray(min(count, available)*dtype.itemsize)
+        records = np.frombuffer(data, dtype=dtype, count=fin.readinto(data)//dtype.itemsize)
+        self.fixRecords(records)
+
+        # group the records by the raw names, keeping the order of the records
+        # and the order in which the names appear first
+        raw_names = records['name']
+        order = np.argsort(raw_names, kind='stable')
+        sorted_names = raw_names[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_names[1:] != sorted_names[:-1]))) if len(records) else []
+        groups = np.split(order, starts[1:]) if len(records) else []
+        groups.sort(key=lambda x: x[0])
+
+        indices = collections.OrderedDict()
+        for group in groups:
+            name = _toShiftJisString(raw_names[group[0]])
+            indices.setdefault(name, []).append(group)
+
+        cls = self.frameClass()
+        for name, group in indices.items():
+            group = group[0] if len(group) == 1 else np.sort(np.concatenate(group))
+            frameKeys = FrameKeyList(cls, records[group])
+            if name in self:
+                self[name].extend(frameKeys)
+            else:
+                self[name] = frameKeys
+
+        if len(records) < count:
+            raise struct.error('unexpected end of %s'%self.__class__.__name__)
+
+    def skip(self, fin):
+        """ Move the file position to the end of the section without reading the records.
+        """
+        count, = struct.unpack('<L', fin.read(4))
+        logging.info('skipping %s... %d', self.__class__.__name__, count)
+        fin.seek(count*self.recordDType().itemsize, os.SEEK_CUR)
+
+    @staticmethod
+    def fixRecords(records):
+        """ Fix the loaded records in place like the load() of the frame key class does.
+        """
+        pass
 
     def save(self, fin):
-        count = sum([len(i) for i in self.values()])
-        fin.write(struct.pack('<L', count))
+        dtype = self.recordDType()
+        cls = self.frameClass()
+        chunks = []
         for name, frameKeys in self.items():
-            name_data = struct.pack('<15s', _toShiftJisBytes(name))
-            for frameKey in frameKeys:
-                fin.write(name_data)
-                frameKey.save(fin)
+            if isinstance(frameKeys, FrameKeyList):
+                records = frameKeys.toRecords(dtype)
+            else:
+                records = cls.toRecords(frameKeys, dtype)
+            records['name'] = struct.pack('<15s', _toShiftJisBytes(name))
+            chunks.append(records)
+        records = np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+        fin.write(struct.pack('<L', len(records)))
+        fin.write(records.tobytes())
 
 
 class _AnimationListBase(list):
@@ -254,8 +491,23 @@ class _AnimationListBase(list):
             frameKey.load(fin)
             self.append(frameKey)
 
+    def skip(self, fin):
+        """ Move the file position to the end of the section without keeping the frame keys.
+        """
+        cls = self.frameClass()
+        if not hasattr(cls, 'DTYPE'):
+            self.__class__().load(fin)
+            return
+        count, = struct.unpack('<L', fin.read(4))
+        logging.info('skipping %s... %d', self.__class__.__name__, count)
+        fin.seek(count*cls.DTYPE.itemsize, os.SEEK_CUR)
+
     def save(self, fin):
         fin.write(struct.pack('<L', len(self)))
+        cls = self.frameClass()
+        if hasattr(cls, 'toRecords'):
+            fin.write(cls.toRecords(self).tobytes())
+            return
         for frameKey in self:
             frameKey.save(fin)
 
@@ -268,6 +520,11 @@ class BoneAnimation(_AnimationBase):
     def frameClass():
         return BoneFrameKey
 
+    @staticmethod
+    def fixRecords(records):
+        rotation = records['rotation']
+        rotation[~rotation.any(axis=1)] = (0, 0, 0, 1)
+
 
 class ShapeKeyAnimation(_AnimationBase):
     def __init__(self):
@@ -315,6 +572,8 @@ class PropertyAnimation(_AnimationListBase):
 
 
 class File:
+    SECTIONS = ('boneAnimation', 'shapeKeyAnimation', 'cameraAnimation', 'lampAnimation', 'selfShadowAnimation', 'propertyAnimation')
+
     def __init__(self):
         self.filepath = None
         self.header = None
@@ -326,7 +585,14 @@ class File:
         self.propertyAnimation = None
 
     def load(self, **args):
+        """ Load a vmd file.
+
+        @param filepath the path of the file
+        @param sections the names of the animations (see File.SECTIONS) to load, None for all.
+            The other animations are left empty and skipped by seeking past their records.
+        """
         path = args['filepath']
+        sections = args.get('sections', None)
 
         with open(path, 'rb') as fin:
             self.filepath = path
@@ -339,13 +605,16 @@ class File:
             self.propertyAnimation = PropertyAnimation()
 
             self.header.load(fin)
+            remaining = set(self.SECTIONS if sections is None else sections)
             try:
-                self.boneAnimation.load(fin)
-                self.shapeKeyAnimation.load(fin)
-                self.cameraAnimation.load(fin)
-                self.lampAnimation.load(fin)
-                self.selfShadowAnimation.load(fin)
-                self.propertyAnimation.load(fin)
+                for name in self.SECTIONS:
+                    if not remaining:
+                        break
+                    if name in remaining:
+                        getattr(self, name).load(fin)
+                        remaining.discard(name)
+                    else:
+                        getattr(self, name).skip(fin)
             except struct.error:
                 pass # no valid camera/lamp data
 
@@ -369,3 +638,67 @@ class File:
             selfShadowAnimation.save(fin)
             propertyAnimation.save(fin)
 
+
+def _loadFile(path, sections=None):
+    vmd_file = File()
+    vmd_file.load(filepath=path, sections=sections)
+    return vmd_file
+
+def load_many(paths, workers=None, sections=None):
+    """ Load vmd files in worker processes, see batch.load_many().
+
+    @param sections the names of the animations to load, see File.load()
+    @return a list of batch.LoadResult of File in the order of paths
+    """
+    return batch.load_many(_loadFile, paths, workers, sections=sections)
+
+def _rawNames(records):
+    """ The names of the records as bytes, ignoring the bytes after the first null.
+    """
+    names = records['name'].copy()
+    data = names.view(np.uint8).reshape(len(names), names.dtype.itemsize)
+    data[np.cumsum(data == 0, axis=1) > 0] = 0
+    return names
+
+def iter_bone_keys(path, names=None, chunk_size=65536):
+    """ Iterate over the bone keys of a vmd file as (bone name, BoneFrameKey) in the file order.
+
+    The records are read chunk_size at a time, so the memory usage does not
+    depend on the size of the file.
+
+    @param names the bone names to read, None for all. Other records are
+        skipped by comparing their raw names, before any decoding.
+    """
+    dtype = BoneAnimation.recordDType()
+    wanted = None
+    if names is not None:
+        wanted = np.array([_toShiftJisBytes(n)[:15] for n in names], dtype='S15')
+    decoded_names = {}
+
+    with open(path, 'rb') as fin:
+        Header().load(fin)
+        try:
+            count, = struct.unpack('<L', fin.read(4))
+        except struct.error:
+            return
+        data = bytearray(min(count, chunk_size)*dtype.itemsize)
+        view = memoryview(data)
+        while count > 0:
+            chunk_count = min(count, chunk_size)
+            read_count = fin.readinto(view[:chunk_count*dtype.itemsize])//dtype.itemsize
+            records = np.frombuffer(data, dtype=dtype, count=read_count)
+            raw_names = _rawNames(records)
+            if wanted is not None:
+                mask = np.isin(raw_names, wanted)
+                records, raw_names = records[mask], raw_names[mask]
+            else:
+                records = records.copy()
+            BoneAnimation.fixRecords(records)
+            for raw_name, frameKey in zip(raw_names.tolist(), BoneFrameKey.fromRecords(records)):
+                name = decoded_names.get(raw_name)
+                if name is None:
+                    name = decoded_names[raw_name] = _toShiftJisString(raw_name)
+                yield name, frameKey
+            if read_count < chunk_count:
+                break # unexpected end of file
+            count -= chunk_count
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+""" Evaluate the animations of a vmd.File at any frames without Blender.
+
+The values are interpolated like MMD does: each channel of a bone or a camera
+key has its own 4-point Bezier curve (control points in [0, 127]) to map the
+progress of the segment, and the bone rotations are spherically interpolated.
+The results are in the coordinates of the VMD file (MMD space, no scaling).
+"""
+
+import logging
+
+import numpy as np
+
+from mmd_tools.core import vmd
+
+
+def _bezierWeights(params, s, bisections=8, newton_iterations=3):
+    """ Evaluate the VMD interpolation curves P0=(0, 0), P1=(x1, y1), P2=(x2, y2), P3=(1, 1) at x.
+
+    @param params control points x1, y1, x2, y2 divided by 127, array of shape (..., 4)
+    @param s the x values in [0, 1], array of shape (...)
+    @param bisections the bisection steps to bracket t of x
+    @param newton_iterations the Newton steps to refine t inside the bracket
+    @return the y values, array of shape (...)
+    """
+    x1, y1, x2, y2 = np.moveaxis(params, -1, 0)
+    s = np.broadcast_to(s, x1.shape)
+    # x(t) = a*t^3 + b*t^2 + c*t, monotonic since x1 and x2 are in [0, 1]
+    c = 3.0*x1
+    b = 3.0*x2 - 2.0*c
+    a = 1.0 - c - b
+    lo = np.zeros(x1.shape)
+    hi = np.ones(x1.shape)
+    for _ in range(bisections):
+        t = (lo + hi) * 0.5
+        less = ((a*t + b)*t + c)*t < s
+        lo = np.where(less, t, lo)
+        hi = np.where(less, hi, t)
+    t = (lo + hi) * 0.5
+    for _ in range(newton_iterations):
+        dx = (3.0*a*t + 2.0*b)*t + c
+        step = (((a*t + b)*t + c)*t - s) / np.where(dx > 1e-9, dx, 1e-9)
+        t = np.clip(t - step, lo, hi)
+    it = 1.0 - t
+    y = (3.0*it*it*y1 + (3.0*it*y2 + t)*t)*t
+    # the linear curves are exact
+    return np.where((x1 == y1) & (x2 == y2), s, y)
+
+def _slerp(q0, q1, t):
+    """ Spherical linear interpolation of quaternions along the shortest arc.
+
+    @param q0 quaternions of shape (N, 4)
+    @param q1 quaternions of shape (N, 4)
+    @param t factors of shape (N,)
+    @return normalized quaternions of shape (N, 4)
+    """
+    dot = np.einsum('ij,ij->i', q0, q1)
+    q1 = np.where((dot < 0)[:, None], -q1, q1)
+    dot = np.minimum(np.abs(dot), 1.0)
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    near = sin_theta < 1e-6
+    sin_theta[near] = 1.0
+    w0 = np.where(near, 1.0 - t, np.sin((1.0 - t)*theta)/sin_theta)
+    w1 = np.where(near, t, np.sin(t*theta)/sin_theta)
+    q = w0[:, None]*q0 + w1[:, None]*q1
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+def _segments(key_frames, frames):
+    """ Find the keys around the frames.
+
+    @param key_frames the sorted unique frame numbers of the keys
+    @param frames the frames to evaluate
+    @return (indices of the start keys, indices of the end keys, progress in [0, 1])
+        The frames out of the keys use the first or the last key with a progress of 0.
+    """
+    end = np.searchsorted(key_frames, frames, side='right')
+    start = np.maximum(end - 1, 0)
+    end = np.minimum(end, len(key_frames) - 1)
+    span = key_frames[end] - key_frames[start]
+    valid = span > 0
+    s = np.zeros(len(frames))
+    s[valid] = (frames[valid] - key_frames[start[valid]]) / span[valid]
+    return start, end, s
+
+def _uniqueKeys(records):
+    """ Sort the records by frame number, the last record of a frame wins like in MMD.
+    """
+    records = records[np.argsort(records['frame_number'], kind='stable')]
+    frame_numbers = records['frame_number']
+    return records[np.append(frame_numbers[1:] != frame_numbers[:-1], True)]
+
+
+class _BoneTrack:
+    def __init__(self, records):
+        records = _uniqueKeys(records)
+        self.frames = records['frame_number'].astype(np.float64)
+        self.locations = records['location'].astype(np.float64)
+        rotations = records['rotation'].astype(np.float64)
+        self.rotations = rotations / np.linalg.norm(rotations, axis=1, keepdims=True)
+        # x, y, z, rotation: x1 at 16*i, y1 at 16*i+4, x2 at 16*i+8, y2 at 16*i+12
+        interp = np.clip(records['interp'].reshape(len(records), 4, 16)[:, :, 0:16:4], 0, 127)
+        self.params = interp.astype(np.float64) / 127.0
+
+    def evaluate(self, frames):
+        start, end, s = _segments(self.frames, frames)
+        weights = _bezierWeights(self.params[end], s[:, None])
+        l0 = self.locations[start]
+        locations = l0 + (self.locations[end] - l0) * weights[:, :3]
+        rotations = _slerp(self.rotations[start], self.rotations[end], weights[:, 3])
+        return locations, rotations
+
+
+class _CameraTrack:
+    def __init__(self, records):
+        records = _uniqueKeys(records)
+        self.frames = records['frame_number'].astype(np.float64)
+        self.distances = records['distance'].astype(np.float64)
+        self.locations = records['location'].astype(np.float64)
+        self.rotations = records['rotation'].astype(np.float64)
+        self.angles = records['angle'].astype(np.float64)
+        self.persp = records['orthographic'] == 0
+        # x, y, z, rotation, distance, angle: x1, x2, y1, y2 at 4*i
+        interp = np.clip(records['interp'].reshape(len(records), 6, 4)[:, :, [0, 2, 1, 3]], 0, 127)
+        self.params = interp.astype(np.float64) / 127.0
+
+    def evaluate(self, frames):
+        start, end, s = _segments(self.frames, frames)
+        weights = _bezierWeights(self.params[end], s[:, None])
+        def _lerp(values, w):
+            v0 = values[start]
+            return v0 + (values[end] - v0) * w
+        return {
+            'distance': _lerp(self.distances, weights[:, 4]),
+            'location': _lerp(self.locations, weights[:, :3]),
+            'rotation': _lerp(self.rotations, weights[:, 3:4]),
+            'angle': _lerp(self.angles, weights[:, 5]),
+            'persp': self.persp[start],
+            }
+
+
+class VMDEvaluator:
+    """ Evaluate the bone, morph and camera animations of a vmd.File at any frames.
+
+    The keys of each bone, morph or camera are prepared on the first evaluation,
+    and the frames of one call are evaluated together.
+    """
+    def __init__(self, vmd_file):
+        """
+        @param vmd_file a loaded vmd.File
+        """
+        self.__vmd_file = vmd_file
+        self.__bone_tracks = {}
+        self.__morph_tracks = {}
+        self.__camera_track = None
+
+    @staticmethod
+    def __frames(frames):
+        return np.atleast_1d(np.asarray(frames, dtype=np.float64))
+
+    @staticmethod
+    def __names(animation, names):
+        if animation is None:
+            return []
+        if names is None:
+            return [name for name, frameKeys in animation.items() if len(frameKeys)]
+        return [name for name in names if len(animation.get(name, ()))]
+
+    def boneNames(self):
+        return self.__names(self.__vmd_file.boneAnimation, None)
+
+    def morphNames(self):
+        return self.__names(self.__vmd_file.shapeKeyAnimation, None)
+
+    def hasCamera(self):
+        return bool(self.__vmd_file.cameraAnimation)
+
+    def __boneTrack(self, name):
+        track = self.__bone_tracks.get(name, None)
+        if track is None:
+            frameKeys = self.__vmd_file.boneAnimation[name]
+            records = getattr(frameKeys, 'records', None)
+            if records is None:
+                records = vmd.BoneFrameKey.toRecords(frameKeys)
+                vmd.BoneAnimation.fixRecords(records)
+            track = self.__bone_tracks[name] = _BoneTrack(records)
+        return track
+
+    def __morphTrack(self, name):
+        track = self.__morph_tracks.get(name, None)
+        if track is None:
+            frameKeys = self.__vmd_file.shapeKeyAnimation[name]
+            records = getattr(frameKeys, 'records', None)
+            if records is None:
+                records = vmd.ShapeKeyFrameKey.toRecords(frameKeys)
+            records = _uniqueKeys(records)
+            track = self.__morph_tracks[name] = (records['frame_number'].astype(np.float64), records['weight'].astype(np.float64))
+        return track
+
+    def evaluateBones(self, frames, names=None):
+        """ Evaluate the bone animation.
+
+        @param frames the frame numbers, fractional frames are allowed
+        @param names the bone names to evaluate, None for all bones of the motion.
+            The names without keys are skipped.
+        @return a dict of bone name: (locations of shape (F, 3), rotations of shape (F, 4) in x, y, z, w)
+        """
+        frames = self.__frames(frames)
+        ret = {}
+        for name in self.__names(self.__vmd_file.boneAnimation, names):
+            ret[name] = self.__boneTrack(name).evaluate(frames)
+        logging.debug('evaluated %d bones at %d frames', len(ret), len(frames))
+        return ret
+
+    def evaluateMorphs(self, frames, names=None):
+        """ Evaluate the morph animation, the weights are interpolated linearly.
+
+        @param frames the frame numbers, fractional frames are allowed
+        @param names the morph names to evaluate, None for all morphs of the motion.
+            The names without keys are skipped.
+        @return a dict of morph name: weights of shape (F,)
+        """
+        frames = self.__frames(frames)
+        ret = {}
+        for name in self.__names(self.__vmd_file.shapeKeyAnimation, names):
+            key_frames, weights = self.__morphTrack(name)
+            ret[name] = np.interp(frames, key_frames, weights)
+        logging.debug('evaluated %d morphs at %d frames', len(ret), len(frames))
+        return ret
+
+    def evaluateCamera(self, frames):
+        """ Evaluate the camera animation.
+
+        @param frames the frame numbers, fractional frames are allowed
+        @return None if there is no camera key, otherwise a dict of
+            'distance' (F,), 'location' (F, 3), 'rotation' (F, 3) in radians,
+            'angle' (F,) the field of view in degrees and 'persp' (F,) of bool
+        """
+        if not self.hasCamera():
+            return None
+        if self.__camera_track is None:
+            cameraAnim = self.__vmd_file.cameraAnimation
+            self.__camera_track = _CameraTrack(vmd.CameraKeyFrameKey.toRecords(cameraAnim))
+        return self.__camera_track.evaluate(self.__frames(frames))
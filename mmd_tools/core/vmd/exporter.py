@@ -3,125 +3,133 @@
 import logging
 import math
 import re
-from typing import List, Optional, Set
+from typing import List, Optional
 
 import bpy
-import mathutils
+import numpy as np
 from mmd_tools.core import vmd
 from mmd_tools.core.camera import MMDCamera
 from mmd_tools.core.lamp import MMDLamp
-from mmd_tools.core.vmd.importer import _FnBezier
+from mmd_tools.core.vmd.importer import _FnBezierArray, _FnRotation
 
 
 class _FCurve:
-    @staticmethod
-    def __x_co_0(x: bpy.types.Keyframe):
-        return x.co[0]
+    __INTERPOLATION_ITEMS = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items
+    __CONSTANT = __INTERPOLATION_ITEMS['CONSTANT'].value
+    __BEZIER = __INTERPOLATION_ITEMS['BEZIER'].value
 
     def __init__(self, default_value):
         self.__default_value = default_value
         self.__fcurve: Optional[bpy.types.FCurve] = None
-        self.__sorted_keyframe_points: Optional[List[bpy.types.Keyframe]] = None
+        self.__co = self.__handle_left = self.__handle_right = self.__interpolation = None
 
     def setFCurve(self, fcurve: bpy.types.FCurve):
         assert(fcurve.is_valid and self.__fcurve is None)
         self.__fcurve = fcurve
-        self.__sorted_keyframe_points: List[bpy.types.Keyframe] = sorted(self.__fcurve.keyframe_points, key=self.__x_co_0)
+        keyframe_points = fcurve.keyframe_points
+        co, handle_left, handle_right = (np.empty((len(keyframe_points), 2), dtype=np.float32) for _ in range(3))
+        keyframe_points.foreach_get('co', co.ravel())
+        keyframe_points.foreach_get('handle_left', handle_left.ravel())
+        keyframe_points.foreach_get('handle_right', handle_right.ravel())
+        interpolation = np.empty(len(keyframe_points), dtype=np.int32)
+        try:
+            keyframe_points.foreach_get('interpolation', interpolation)
+        except (TypeError, RuntimeError): # foreach_get() of enum properties is not supported by older versions
+            items = self.__INTERPOLATION_ITEMS
+            interpolation[:] = [items[kp.interpolation].value for kp in keyframe_points]
+        order = np.argsort(co[:, 0], kind='stable')
+        self.__co, self.__handle_left, self.__handle_right = co[order], handle_left[order], handle_right[order]
+        self.__interpolation = interpolation[order]
 
     def frameNumbers(self):
-        sorted_keyframe_points = self.__sorted_keyframe_points
-        result: Set[int] = set()
-        if sorted_keyframe_points is None:
-            return result
-
-        if len(sorted_keyframe_points) == 0:
-            return result
-
-        kp1 = sorted_keyframe_points[0]
-        result.add(int(kp1.co[0]+0.5))
-
-        kp0 = kp1
-        for kp1 in sorted_keyframe_points[1:]:
-            result.add(int(kp1.co[0]+0.5))
-            if kp0.interpolation != 'LINEAR' and kp1.co.x - kp0.co.x > 2.5:
-                if kp0.interpolation == 'CONSTANT':
-                    result.add(int(kp1.co[0]-0.5))
-                elif kp0.interpolation == 'BEZIER':
-                    bz = _FnBezier.from_fcurve(kp0, kp1)
-                    for t in bz.find_critical():
-                        result.add(int(bz.evaluate(t).x+0.5))
-            kp0 = kp1
-
-        return result
+        co = self.__co
+        if co is None or len(co) == 0:
+            return np.zeros(0, dtype=int)
 
-    @staticmethod
-    def getVMDControlPoints(kp0, kp1):
-        if kp0.interpolation == 'BEZIER':
-            return _FCurve.__toVMDControlPoints(_FnBezier.from_fcurve(kp0, kp1))
-        return ((20, 20), (107, 107))
+        x = co[:, 0].astype(float)
+        result = [(x+0.5).astype(int)]
 
-    @staticmethod
-    def __toVMDControlPoints(bezier):
-        p0, p1, p2, p3 = bezier.points
+        interpolation = self.__interpolation[:-1]
+        is_gap = x[1:] - x[:-1] > 2.5
+        m = is_gap & (interpolation == self.__CONSTANT)
+        result.append((x[1:][m]-0.5).astype(int))
 
-        dx, dy = p3 - p0
-        if abs(dy) < 1e-6 or abs(dx) < 1.5:
-            return ((20, 20), (107, 107))
+        m = is_gap & (interpolation == self.__BEZIER)
+        curves = _FnBezierArray.from_fcurve(co[:-1][m], self.__handle_right[:-1][m], self.__handle_left[1:][m], co[1:][m])
+        t = _FnBezierArray.find_critical(curves)
+        found = ~np.isnan(t)
+        points = _FnBezierArray.evaluate(curves[np.nonzero(found)[0]], t[found])
+        result.append((points[:, 0].astype(float)+0.5).astype(int))
 
-        x1, y1 = p1 - p0
-        x2, y2 = p2 - p0
-        x1 = max(0, min(127, int(0.5 + x1*127.0/dx)))
-        x2 = max(0, min(127, int(0.5 + x2*127.0/dx)))
-        y1 = max(0, min(127, int(0.5 + y1*127.0/dy)))
-        y2 = max(0, min(127, int(0.5 + y2*127.0/dy)))
-        return ((x1, y1), (x2, y2))
+        return np.unique(np.concatenate(result))
+
+    @staticmethod
+    def __toVMDControlPoints(curves):
+        p0 = curves[:, 0]
+        dx, dy = (curves[:, 3] - p0).astype(float).T
+        x1, y1 = (curves[:, 1] - p0).astype(float).T
+        x2, y2 = (curves[:, 2] - p0).astype(float).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            control_points = np.column_stack((x1*127.0/dx, y1*127.0/dy, x2*127.0/dx, y2*127.0/dy))
+        control_points = np.clip(np.trunc(0.5 + control_points), 0, 127)
+        control_points[(np.abs(dy) < 1e-6) | (np.abs(dx) < 1.5)] = (20, 20, 107, 107)
+        return control_points.astype(int) # (x1, y1, x2, y2)
 
     def sampleFrames(self, frame_numbers: List[int]):
         # assume set(frame_numbers) & set(self.frameNumbers()) == set(self.frameNumbers())
-        fcurve = self.__fcurve
-        if fcurve is None or len(fcurve.keyframe_points) == 0: # no key frames
+        co = self.__co
+        if co is None or len(co) == 0: # no key frames
             return [[self.__default_value, ((20, 20), (107, 107))] for _ in frame_numbers]
 
-        result = list()
-
-        evaluate = fcurve.evaluate
-        frame_iter = iter(frame_numbers)
-        prev_kp = None
-        prev_i = None
-        kp: bpy.types.Keyframe
-        for kp in self.__sorted_keyframe_points:
-            i = int(kp.co[0]+0.5)
-            if i == prev_i:
-                prev_kp = kp
-                continue
-            prev_i = i
-            frames = []
-            while True:
-                frame = next(frame_iter)
-                frames.append(frame)
-                if frame >= i:
-                    break
-            assert(len(frames) >= 1 and frames[-1] == i)
-            if prev_kp is None:
-                for f in frames: # starting key frames
-                    result.append([kp.co[1], ((20, 20), (107, 107))])
-            elif len(frames) == 1:
-                result.append([kp.co[1], self.getVMDControlPoints(prev_kp, kp)])
-            elif prev_kp.interpolation == 'BEZIER':
-                bz = _FnBezier.from_fcurve(prev_kp, kp)
-                for f in frames[:-1]:
-                    b1, bz, pt = bz.split_by_x(f)
-                    result.append([pt.y, self.__toVMDControlPoints(b1)])
-                result.append([bz.points[-1].y, self.__toVMDControlPoints(bz)])
-            else:
-                for f in frames:
-                    result.append([evaluate(f), ((20, 20), (107, 107))])
-            prev_kp = kp
-
-        prev_kp_co_1 = prev_kp.co[1]
-        result.extend([[prev_kp_co_1, ((20, 20), (107, 107))] for _ in frame_iter])
-        
-        return result
+        frames = np.asarray(frame_numbers)
+        key_frames = (co[:, 0].astype(float)+0.5).astype(int)
+        firsts = np.flatnonzero(np.concatenate(([True], key_frames[1:] != key_frames[:-1])))
+        lasts = np.append(firsts[1:]-1, len(co)-1) # the last key of the same frame is the start of the next segment
+        key_frames = key_frames[firsts]
+        ends = np.searchsorted(frames, key_frames)
+        assert(ends[-1] < len(frames) and np.array_equal(frames[ends], key_frames))
+
+        values = np.empty(len(frames))
+        control_points = np.empty((len(frames), 4), dtype=int)
+        control_points[:] = (20, 20, 107, 107)
+        values[:ends[0]+1] = co[firsts[0], 1] # starting key frames
+        values[ends[-1]+1:] = co[lasts[-1], 1]
+
+        # the segment ending at frames[ends[i]] contains the frames from frames[starts[i]]
+        kp0, kp1, starts, ends = lasts[:-1], firsts[1:], ends[:-1]+1, ends[1:]
+        counts = ends - starts + 1
+        values[ends] = co[kp1, 1]
+        is_bezier = self.__interpolation[kp0] == self.__BEZIER
+
+        m = is_bezier & (counts == 1)
+        curves = _FnBezierArray.from_fcurve(co[kp0[m]], self.__handle_right[kp0[m]], self.__handle_left[kp1[m]], co[kp1[m]])
+        control_points[ends[m]] = self.__toVMDControlPoints(curves)
+
+        m = is_bezier & (counts > 1)
+        curves = _FnBezierArray.from_fcurve(co[kp0[m]], self.__handle_right[kp0[m]], self.__handle_left[kp1[m]], co[kp1[m]])
+        split_starts, split_counts = starts[m], counts[m]-1
+        for i in range(split_counts.max(initial=0)):
+            active = split_counts > i
+            indices = split_starts[active] + i
+            active_curves, x = curves[active], frames[indices].astype(float)
+            t = _FnBezierArray.axis_to_t(active_curves, x)
+            # the Newton steps only recover the t missed by the precision errors of the cubic formula (NaN),
+            # the other t are not refined, so their control points are the same as before
+            missed = np.isnan(t)
+            if missed.any():
+                t[missed] = _FnBezierArray.axis_to_t(active_curves[missed], x[missed], newton_iterations=3)
+            left, curves[active], pt = _FnBezierArray.split(active_curves, t)
+            values[indices] = pt[:, 1]
+            control_points[indices] = self.__toVMDControlPoints(left)
+        control_points[ends[m]] = self.__toVMDControlPoints(curves)
+
+        evaluate = self.__fcurve.evaluate
+        m = ~is_bezier & (counts > 1)
+        for start, end in zip(starts[m].tolist(), ends[m].tolist()):
+            for i in range(start, end+1):
+                values[i] = evaluate(frame_numbers[i])
+
+        return [[v, ((x1, y1), (x2, y2))] for v, (x1, y1, x2, y2) in zip(values.tolist(), control_points.tolist())]
 
 
 class VMDExporter:
@@ -134,24 +142,22 @@ class VMDExporter:
         self.__ik_fcurves = {}
 
     def __allFrameKeys(self, curves: List[_FCurve]):
-        all_frames = set()
-        for i in curves:
-            all_frames |= i.frameNumbers()
+        all_frames = np.unique(np.concatenate([i.frameNumbers() for i in curves]))
 
         if len(all_frames) == 0:
             return
 
-        frame_start = min(all_frames)
+        frame_start = all_frames[0]
         if frame_start != self.__frame_start:
             frame_start = self.__frame_start
-            all_frames.add(frame_start)
+            all_frames = np.union1d(all_frames, [frame_start])
 
-        frame_end = max(all_frames)
+        frame_end = all_frames[-1]
         if frame_end > self.__frame_end:
             frame_end = self.__frame_end
-            all_frames.add(frame_end)
+            all_frames = np.union1d(all_frames, [frame_end])
 
-        all_frames = sorted(all_frames)
+        all_frames = all_frames.tolist()
         all_keys = [i.sampleFrames(all_frames) for i in curves]
         #return zip(all_frames, *all_keys)
         for data in zip(all_frames, *all_keys):
@@ -162,14 +168,6 @@ class VMDExporter:
                 break
             yield data
 
-    @staticmethod
-    def __minRotationDiff(prev_q, curr_q):
-        t1 = (prev_q.w - curr_q.w)**2 + (prev_q.x - curr_q.x)**2 + (prev_q.y - curr_q.y)**2 + (prev_q.z - curr_q.z)**2
-        t2 = (prev_q.w + curr_q.w)**2 + (prev_q.x + curr_q.x)**2 + (prev_q.y + curr_q.y)**2 + (prev_q.z + curr_q.z)**2
-        #t1 = prev_q.rotation_difference(curr_q).angle
-        #t2 = prev_q.rotation_difference(-curr_q).angle
-        return -curr_q if t2 < t1 else curr_q
-
     @staticmethod
     def __getVMDBoneInterpolation(x_axis, y_axis, z_axis, rotation):
         x_x1, x_y1 = x_axis[0]
@@ -203,17 +201,15 @@ class VMDExporter:
     @staticmethod
     def __xyzw_from_rotation_mode(mode):
         if mode == 'QUATERNION':
-            return lambda xyzw: xyzw
+            return lambda rw, rx, ry, rz: np.column_stack((rx, ry, rz, rw))
 
         if mode == 'AXIS_ANGLE':
-            def __xyzw_from_axis_angle(xyzw):
-                q = mathutils.Quaternion(xyzw[:3], xyzw[3])
-                return [q.x, q.y, q.z, q.w]
+            def __xyzw_from_axis_angle(rw, rx, ry, rz):
+                return _FnRotation.from_axis_angles(np.column_stack((rw, rx, ry, rz)))[:, [1, 2, 3, 0]]
             return __xyzw_from_axis_angle
 
-        def __xyzw_from_euler(xyzw):
-            q = mathutils.Euler(xyzw[:3], xyzw[3]).to_quaternion()
-            return [q.x, q.y, q.z, q.w]
+        def __xyzw_from_euler(rw, rx, ry, rz):
+            return _FnRotation.from_eulers(np.column_stack((rx, ry, rz)), mode)[:, [1, 2, 3, 0]]
         return __xyzw_from_euler
 
 
@@ -275,16 +271,16 @@ class VMDExporter:
 
             get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
             converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-            prev_rot = None
-            for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
+            all_frame_keys = list(self.__allFrameKeys(bone_curves))
+            x, y, z, rw, rx, ry, rz = ([data[i][0] for data in all_frame_keys] for i in range(1, 8))
+            locations = converter.convert_locations(np.column_stack((x, y, z)))
+            rotations = converter.convert_rotations(get_xyzw(rw, rx, ry, rz))
+            rotations = _FnRotation.compatible_quaternions(rotations)[:, [1, 2, 3, 0]] # (w, x, y, z) to (x, y, z, w)
+            for (frame_number, x, y, z, rw, rx, ry, rz), location, rotation in zip(all_frame_keys, locations.tolist(), rotations.tolist()):
                 key = vmd.BoneFrameKey()
                 key.frame_number = frame_number - self.__frame_start
-                key.location = converter.convert_location([x[0], y[0], z[0]])
-                curr_rot = converter.convert_rotation(get_xyzw([rx[0], ry[0], rz[0], rw[0]]))
-                if prev_rot is not None:
-                    curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                prev_rot = curr_rot
-                key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
+                key.location = location
+                key.rotation = rotation
                 #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
                 ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
                 ix, iy, iz = converter.convert_interpolation([x[1], y[1], z[1]])
@@ -6,11 +6,12 @@ from typing import Union
 
 import bpy
 import math
+import numpy as np
 from mathutils import Vector, Quaternion
 
 from mmd_tools import utils
 from mmd_tools.bpyutils import matmul
-from mmd_tools.core import vmd
+from mmd_tools.core import cache, vmd
 from mmd_tools.core.camera import MMDCamera
 from mmd_tools.core.lamp import MMDLamp
 
@@ -72,6 +73,197 @@ class _InterpolationHelper:
     def convert(self, interpolation_xyz):
         return (interpolation_xyz[i] for i in self.__indices)
 
+class _FnRotation:
+    """ Rotation functions of mathutils for arrays of rotations.
+
+    The quaternions are (N, 4) arrays of (w, x, y, z), the matrices are (N, 3, 3) arrays.
+    """
+
+    @staticmethod
+    def normalized(quats):
+        quats = np.array(quats, dtype=float)
+        length = np.linalg.norm(quats, axis=1)
+        valid = length != 0
+        quats[valid] /= length[valid, None]
+        quats[~valid] = (0, 1, 0, 0) # same as normalize_qt() of Blender
+        return quats
+
+    @staticmethod
+    def multiply(q0, q1):
+        w0, x0, y0, z0 = np.asarray(q0, dtype=float).T
+        w1, x1, y1, z1 = np.asarray(q1, dtype=float).T
+        return np.column_stack((
+            w0*w1 - x0*x1 - y0*y1 - z0*z1,
+            w0*x1 + x0*w1 + y0*z1 - z0*y1,
+            w0*y1 - x0*z1 + y0*w1 + z0*x1,
+            w0*z1 + x0*y1 - y0*x1 + z0*w1,
+            ))
+
+    @staticmethod
+    def to_matrices(quats):
+        """ Same as Quaternion.to_matrix(), the quaternions are not normalized.
+        """
+        w, x, y, z = np.asarray(quats, dtype=float).T * math.sqrt(2)
+        mats = np.empty((len(w), 3, 3))
+        mats[:, 0, 0] = 1.0 - y*y - z*z
+        mats[:, 0, 1] = x*y - w*z
+        mats[:, 0, 2] = x*z + w*y
+        mats[:, 1, 0] = x*y + w*z
+        mats[:, 1, 1] = 1.0 - x*x - z*z
+        mats[:, 1, 2] = y*z - w*x
+        mats[:, 2, 0] = x*z - w*y
+        mats[:, 2, 1] = y*z + w*x
+        mats[:, 2, 2] = 1.0 - x*x - y*y
+        return mats
+
+    @classmethod
+    def from_matrices(cls, mats):
+        """ Same as Matrix.to_quaternion(), the axes of the matrices are normalized.
+        """
+        mats = np.array(mats, dtype=float)
+        length = np.linalg.norm(mats, axis=1)
+        mats /= np.where(length != 0, length, 1)[:, None, :]
+        m00, m11, m22 = mats[:, 0, 0], mats[:, 1, 1], mats[:, 2, 2]
+        quats = np.empty((len(mats), 4))
+
+        tr = 0.25 * (1.0 + m00 + m11 + m22)
+        case_w = tr > 1e-4
+        case_x = ~case_w & (m00 > m11) & (m00 > m22)
+        case_y = ~case_w & ~case_x & (m11 > m22)
+        case_z = ~(case_w | case_x | case_y)
+        for case, i, j, k in ((case_x, 0, 1, 2), (case_y, 1, 2, 0), (case_z, 2, 0, 1)):
+            m = mats[case]
+            s = 2.0 * np.sqrt(1.0 + m[:, i, i] - m[:, j, j] - m[:, k, k])
+            q = quats[case]
+            q[:, 1+i] = 0.25 * s
+            q[:, 0] = (m[:, k, j] - m[:, j, k]) / s
+            q[:, 1+j] = (m[:, j, i] + m[:, i, j]) / s
+            q[:, 1+k] = (m[:, k, i] + m[:, i, k]) / s
+            quats[case] = q
+        m = mats[case_w]
+        s = np.sqrt(tr[case_w])
+        quats[case_w] = np.column_stack((s, m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]))
+        quats[case_w, 1:] /= 4.0 * s[:, None]
+        return cls.normalized(quats)
+
+    @staticmethod
+    def from_axis_angles(axis_angles):
+        """ Same as Quaternion(axis, angle) of (N, 4) arrays of (angle, x, y, z).
+        """
+        angle, axis = np.asarray(axis_angles, dtype=float)[:, 0], np.asarray(axis_angles, dtype=float)[:, 1:]
+        length = np.linalg.norm(axis, axis=1)
+        valid = length != 0
+        quats = np.zeros((len(angle), 4))
+        quats[:, 0] = 1
+        half = angle[valid] * 0.5
+        quats[valid, 0] = np.cos(half)
+        quats[valid, 1:] = axis[valid] / length[valid, None] * np.sin(half)[:, None]
+        return quats
+
+    @classmethod
+    def to_axis_angles(cls, quats):
+        """ Same as Quaternion.to_axis_angle(), returning (N, 4) arrays of (angle, x, y, z).
+        """
+        quats = cls.normalized(quats)
+        half = np.arccos(np.clip(quats[:, 0], -1, 1))
+        si = np.sin(half)
+        si[np.abs(si) < 0.0005] = 1
+        axis = quats[:, 1:] / si[:, None]
+        axis[~axis.any(axis=1)] = (0, 1, 0)
+        return np.column_stack((half * 2, axis))
+
+    @classmethod
+    def from_eulers(cls, eulers, order='XYZ'):
+        """ Same as Euler.to_quaternion() of (N, 3) arrays of euler angles in the rotation order.
+        """
+        half = np.asarray(eulers, dtype=float) * 0.5
+        quats = None
+        for axis in order:
+            i = 'XYZ'.index(axis)
+            q = np.zeros((len(half), 4))
+            q[:, 0], q[:, 1+i] = np.cos(half[:, i]), np.sin(half[:, i])
+            quats = q if quats is None else cls.multiply(q, quats)
+        return quats
+
+    @staticmethod
+    def __signs(dots):
+        # the sign of each item to flip it to the side of the flipped previous one,
+        # an item is not flipped if it is perpendicular to the previous one
+        parity = np.cumsum(dots < 0)
+        reset = np.maximum.accumulate(np.where(dots == 0, np.arange(len(dots)), -1))
+        parity -= np.where(reset < 0, 0, parity[np.maximum(reset, 0)])
+        return 1 - 2*(parity & 1)
+
+    @classmethod
+    def compatible_quaternions(cls, quats, prev=None):
+        """ Flip the signs of the quaternions, so that each one is the nearest to the previous one.
+
+        @param prev the quaternion (w, x, y, z) before the first one, or None
+        """
+        quats = np.array(quats, dtype=float)
+        if len(quats) == 0:
+            return quats
+        all_quats = quats if prev is None else np.concatenate(([tuple(prev)], quats))
+        dots = np.einsum('ij,ij->i', all_quats[:-1], all_quats[1:])
+        signs = cls.__signs(dots)
+        if prev is None:
+            quats[1:] *= signs[:, None]
+        else:
+            quats *= signs[:, None]
+        return quats
+
+    @classmethod
+    def compatible_axis_angles(cls, axis_angles, prev=None):
+        """ Flip the axes and shift the angles of (N, 4) arrays of (angle, x, y, z), so that each one is close to the previous one.
+
+        Same as the rule applied to each key from the previous flipped and shifted one:
+        the key is flipped if the dot product of the axes is negative, and its angle is
+        shifted by int(bias + diff/2pi)*2pi if the angle difference is over pi.
+
+        @param prev the axis angle (angle, x, y, z) before the first one, or None
+        """
+        axis_angles = np.array(axis_angles, dtype=float)
+        if len(axis_angles) == 0:
+            return axis_angles
+        all_axis_angles = axis_angles if prev is None else np.concatenate(([tuple(prev)], axis_angles))
+        p, c = all_axis_angles[:-1], all_axis_angles[1:]
+        dots = p[:, 1]*c[:, 1] + p[:, 2]*c[:, 2] + p[:, 3]*c[:, 3]
+        signs = cls.__signs(dots)
+        all_axis_angles[1:] *= signs[:, None]
+
+        pi_2 = math.pi * 2
+        def _steps(prev_angles, angles):
+            angle_diff = prev_angles - angles
+            steps = np.trunc(np.where(angle_diff < 0, -0.5, 0.5) + angle_diff/pi_2)
+            return np.where(np.abs(angle_diff) > math.pi, steps, 0).astype(int)
+        angles = all_axis_angles[:, 0]
+        # the shifts relative to the unshifted previous angles, then the steps are checked against
+        # the shifted previous angles and the first different one is fixed until they all match
+        shifts = np.concatenate(([0], np.cumsum(_steps(angles[:-1], angles[1:]))))
+        while True:
+            steps = _steps(angles[:-1] + shifts[:-1]*pi_2, angles[1:])
+            mismatched = np.flatnonzero(steps != shifts[1:])
+            if len(mismatched) == 0:
+                break
+            i = mismatched[0]
+            shifts[i+1:] += steps[i] - shifts[i+1]
+        all_axis_angles[:, 0] = angles + shifts*pi_2
+        return all_axis_angles if prev is None else all_axis_angles[1:]
+
+    @classmethod
+    def transform_axes(cls, quats, mat):
+        """ Same as Quaternion(mat @ q.axis * -1, q.angle) of each quaternion q.
+        """
+        quats = cls.normalized(quats)
+        axis = quats[:, 1:]
+        new_axis = axis @ -np.asarray(mat).T
+        length, new_length = np.linalg.norm(axis, axis=1), np.linalg.norm(new_axis, axis=1)
+        valid = new_length != 0
+        new_axis[valid] *= (length[valid] / new_length[valid])[:, None]
+        new_axis[~valid] = 0
+        return np.column_stack((quats[:, 0], new_axis))
+
+
 class BoneConverter:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.bone.matrix_local.to_3x3()
@@ -80,6 +272,7 @@ class BoneConverter:
         self.__scale = scale
         if invert:
             self.__mat.invert()
+        self.__mat_array = np.array(self.__mat)
         self.convert_interpolation = _InterpolationHelper(self.__mat).convert
 
     def convert_location(self, location):
@@ -90,6 +283,19 @@ class BoneConverter:
         rot.x, rot.y, rot.z, rot.w = rotation_xyzw
         return Quaternion(matmul(self.__mat, rot.axis) * -1, rot.angle).normalized()
 
+    def convert_locations(self, locations):
+        """ Convert (N, 3) locations at once, same as convert_location() does.
+        """
+        return np.asarray(locations, dtype=float).reshape(-1, 3) @ self.__mat_array.T * self.__scale
+
+    def convert_rotations(self, rotations_xyzw):
+        """ Convert (N, 4) rotations of (x, y, z, w) at once, same as convert_rotation() does.
+
+        @return (N, 4) array of (w, x, y, z)
+        """
+        rotations = np.asarray(rotations_xyzw, dtype=float).reshape(-1, 4)[:, [3, 0, 1, 2]]
+        return _FnRotation.normalized(_FnRotation.transform_axes(rotations, self.__mat_array))
+
 class BoneConverterPoseMode:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.matrix.to_3x3()
@@ -101,12 +307,20 @@ class BoneConverterPoseMode:
         self.__offset = pose_bone.location.copy()
         self.convert_location = self._convert_location
         self.convert_rotation = self._convert_rotation
+        self.convert_locations = self._convert_locations
+        self.convert_rotations = self._convert_rotations
         if invert:
             self.__mat.invert()
             self.__mat_rot.invert()
             self.__mat_loc.invert()
             self.convert_location = self._convert_location_inverted
             self.convert_rotation = self._convert_rotation_inverted
+            self.convert_locations = self._convert_locations_inverted
+            self.convert_rotations = self._convert_rotations_inverted
+        self.__mat_array = np.array(self.__mat)
+        self.__mat_rot_array = np.array(self.__mat_rot)
+        self.__mat_loc_array = np.array(self.__mat_loc)
+        self.__offset_array = np.array(self.__offset)
         self.convert_interpolation = _InterpolationHelper(self.__mat_loc).convert
 
     def _convert_location(self, location):
@@ -127,6 +341,24 @@ class BoneConverterPoseMode:
         rot = matmul(self.__mat_rot, rot.to_matrix()).to_quaternion()
         return Quaternion(matmul(self.__mat, rot.axis) * -1, rot.angle).normalized()
 
+    def _convert_locations(self, locations):
+        locations = np.asarray(locations, dtype=float).reshape(-1, 3)
+        return self.__offset_array + locations @ self.__mat_loc_array.T * self.__scale
+
+    def _convert_rotations(self, rotations_xyzw):
+        rotations = np.asarray(rotations_xyzw, dtype=float).reshape(-1, 4)[:, [3, 0, 1, 2]]
+        rotations = _FnRotation.transform_axes(rotations, self.__mat_array)
+        return _FnRotation.from_matrices(self.__mat_rot_array @ _FnRotation.to_matrices(rotations))
+
+    def _convert_locations_inverted(self, locations):
+        locations = np.asarray(locations, dtype=float).reshape(-1, 3)
+        return (locations - self.__offset_array) @ self.__mat_loc_array.T * self.__scale
+
+    def _convert_rotations_inverted(self, rotations_xyzw):
+        rotations = np.asarray(rotations_xyzw, dtype=float).reshape(-1, 4)[:, [3, 0, 1, 2]]
+        rotations = _FnRotation.from_matrices(self.__mat_rot_array @ _FnRotation.to_matrices(rotations))
+        return _FnRotation.normalized(_FnRotation.transform_axes(rotations, self.__mat_array))
+
 
 class _FnBezier:
 
@@ -252,14 +484,177 @@ class _FnBezier:
             if 0 <= t <= 1:
                 yield t
 
+class _FnBezierArray:
+    """ The functions of _FnBezier for many curves at once.
+
+    The curves are (M, 4, 2) float32 arrays of the control points (p0, p1, p2, p3).
+    The points are computed in float32 like the mathutils vectors of _FnBezier,
+    and the roots are solved in the same order, so the results are the same.
+    """
+
+    __BLENDER_2_91_OR_NEWER = not (bpy.app.version < (2, 91, 0))
+
+    @staticmethod
+    def __lerp(p0, p1, t): # (1-t)*p0 + t*p1
+        t = np.asarray(t, dtype=float)[:, None]
+        return p0 * (1-t).astype(np.float32) + p1 * t.astype(np.float32)
+
+    @classmethod
+    def from_fcurve(cls, co0, handle_right0, handle_left1, co1):
+        """ Same as _FnBezier.from_fcurve() of the keyframe pairs, each argument is a (M, 2) array.
+        """
+        curves = np.stack((co0, handle_right0, handle_left1, co1), axis=1).astype(np.float32)
+        x0, x1, x2, x3 = curves[:, :, 0].astype(float).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if cls.__BLENDER_2_91_OR_NEWER: # the F-Curve can become near-vertical
+                m = x1 > x3
+                t = (x3[m] - x0[m]) / (x1[m] - x0[m])
+                curves[m, 1] = cls.__lerp(curves[m, 0], curves[m, 1], t)
+                m = x0 > x2
+                t = (x3[m] - x0[m]) / (x3[m] - x2[m])
+                curves[m, 2] = cls.__lerp(curves[m, 3], curves[m, 2], t)
+            else: # legacy F-Curve correction
+                m = x1 > x2
+                t = (x3[m] - x0[m]) / (x1[m] - x0[m] + x3[m] - x2[m])
+                curves[m, 1] = cls.__lerp(curves[m, 0], curves[m, 1], t)
+                curves[m, 2] = cls.__lerp(curves[m, 3], curves[m, 2], t)
+        return curves
+
+    @classmethod
+    def split(cls, curves, t):
+        """ Split each curve at its t, returning the left curves, the right curves and the (M, 2) points at t.
+        """
+        p0, p1, p2, p3 = curves[:, 0], curves[:, 1], curves[:, 2], curves[:, 3]
+        p01t = cls.__lerp(p0, p1, t)
+        p12t = cls.__lerp(p1, p2, t)
+        p23t = cls.__lerp(p2, p3, t)
+        p012t = cls.__lerp(p01t, p12t, t)
+        p123t = cls.__lerp(p12t, p23t, t)
+        pt = cls.__lerp(p012t, p123t, t)
+        return np.stack((p0, p01t, p012t, pt), axis=1), np.stack((pt, p123t, p23t, p3), axis=1), pt
+
+    @classmethod
+    def evaluate(cls, curves, t):
+        return cls.split(curves, t)[2]
+
+    @classmethod
+    def split_by_x(cls, curves, x, newton_iterations=0):
+        return cls.split(curves, cls.axis_to_t(curves, x, newton_iterations=newton_iterations))
+
+    @classmethod
+    def evaluate_by_x(cls, curves, x, newton_iterations=0):
+        return cls.evaluate(curves, cls.axis_to_t(curves, x, newton_iterations=newton_iterations))
+
+    @classmethod
+    def axis_to_t(cls, curves, val, axis=0, newton_iterations=0):
+        """ The first t of each curve where the curve reaches val on the axis, or NaN if it is not found.
+
+        @param newton_iterations the number of Newton's steps to refine the t of the cubic formula.
+            The t missed by its precision errors (ex: t=0 and t=1) start from the chord, so they
+            are found too. The t is the same as _FnBezier.axis_to_t() if it is 0, otherwise the
+            refined t can differ from it by the precision errors. _FCurve.sampleFrames() of the
+            exporter calls it with 3 steps for the missed t only, keeping the others unrefined.
+        """
+        p0, p1, p2, p3 = curves[:, :, axis].astype(float).T
+        a = p3 - p0 + 3 * (p1 - p2)
+        b = 3 * (p0 - 2*p1 + p2)
+        c = 3 * (p1 - p0)
+        d = p0 - val
+        t = cls.first_roots(cls.find_roots(a, b, c, d))
+        if newton_iterations > 0:
+            t = cls.__refine_roots(a, b, c, d, t, newton_iterations)
+        return t
+
+    @staticmethod
+    def __refine_roots(a, b, c, d, t, iterations):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # start from the chord (t = -d / (a + b + c)) if the cubic formula found nothing
+            t = np.where(np.isnan(t), np.clip(np.nan_to_num(-d / (a + b + c)), 0, 1), t)
+            for _ in range(iterations):
+                f = ((a*t + b)*t + c)*t + d
+                df = (3*a*t + 2*b)*t + c
+                t = np.clip(t - np.where(df != 0, f / df, 0), 0, 1)
+        return t
+
+    @classmethod
+    def find_critical(cls, curves):
+        """ The t of the critical points of each curve on y axis, a (M, 2) array padded with NaN.
+        """
+        p0, p1, p2, p3 = curves[:, :, 1].astype(float).T
+        p_min, p_max = np.where(p0 < p3, p0, p3), np.where(p0 < p3, p3, p0)
+        a = 3 * (p3 - p0 + 3 * (p1 - p2))
+        b = 6 * (p0 - 2*p1 + p2)
+        c = 3 * (p1 - p0)
+        roots = cls.find_roots(np.zeros(len(curves)), a, b, c)[:, :2]
+        roots[~((p1 > p_max) | (p1 < p_min) | (p2 > p_max) | (p2 < p_min))] = np.nan
+        return roots
+
+    @staticmethod
+    def first_roots(roots):
+        """ The first root of each row of the roots, or NaN if there is none.
+        """
+        found = ~np.isnan(roots)
+        return roots[np.arange(len(roots)), found.argmax(axis=1)]
+
+    @staticmethod
+    def find_roots(a, b, c, d): # a*t*t*t + b*t*t + c*t + d = 0
+        """ The roots in [0, 1] of each cubic equation, a (M, 3) array padded with NaN.
+        """
+        def _sqrt3(v):
+            return np.where(v < 0, -((-v)**(1/3)), v**(1/3))
+
+        a, b, c, d = np.broadcast_arrays(*(np.asarray(i, dtype=float) for i in (a, b, c, d)))
+        roots = np.full((len(a), 3), np.nan)
+        with np.errstate(all='ignore'):
+            m = (a == 0) & (b == 0)
+            roots[m, 0] = -d[m]/c[m]
+
+            m = (a == 0) & (b != 0)
+            qb, qc, qd = b[m], c[m], d[m]
+            D = qc*qc - 4*qb*qd
+            D = np.where(D < 0, np.nan, D)**0.5
+            b2 = 2*qb
+            roots[m, 0] = (-qc + D)/b2
+            roots[m, 1] = (-qc - D)/b2
+
+            m = a != 0
+            a, b, c, d = a[m], b[m], c[m], d[m]
+            A = b*c/(6*a*a) - b*b*b/(27*a*a*a) - d/(2*a)
+            B = c/(3*a) - b*b/(9*a*a)
+            b_3a = -b/(3*a)
+            D = A*A + B*B*B
+            cubic_roots = np.full((len(a), 3), np.nan)
+
+            n = D > 0
+            D_sqrt = D[n]**0.5
+            cubic_roots[n, 0] = b_3a[n] + _sqrt3(A[n]+D_sqrt) + _sqrt3(A[n]-D_sqrt)
+
+            n = D == 0
+            cubic_roots[n, 0] = b_3a[n] + _sqrt3(A[n])*2
+            cubic_roots[n, 1] = b_3a[n] - _sqrt3(A[n])
+
+            n = D < 0
+            R = A[n] / (-B[n]*B[n]*B[n])**0.5
+            acos_R = np.arccos(R)
+            for i, offset in enumerate((0, 2*math.pi, -2*math.pi)):
+                cubic_roots[n, i] = b_3a[n] + 2*(-B[n])**0.5 * np.cos((acos_R + offset) / 3)
+            roots[m] = cubic_roots
+
+        roots[~((roots >= 0) & (roots <= 1))] = np.nan
+        return roots
+
 class HasAnimationData:
     animation_data: bpy.types.AnimData
 
 class VMDImporter:
     def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False,
             convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False, use_NLA=False):
-        self.__vmdFile = vmd.File()
-        self.__vmdFile.load(filepath=filepath)
+        model_cache = cache.from_preferences()
+        if model_cache:
+            self.__vmdFile = model_cache.load(vmd._loadFile, filepath)
+        else:
+            self.__vmdFile = vmd.File()
+            self.__vmdFile.load(filepath=filepath)
         logging.debug(str(self.__vmdFile.header))
         self.__scale = scale
         self.__convert_mmd_camera = convert_mmd_camera
@@ -271,14 +666,6 @@ class VMDImporter:
         self.__use_NLA = use_NLA
 
 
-    @staticmethod
-    def __minRotationDiff(prev_q, curr_q):
-        t1 = (prev_q.w - curr_q.w)**2 + (prev_q.x - curr_q.x)**2 + (prev_q.y - curr_q.y)**2 + (prev_q.z - curr_q.z)**2
-        t2 = (prev_q.w + curr_q.w)**2 + (prev_q.x + curr_q.x)**2 + (prev_q.y + curr_q.y)**2 + (prev_q.z + curr_q.z)**2
-        #t1 = prev_q.rotation_difference(curr_q).angle
-        #t2 = prev_q.rotation_difference(-curr_q).angle
-        return -curr_q if t2 < t1 else curr_q
-
     @staticmethod
     def __setInterpolation(bezier, kp0, kp1):
         if bezier[0] == bezier[1] and bezier[2] == bezier[3]:
@@ -300,6 +687,51 @@ class VMDImporter:
         kp.handle_right_type = 'FREE'
         kp.handle_right = kp.co + Vector((1, 0))
 
+    @staticmethod
+    def __setKeyframeEnums(keyframe_points, attr, identifiers, indices):
+        items = bpy.types.Keyframe.bl_rna.properties[attr].enum_items
+        try:
+            keyframe_points.foreach_set(attr, np.array([items[i].value for i in identifiers], dtype=np.int32)[indices])
+        except (TypeError, RuntimeError): # foreach_set() of enum properties is not supported by older versions
+            for kp, i in zip(keyframe_points, indices.tolist()):
+                setattr(kp, attr, identifiers[i])
+
+    @classmethod
+    def __setKeyframePoints(cls, keyframe_points, frames, values, bezier, default_value=None):
+        """ Add the keyframes of a channel with their handles at once, same as __setInterpolation() and __fixFcurveHandles() do.
+
+        @param keyframe_points the empty keyframe points of a F-Curve
+        @param frames the sorted frame numbers of the keys
+        @param values the values of the keys
+        @param bezier the VMD interpolation (x1, y1, x2, y2) of each key, which controls the segment ending at the key
+        @param default_value the value of an extra linear key at frame 1, or None
+        """
+        co = np.empty((len(frames), 2))
+        co[:, 0], co[:, 1] = frames, values
+        d = (co[1:] - co[:-1]) / 127.0
+        handle_left, handle_right = co.copy(), co.copy()
+        handle_right[:-1] += d * bezier[1:, 0:2]
+        handle_left[1:] = co[:-1] + d * bezier[1:, 2:4]
+        is_linear = np.zeros(len(co), dtype=bool)
+        is_linear[:-1] = (bezier[1:, 0] == bezier[1:, 1]) & (bezier[1:, 2] == bezier[1:, 3])
+
+        if default_value is not None:
+            co = np.concatenate(([(1, default_value)], co))
+            handle_left = np.concatenate((co[:1], handle_left))
+            handle_right = np.concatenate((co[:1], handle_right))
+            is_linear = np.concatenate(((True,), is_linear))
+        handle_left[0] = co[0] + (-1, 0)
+        handle_right[-1] = co[-1] + (1, 0)
+
+        keyframe_points.add(len(co))
+        keyframe_points.foreach_set('co', co.astype(np.float32).ravel())
+        keyframe_points.foreach_set('handle_left', handle_left.astype(np.float32).ravel())
+        keyframe_points.foreach_set('handle_right', handle_right.astype(np.float32).ravel())
+        cls.__setKeyframeEnums(keyframe_points, 'interpolation', ('BEZIER', 'LINEAR'), is_linear.astype(np.int32))
+        free_handles = np.zeros(len(co), dtype=np.int32)
+        cls.__setKeyframeEnums(keyframe_points, 'handle_left_type', ('FREE',), free_handles)
+        cls.__setKeyframeEnums(keyframe_points, 'handle_right_type', ('FREE',), free_handles)
+
     @staticmethod
     def __keyframe_insert_inner(fcurves: bpy.types.ActionFCurves, path: str, index: int, frame: float, value: float):
         fcurve = fcurves.find(path, index=index)
@@ -323,32 +755,30 @@ class VMDImporter:
     def __getBoneConverter(self, bone):
         converter = self.__bone_util_cls(bone, self.__scale)
         mode = bone.rotation_mode
-        compatible_quaternion = self.__minRotationDiff
         class _ConverterWrap:
-            convert_location = converter.convert_location
+            convert_locations = converter.convert_locations
             convert_interpolation = converter.convert_interpolation
             if mode == 'QUATERNION':
-                convert_rotation = converter.convert_rotation
-                compatible_rotation = compatible_quaternion
-            elif mode == 'AXIS_ANGLE':
                 @staticmethod
-                def convert_rotation(rot):
-                    (x, y, z), angle = converter.convert_rotation(rot).to_axis_angle()
-                    return (angle, x, y, z)
+                def convert_rotations(rotations, prev=None):
+                    return _FnRotation.compatible_quaternions(converter.convert_rotations(rotations), prev)
+            elif mode == 'AXIS_ANGLE':
                 @staticmethod
-                def compatible_rotation(prev, curr):
-                    angle, x, y, z = curr
-                    if prev[1]*x + prev[2]*y + prev[3]*z < 0:
-                        angle, x, y, z = -angle, -x, -y, -z
-                    angle_diff = prev[0] - angle
-                    if abs(angle_diff) > math.pi:
-                        pi_2 = math.pi * 2
-                        bias = -0.5 if angle_diff < 0 else 0.5
-                        angle += int(bias + angle_diff/pi_2) * pi_2
-                    return (angle, x, y, z)
+                def convert_rotations(rotations, prev=None):
+                    axis_angles = _FnRotation.to_axis_angles(converter.convert_rotations(rotations))
+                    return _FnRotation.compatible_axis_angles(axis_angles, prev)
             else:
-                convert_rotation = lambda rot: converter.convert_rotation(rot).to_euler(mode)
-                compatible_rotation = lambda prev, curr: curr.make_compatible(prev) or curr
+                @staticmethod
+                def convert_rotations(rotations, prev=None):
+                    # Euler.make_compatible() depends on the result of the previous one
+                    eulers = []
+                    for rot in converter.convert_rotations(rotations).tolist():
+                        curr = Quaternion(rot).to_euler(mode)
+                        if prev is not None:
+                            curr.make_compatible(prev)
+                        eulers.append(curr)
+                        prev = curr
+                    return np.array(eulers).reshape(-1, 3)
         return _ConverterWrap
 
     def __assign_action(self, target: Union[bpy.types.ID, HasAnimationData], action: bpy.types.Action):
@@ -382,10 +812,9 @@ class VMDImporter:
         _loc = _rot = lambda i: i
         if self.__mirror:
             pose_bones = _MirrorMapper(pose_bones)
-            _loc, _rot = _MirrorMapper.get_location, _MirrorMapper.get_rotation
+            _loc = lambda locations: np.column_stack(_MirrorMapper.get_location(locations.T))
+            _rot = lambda rotations: np.column_stack(_MirrorMapper.get_rotation(rotations.T))
 
-        class _Dummy: pass
-        dummy_keyframe_points = iter(lambda: _Dummy, None)
         prop_rot_map = {'QUATERNION':'rotation_quaternion', 'AXIS_ANGLE':'rotation_axis_angle'}
 
         bone_name_table = {}
@@ -401,59 +830,38 @@ class VMDImporter:
             assert(bone_name_table.get(bone.name, name) == name)
             bone_name_table[bone.name] = name
 
-            fcurves = [dummy_keyframe_points]*7 # x, y, z, r0, r1, r2, (r3)
+            fcurves = [] # x, y, z, r0, r1, r2, (r3)
             data_path_rot = prop_rot_map.get(bone.rotation_mode, 'rotation_euler')
             bone_rotation = getattr(bone, data_path_rot)
             default_values = list(bone.location) + list(bone_rotation)
             data_path = 'pose.bones["%s"].location'%bone.name
             for axis_i in range(3):
-                fcurves[axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
+                fcurves.append(action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name))
             data_path = 'pose.bones["%s"].%s'%(bone.name, data_path_rot)
             for axis_i in range(len(bone_rotation)):
-                fcurves[3+axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
-
-            for i in range(len(default_values)):
-                c = fcurves[i]
-                c.keyframe_points.add(extra_frame+num_frame)
-                kp_iter = iter(c.keyframe_points)
-                if extra_frame:
-                    kp = next(kp_iter)
-                    kp.co = (1, default_values[i])
-                    kp.interpolation = 'LINEAR'
-                fcurves[i] = kp_iter
+                fcurves.append(action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name))
 
             converter = self.__getBoneConverter(bone)
-            prev_rot = bone_rotation if extra_frame else None
-            prev_kps, indices = None, tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*len(bone_rotation)
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, x, y, z, r0, r1, r2, r3 in zip(keyFrames, *fcurves):
-                frame = k.frame_number + self.__frame_margin
-                loc = converter.convert_location(_loc(k.location))
-                curr_rot = converter.convert_rotation(_rot(k.rotation))
-                if prev_rot is not None:
-                    curr_rot = converter.compatible_rotation(prev_rot, curr_rot)
-                    #FIXME the rotation interpolation has slightly different result
-                    #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
-                    #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
-                prev_rot = curr_rot
-
-                x.co = (frame, loc[0])
-                y.co = (frame, loc[1])
-                z.co = (frame, loc[2])
-                r0.co = (frame, curr_rot[0])
-                r1.co = (frame, curr_rot[1])
-                r2.co = (frame, curr_rot[2])
-                r3.co = (frame, curr_rot[-1])
-
-                curr_kps = (x, y, z, r0, r1, r2, r3)
-                if prev_kps is not None:
-                    interp = k.interp
-                    for idx, prev_kp, kp in zip(indices, prev_kps, curr_kps):
-                        self.__setInterpolation(interp[idx:idx+16:4], prev_kp, kp)
-                prev_kps = curr_kps
-
-        for c in action.fcurves:
-            self.__fixFcurveHandles(c)
+            records = getattr(keyFrames, 'records', None)
+            if records is None:
+                records = vmd.BoneFrameKey.toRecords(keyFrames)
+            records = records[np.argsort(records['frame_number'], kind='stable')]
+
+            values = np.empty((num_frame, 7)) # x, y, z, r0, r1, r2, r3
+            values[:, :3] = converter.convert_locations(_loc(records['location']))
+            rotations = converter.convert_rotations(_rot(records['rotation']), bone_rotation if extra_frame else None)
+            #FIXME the rotation interpolation has slightly different result
+            #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
+            #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
+            #   (VMDEvaluator of vmd.evaluator gives the MMD result without Blender)
+            values[:, 3:6], values[:, 6] = rotations[:, :3], rotations[:, -1]
+
+            frames = records['frame_number'] + float(self.__frame_margin)
+            interp = records['interp']
+            indices = tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*len(bone_rotation)
+            for i, idx in enumerate(indices):
+                self.__setKeyframePoints(fcurves[i].keyframe_points, frames, values[:, i], interp[:, idx:idx+16:4],
+                    default_values[i] if extra_frame else None)
 
         # # ensure IK's default state
         # for b in armObj.pose.bones:
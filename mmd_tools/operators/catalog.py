@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import bpy
+from bpy.types import Operator
+
+from mmd_tools.bpyutils import addon_preferences
+from mmd_tools.core.catalog import Catalog
+
+
+def open_catalog():
+    """ Open the catalog database of the add-on preferences.
+    """
+    db_path = bpy.path.abspath(addon_preferences('catalog_file', ''))
+    if not db_path:
+        db_path = os.path.join(bpy.utils.user_resource('CONFIG', create=True), 'mmd_tools_catalog.sqlite3')
+    return Catalog(db_path)
+
+def _split_names(text):
+    return [n.strip() for n in text.split(',') if n.strip()]
+
+
+class ScanCatalog(Operator):
+    bl_idname = 'mmd_tools.catalog_scan'
+    bl_label = 'Scan Library'
+    bl_description = 'Add the pmx and vmd files of the library folder to the asset catalog, only new or modified files are read'
+    bl_options = {'REGISTER', 'INTERNAL'}
+
+    def execute(self, context):
+        folder = bpy.path.abspath(context.window_manager.mmd_catalog.library_folder)
+        if not os.path.isdir(folder):
+            self.report({'ERROR'}, 'Library folder "%s" does not exist'%folder)
+            return {'CANCELLED'}
+        with open_catalog() as catalog:
+            result = catalog.scan([folder])
+        self.report({'INFO'}, 'Scanned library: %d added, %d updated, %d removed, %d unchanged, %d failed'%result)
+        return {'FINISHED'}
+
+class SearchCatalog(Operator):
+    bl_idname = 'mmd_tools.catalog_search'
+    bl_label = 'Search Catalog'
+    bl_description = 'Search the asset catalog'
+    bl_options = {'REGISTER', 'INTERNAL'}
+
+    limit: bpy.props.IntProperty(
+        name='Limit',
+        description='The maximum number of results',
+        min=1,
+        default=500,
+        options={'SKIP_SAVE'},
+        )
+
+    def execute(self, context):
+        mmd_catalog = context.window_manager.mmd_catalog
+        with open_catalog() as catalog:
+            entries = catalog.query(
+                name=mmd_catalog.search_name.strip(),
+                file_type=None if mmd_catalog.file_type == 'ALL' else mmd_catalog.file_type.lower(),
+                bones=_split_names(mmd_catalog.search_bones),
+                morphs=_split_names(mmd_catalog.search_morphs),
+                min_bones=mmd_catalog.min_bones or None,
+                min_length=mmd_catalog.min_length or None,
+                max_length=mmd_catalog.max_length or None,
+                limit=self.limit,
+                )
+
+        results = mmd_catalog.results
+        results.clear()
+        for entry in entries:
+            item = results.add()
+            item.name = entry.name or os.path.basename(entry.path)
+            item.name_e = entry.name_e
+            item.filepath = entry.path
+            item.file_type = entry.file_type
+            item.bone_count = entry.bone_count
+            item.morph_count = entry.morph_count
+            item.motion_length = entry.motion_length
+        mmd_catalog.active_result_index = 0
+        self.report({'INFO'}, '%d files found'%len(entries))
+        return {'FINISHED'}
+
+class ImportCatalogItem(Operator):
+    bl_idname = 'mmd_tools.catalog_import'
+    bl_label = 'Import'
+    bl_description = 'Import the active search result (a motion is imported to the selected objects)'
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        mmd_catalog = context.window_manager.mmd_catalog
+        return 0 <= mmd_catalog.active_result_index < len(mmd_catalog.results)
+
+    def execute(self, context):
+        mmd_catalog = context.window_manager.mmd_catalog
+        item = mmd_catalog.results[mmd_catalog.active_result_index]
+        if not os.path.isfile(item.filepath):
+            self.report({'ERROR'}, 'File "%s" does not exist, scan the library again'%item.filepath)
+            return {'CANCELLED'}
+        if item.file_type == 'vmd':
+            if not context.selected_objects:
+                self.report({'ERROR'}, 'Select the objects to import the motion to')
+                return {'CANCELLED'}
+            directory, name = os.path.split(item.filepath)
+            return bpy.ops.mmd_tools.import_vmd('EXEC_DEFAULT', directory=directory, files=[{'name': name}])
+        return bpy.ops.mmd_tools.import_model('EXEC_DEFAULT', filepath=item.filepath)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import bpy
+from bpy.types import Panel, UIList
+
+
+class MMD_TOOLS_UL_CatalogItems(UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        if self.layout_type in {'DEFAULT'}:
+            row = layout.row(align=True)
+            row.label(text=item.name, translate=False, icon='OUTLINER_OB_ARMATURE' if item.file_type == 'pmx' else 'ANIM')
+            if item.file_type == 'pmx':
+                row.label(text='%d bones, %d morphs'%(item.bone_count, item.morph_count), translate=False)
+            else:
+                row.label(text='%d frames'%item.motion_length, translate=False)
+        elif self.layout_type in {'COMPACT'}:
+            pass
+        elif self.layout_type in {'GRID'}:
+            layout.alignment = 'CENTER'
+            layout.label(text="", icon_value=icon)
+
+class MMDCatalogPanel(Panel):
+    bl_idname = 'OBJECT_PT_mmd_tools_catalog'
+    bl_label = 'Asset Catalog'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'MMD'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        mmd_catalog = context.window_manager.mmd_catalog
+        layout = self.layout
+
+        row = layout.row(align=True)
+        row.prop(mmd_catalog, 'library_folder', text='')
+        row.operator('mmd_tools.catalog_scan', text='', icon='FILE_REFRESH')
+
+        col = layout.column(align=True)
+        col.row(align=True).prop(mmd_catalog, 'file_type', expand=True)
+        col.prop(mmd_catalog, 'search_name')
+        col.prop(mmd_catalog, 'search_bones')
+        col.prop(mmd_catalog, 'search_morphs')
+        col.prop(mmd_catalog, 'min_bones')
+        row = col.row(align=True)
+        row.prop(mmd_catalog, 'min_length')
+        row.prop(mmd_catalog, 'max_length')
+        layout.operator('mmd_tools.catalog_search', icon='VIEWZOOM')
+
+        layout.template_list('MMD_TOOLS_UL_CatalogItems', '',
+                             mmd_catalog, 'results',
+                             mmd_catalog, 'active_result_index')
+        if 0 <= mmd_catalog.active_result_index < len(mmd_catalog.results):
+            item = mmd_catalog.results[mmd_catalog.active_result_index]
+            col = layout.column(align=True)
+            col.label(text=item.filepath, translate=False, icon='FILE')
+            if item.name_e:
+                col.label(text=item.name_e, translate=False)
+        layout.operator('mmd_tools.catalog_import', icon='IMPORT')
@@ -39,6 +39,27 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
         subtype='DIR_PATH',
         default=os.path.dirname(__file__),
     )
+    model_cache_folder: bpy.props.StringProperty(
+        name='Model Cache Folder',
+        description='Path for caching the parsed pmx and vmd files to import them faster again. Leave empty to disable the cache',
+        subtype='DIR_PATH',
+    )
+    model_cache_size: bpy.props.IntProperty(
+        name='Model Cache Size (MB)',
+        description='The least recently used files are removed from the model cache when it is larger than this size',
+        min=1,
+        default=1024,
+    )
+    model_cache_use_hash: bpy.props.BoolProperty(
+        name='Hash Cached Files',
+        description='Check the content of the files as well as their size and modification time before using the model cache (slower)',
+        default=False,
+    )
+    catalog_file: bpy.props.StringProperty(
+        name='Asset Catalog File',
+        description='Path of the database file of the asset catalog. Leave empty to use mmd_tools_catalog.sqlite3 in the Blender config folder',
+        subtype='FILE_PATH',
+    )
 
     # for add-on updater
     updater_branch_to_update: bpy.props.EnumProperty(
@@ -54,6 +75,14 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "base_texture_folder")
         layout.prop(self, "dictionary_folder")
 
+        cache_col = layout.column()
+        cache_col.prop(self, "model_cache_folder")
+        row = cache_col.row()
+        row.enabled = bool(self.model_cache_folder)
+        row.prop(self, "model_cache_size")
+        row.prop(self, "model_cache_use_hash")
+        layout.prop(self, "catalog_file")
+
         # add-on updater
         update_col = layout.box().column(align=False)
         update_col.label(text='Add-on update', icon='RECOVER_LAST')
@@ -5,6 +5,7 @@ import logging
 import bpy
 from mmd_tools.properties.bone import MMDBone, _mmd_ik_toggle_update
 from mmd_tools.properties.camera import MMDCamera
+from mmd_tools.properties.catalog import MMDCatalog
 from mmd_tools.properties.material import MMDMaterial
 from mmd_tools.properties.rigid_body import MMDJoint, MMDRigidBody
 from mmd_tools.properties.root import MMDRoot
@@ -53,7 +54,10 @@ __properties = {
             update=_mmd_ik_toggle_update,
             default=True,
         ),
-    }
+    },
+    bpy.types.WindowManager: {
+        'mmd_catalog': bpy.props.PointerProperty(type=MMDCatalog),
+    },
 }
 
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import bpy
+
+
+class MMDCatalogItem(bpy.types.PropertyGroup):
+    """ A search result of the asset catalog
+    """
+    filepath: bpy.props.StringProperty(
+        name='File Path',
+        subtype='FILE_PATH',
+    )
+
+    file_type: bpy.props.StringProperty(
+        name='File Type',
+    )
+
+    name_e: bpy.props.StringProperty(
+        name='Name(Eng)',
+    )
+
+    bone_count: bpy.props.IntProperty(
+        name='Bones',
+    )
+
+    morph_count: bpy.props.IntProperty(
+        name='Morphs',
+    )
+
+    motion_length: bpy.props.IntProperty(
+        name='Motion Length',
+    )
+
+
+class MMDCatalog(bpy.types.PropertyGroup):
+    """ The search of the asset catalog (see mmd_tools.core.catalog)
+    """
+    library_folder: bpy.props.StringProperty(
+        name='Library Folder',
+        description='The folder of pmx and vmd files to add to the catalog',
+        subtype='DIR_PATH',
+    )
+
+    search_name: bpy.props.StringProperty(
+        name='Name',
+        description='A part of the model name, the target model name of a motion, or the file name',
+    )
+
+    search_bones: bpy.props.StringProperty(
+        name='Bones',
+        description='Comma separated bone names which the files must have (the animated bones of a motion)',
+    )
+
+    search_morphs: bpy.props.StringProperty(
+        name='Morphs',
+        description='Comma separated morph names which the files must have (the animated morphs of a motion)',
+    )
+
+    file_type: bpy.props.EnumProperty(
+        name='File Type',
+        description='Search models, motions or both',
+        items=[
+            ('ALL', 'All', 'Search models and motions', 0),
+            ('PMX', 'Models', 'Search pmx models', 1),
+            ('VMD', 'Motions', 'Search vmd motions', 2),
+        ],
+        default='ALL',
+    )
+
+    min_bones: bpy.props.IntProperty(
+        name='Min Bones',
+        description='The minimum number of bones (0 for any)',
+        min=0,
+        default=0,
+    )
+
+    min_length: bpy.props.IntProperty(
+        name='Min Length',
+        description='The minimum motion length in frames (0 for any)',
+        min=0,
+        default=0,
+    )
+
+    max_length: bpy.props.IntProperty(
+        name='Max Length',
+        description='The maximum motion length in frames (0 for any)',
+        min=0,
+        default=0,
+    )
+
+    results: bpy.props.CollectionProperty(
+        name='Results',
+        type=MMDCatalogItem,
+    )
+
+    active_result_index: bpy.props.IntProperty(
+        name='Active Result',
+        min=0,
+        default=0,
+    )
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Small pmx and vmd files shared by the tests.
+
+The test scripts add their folder to sys.path to import this module, since
+Blender does not when it runs them with --python.
+"""
+
+from mmd_tools.core import pmx, vmd
+
+
+def make_pmx_model(name, bone_names, morph_names=(), name_e=None, with_mesh=False):
+    """ A model of a chain of bones.
+
+    @param bone_names the names of the bones from the root, or the number of bones named 'bone%d'
+    @param morph_names the names of the (empty) bone morphs
+    @param name_e the English name, the same as name if None
+    @param with_mesh add a triangle of 3 vertices weighted to the first bone and its material
+    """
+    if isinstance(bone_names, int):
+        bone_names = ['bone%d'%i for i in range(bone_names)]
+    model = pmx.Model()
+    model.name, model.name_e = name, name if name_e is None else name_e
+    if with_mesh:
+        for i in range(3):
+            v = pmx.Vertex()
+            v.co, v.normal, v.uv = [float(i), 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0]
+            v.weight = pmx.BoneWeight()
+            v.weight.type, v.weight.bones, v.weight.weights = pmx.BoneWeight.BDEF1, [0], [1.0]
+            model.vertices.append(v)
+        model.faces.append([0, 1, 2])
+        mat = pmx.Material()
+        mat.name = mat.name_e = 'mat'
+        mat.diffuse, mat.specular, mat.ambient, mat.edge_color = [1.0]*4, [0.0]*3, [0.5]*3, [0.0]*4
+        mat.vertex_count = 3
+        model.materials.append(mat)
+    for i, bone_name in enumerate(bone_names):
+        b = pmx.Bone()
+        b.name = b.name_e = bone_name
+        b.location = (0.0, float(i), 0.0)
+        b.parent = i - 1
+        model.bones.append(b)
+    for morph_name in morph_names:
+        model.morphs.append(pmx.BoneMorph(name=morph_name, name_e=morph_name, category=pmx.Morph.CATEGORY_OHTER))
+    return model
+
+def make_pmx_file(path, name, bone_names, **kwargs):
+    """ Save a model of make_pmx_model() to path and return the path.
+    """
+    pmx.save(path, make_pmx_model(name, bone_names, **kwargs))
+    return path
+
+def make_vmd_file(path, bone_names=('bone',), frame_numbers=range(10), model_name=''):
+    """ Save a motion which has a key of each bone at each frame to path and return the path.
+    """
+    vmd_file = vmd.File()
+    vmd_file.header = vmd.Header()
+    vmd_file.header.model_name = model_name
+    vmd_file.boneAnimation = vmd.BoneAnimation()
+    for bone_name in bone_names:
+        for frame_number in frame_numbers:
+            k = vmd.BoneFrameKey()
+            k.frame_number, k.location, k.rotation, k.interp = frame_number, [0.0, 1.0, 2.0], [0.0, 0.0, 0.0, 1.0], [20]*64
+            vmd_file.boneAnimation[bone_name].append(k)
+    vmd_file.save(filepath=path)
+    return path
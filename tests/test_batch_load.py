@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import os
+import sys
+import unittest
+
+from mmd_tools.core import batch, pmx, vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+
+from synthetic_files import make_pmx_file, make_vmd_file
+
+def _load_or_exit(path):
+    # a loader which kills its worker process, like a crash of the interpreter
+    if path.endswith('_crash.pmx'):
+        os._exit(1)
+    return pmx.load(path)
+
+class TestBatchLoad(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __make_pmx_files(self, count):
+        return [make_pmx_file(self.__output_path('batch_load_%d.pmx'%i), 'model%d'%i, i + 1) for i in range(count)]
+
+    def __make_invalid_file(self):
+        path = self.__output_path('batch_load_invalid.pmx')
+        with open(path, 'wb') as f:
+            f.write(b'not a model'*8)
+        return path
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_load_many_pmx(self):
+        paths = self.__make_pmx_files(4)
+        paths.insert(2, self.__make_invalid_file())
+        paths.append(self.__output_path('batch_load_missing.pmx'))
+        for workers in (1, 2):
+            results = pmx.load_many(paths, workers=workers)
+            self.assertEqual([r.path for r in results], paths)
+            self.assertEqual([r.error is None for r in results], [True, True, False, True, True, False])
+            self.assertIsInstance(results[2].error, pmx.InvalidFileError)
+            self.assertIsInstance(results[-1].error, FileNotFoundError)
+            self.assertIn('InvalidFileError', results[2].traceback)
+            models = [r.data for r in results if r.error is None]
+            self.assertEqual([m.name for m in models], ['model0', 'model1', 'model2', 'model3'])
+            self.assertEqual([len(m.bones) for m in models], [1, 2, 3, 4])
+
+    def test_load_many_crashed_worker(self):
+        paths = self.__make_pmx_files(6)
+        crash_path = self.__output_path('batch_load_crash.pmx')
+        for positions in ((2,), (0, 5), (0, 1, 2)):
+            crash_paths = list(paths)
+            for i in positions:
+                crash_paths.insert(i, crash_path)
+            results = batch.load_many(_load_or_exit, crash_paths, workers=2)
+            self.assertEqual([r.path for r in results], crash_paths)
+            self.assertEqual([r.error is None for r in results], [p != crash_path for p in crash_paths])
+            for r in results:
+                if r.error is not None:
+                    self.assertIsInstance(r.error, concurrent.futures.process.BrokenProcessPool)
+            self.assertEqual([r.data.name for r in results if r.error is None], ['model%d'%i for i in range(6)])
+
+    def test_load_many_vmd(self):
+        paths = [make_vmd_file(self.__output_path('batch_load.vmd')), self.__make_invalid_file()]
+        results = vmd.load_many(paths, workers=2)
+        self.assertIsNone(results[0].error)
+        self.assertEqual(len(results[0].data.boneAnimation['bone']), 10)
+        self.assertIsInstance(results[1].error, vmd.InvalidFileError)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
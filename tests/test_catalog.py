@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import unittest
+
+from mmd_tools.core.catalog import Catalog
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+
+from synthetic_files import make_pmx_file, make_vmd_file
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+        self.__library = self.__output_path('catalog_library')
+        shutil.rmtree(self.__library, ignore_errors=True)
+        os.makedirs(os.path.join(self.__library, 'motions'))
+        self.__db_path = self.__output_path('catalog.sqlite3')
+        if os.path.exists(self.__db_path):
+            os.remove(self.__db_path)
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __make_pmx_file(self, name, bone_names, morph_names):
+        path = os.path.join(self.__library, name + '.pmx')
+        return make_pmx_file(path, name, bone_names, morph_names=morph_names, name_e=name + '_e')
+
+    def __make_vmd_file(self, name, model_name, bone_names, last_frame):
+        path = os.path.join(self.__library, 'motions', name + '.vmd')
+        return make_vmd_file(path, bone_names, (0, last_frame), model_name)
+
+    def __paths(self, entries):
+        return [os.path.basename(e.path) for e in entries]
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_scan_and_query(self):
+        self.__make_pmx_file('alice', ['センター', '上半身', '首', '頭'], ['あ', 'まばたき'])
+        self.__make_pmx_file('bob', ['センター', '上半身'], ['あ'])
+        self.__make_vmd_file('dance', 'alice', ['センター', '上半身'], 1200)
+        self.__make_vmd_file('walk', 'bob', ['センター'], 60)
+        with open(os.path.join(self.__library, 'broken.pmx'), 'wb') as f:
+            f.write(b'not a model'*8)
+
+        with Catalog(self.__db_path) as catalog:
+            result = catalog.scan([self.__library], workers=1)
+            self.assertEqual(result, (5, 0, 0, 0, 1))
+
+            self.assertEqual(self.__paths(catalog.query()), ['alice.pmx', 'bob.pmx', 'dance.vmd', 'walk.vmd'])
+            self.assertEqual(self.__paths(catalog.query(include_errors=True))[2], 'broken.pmx')
+            self.assertEqual(self.__paths(catalog.query(name='ALICE')), ['alice.pmx', 'dance.vmd'])
+            self.assertEqual(self.__paths(catalog.query(name='walk')), ['walk.vmd'])
+            self.assertEqual(self.__paths(catalog.query(name='%')), [])
+            self.assertEqual(self.__paths(catalog.query(file_type='pmx', min_bones=3)), ['alice.pmx'])
+            self.assertEqual(self.__paths(catalog.query(morphs=['あ', 'まばたき'])), ['alice.pmx'])
+            self.assertEqual(self.__paths(catalog.query(bones='上半身')), ['alice.pmx', 'bob.pmx', 'dance.vmd'])
+            self.assertEqual(self.__paths(catalog.query(file_type='vmd', min_length=100)), ['dance.vmd'])
+            self.assertEqual(self.__paths(catalog.query(max_length=100, limit=1)), ['alice.pmx'])
+
+            entry = catalog.entry(os.path.join(self.__library, 'alice.pmx'))
+            self.assertEqual((entry.file_type, entry.name, entry.name_e, entry.bone_count, entry.morph_count), ('pmx', 'alice', 'alice_e', 4, 2))
+            entry = catalog.entry(os.path.join(self.__library, 'motions', 'dance.vmd'))
+            self.assertEqual((entry.name, entry.bone_count, entry.bone_key_count, entry.motion_length), ('alice', 2, 4, 1200))
+            self.assertEqual(catalog.boneNames(entry.path), sorted(['センター', '上半身']))
+            self.assertIsNotNone(catalog.entry(os.path.join(self.__library, 'broken.pmx')).error)
+
+    def test_scan_truncated_file(self):
+        alice = self.__make_pmx_file('alice', ['センター', '上半身', '首', '頭'], ['あ', 'まばたき'])
+        with open(alice, 'rb') as f:
+            data = f.read()
+        # cut in the middle of the bones and at the count of the joints (the last 4 bytes)
+        bone_offset = data.index('上半身'.encode('utf-16-le'))
+        for name, size in (('bones', bone_offset + 2), ('joints', len(data) - 4)):
+            with open(os.path.join(self.__library, name + '.pmx'), 'wb') as f:
+                f.write(data[:size])
+
+        with Catalog(self.__db_path) as catalog:
+            self.assertEqual(catalog.scan([self.__library], workers=1), (3, 0, 0, 0, 2))
+            self.assertEqual(self.__paths(catalog.query()), ['alice.pmx'])
+            for name in ('bones', 'joints'):
+                entry = catalog.entry(os.path.join(self.__library, name + '.pmx'))
+                self.assertIn(name, entry.error)
+                self.assertEqual(entry.bone_count, 0)
+                self.assertEqual(catalog.boneNames(entry.path), [])
+
+    def test_rescan(self):
+        alice = self.__make_pmx_file('alice', ['センター'], [])
+        bob = self.__make_pmx_file('bob', ['センター'], [])
+        walk = self.__make_vmd_file('walk', 'bob', ['センター'], 60)
+        with Catalog(self.__db_path) as catalog:
+            self.assertEqual(catalog.scan([self.__library], workers=1), (3, 0, 0, 0, 0))
+            self.assertEqual(catalog.scan([self.__library], workers=1), (0, 0, 0, 3, 0))
+
+        self.__make_pmx_file('alice', ['センター', '上半身'], [])
+        stat = os.stat(alice)
+        os.utime(alice, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        os.remove(bob)
+        self.__make_pmx_file('carol', ['センター'], [])
+        with Catalog(self.__db_path) as catalog:
+            self.assertEqual(catalog.scan([self.__library], workers=1), (1, 1, 1, 1, 0))
+            self.assertEqual(self.__paths(catalog.query()), ['alice.pmx', 'carol.pmx', 'walk.vmd'])
+            self.assertEqual(catalog.boneNames(alice), sorted(['センター', '上半身']))
+            self.assertEqual(catalog.boneNames(bob), [])
+
+            # the files of other folders are kept
+            self.assertEqual(catalog.scan([os.path.dirname(walk)], workers=1), (0, 0, 0, 1, 0))
+            self.assertEqual(len(catalog), 3)
+
+    def test_rescan_missing_folder(self):
+        self.__make_pmx_file('alice', ['センター'], [])
+        self.__make_vmd_file('walk', 'alice', ['センター'], 60)
+        moved_library = self.__library + '_moved'
+        shutil.rmtree(moved_library, ignore_errors=True)
+        with Catalog(self.__db_path) as catalog:
+            self.assertEqual(catalog.scan([self.__library], workers=1), (2, 0, 0, 0, 0))
+
+            # the files of a folder which can not be read are kept, e.g. an unmounted drive
+            os.rename(self.__library, moved_library)
+            try:
+                self.assertEqual(catalog.scan([self.__library], workers=1), (0, 0, 0, 0, 0))
+                self.assertEqual(self.__paths(catalog.query()), ['alice.pmx', 'walk.vmd'])
+            finally:
+                os.rename(moved_library, self.__library)
+            self.assertEqual(catalog.scan([self.__library], workers=1), (0, 0, 0, 2, 0))
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
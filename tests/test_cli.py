@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+from mmd_tools import cli
+from mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+
+from synthetic_files import make_pmx_model
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __make_model(self):
+        return make_pmx_model('cli', 2, with_mesh=True)
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_validate_model(self):
+        model = self.__make_model()
+        self.assertEqual(cli.validate_model(model), [])
+
+        model.faces[0] = [0, 1, 3]
+        model.bones[1].parent = 5
+        model.materials[0].texture = 2
+        problems = cli.validate_model(model)
+        self.assertEqual(len(problems), 3, problems)
+        self.assertTrue(problems[0].startswith('faces: 1 vertex indices'))
+        self.assertTrue(problems[1].startswith('materials[0]: texture 2'))
+        self.assertTrue(problems[2].startswith('bones[1]: parent 5'))
+
+    def test_stats_and_validate(self):
+        valid_path = self.__output_path('cli_valid.pmx')
+        pmx.save(valid_path, self.__make_model())
+        invalid_path = self.__output_path('cli_invalid.pmx')
+        model = self.__make_model()
+        model.materials[0].vertex_count = 6
+        pmx.save(invalid_path, model)
+
+        stats = cli.section_stats(valid_path)
+        self.assertEqual(stats['name'], 'cli')
+        self.assertEqual((stats['vertices'], stats['faces'], stats['materials'], stats['bones']), (3, 1, 1, 2))
+        self.assertEqual(stats['faces_bytes'], 4 + 3)
+
+        self.assertEqual(cli.validate_file(valid_path), [])
+        self.assertEqual(len(cli.validate_file(invalid_path)), 1)
+        self.assertEqual(cli.main(['validate', '-j', '1', valid_path]), 0)
+        self.assertEqual(cli.main(['validate', '-j', '1', valid_path, invalid_path]), 1)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import unittest
+
+import mmd_tools
+
+PACKAGE_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(mmd_tools.__file__)))
+
+class TestCoreImport(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_import_without_bpy(self):
+        # the file format modules are used in plain Python, e.g. by the workers of load_many()
+        code = '\n'.join((
+            'import sys',
+            'from mmd_tools.core import batch, cache, catalog, pmd, pmx, vmd, vpd',
+            'from mmd_tools.core.pmx.skeleton import SkeletonSolver',
+            'from mmd_tools.core.vmd.evaluator import VMDEvaluator',
+            'print(sorted(name for name in ("bpy", "mathutils", "mmd_tools.addon") if name in sys.modules))',
+            ))
+        env = dict(os.environ, PYTHONPATH=PACKAGE_PARENT_DIR)
+        output = subprocess.check_output([sys.executable, '-c', code], env=env, cwd=PACKAGE_PARENT_DIR)
+        self.assertEqual(output.decode().strip(), '[]')
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import unittest
+
+from mmd_tools.core import pmx, vmd
+from mmd_tools.core.cache import ModelCache
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+
+from synthetic_files import make_pmx_file, make_vmd_file
+
+class TestModelCache(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+        self.__cache_dir = self.__output_path('model_cache')
+        shutil.rmtree(self.__cache_dir, ignore_errors=True)
+        self.__load_count = 0
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __make_pmx_file(self, name, num_bones):
+        return make_pmx_file(self.__output_path(name + '.pmx'), name, num_bones)
+
+    def __counting_load(self, load_func):
+        def _load(path, **kwargs):
+            self.__load_count += 1
+            return load_func(path, **kwargs)
+        _load.__module__, _load.__qualname__ = load_func.__module__, load_func.__qualname__
+        return _load
+
+    def __set_mtime(self, path, mtime_ns):
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_hit_and_invalidation(self):
+        path = self.__make_pmx_file('cache_model', 3)
+        cache = ModelCache(self.__cache_dir)
+        load = self.__counting_load(pmx.load)
+
+        model = cache.load(load, path, sections=['bones'])
+        self.assertEqual(len(model.bones), 3)
+        self.assertEqual(len(cache.entries()), 1)
+
+        model = cache.load(load, path, sections=['bones'])
+        self.assertEqual(self.__load_count, 1)
+        self.assertEqual([b.name for b in model.bones], ['bone0', 'bone1', 'bone2'])
+        self.assertIn('vertices', model.raw_sections)
+
+        # other arguments are cached separately
+        cache.load(load, path)
+        self.assertEqual(self.__load_count, 2)
+
+        # a modified file is loaded again
+        self.__make_pmx_file('cache_model', 4)
+        self.__set_mtime(path, os.stat(path).st_mtime_ns + 10**9)
+        model = cache.load(load, path, sections=['bones'])
+        self.assertEqual(self.__load_count, 3)
+        self.assertEqual(len(model.bones), 4)
+
+    def test_content_hash(self):
+        path = self.__make_pmx_file('cache_hash', 3)
+        mtime_ns = os.stat(path).st_mtime_ns
+        load = self.__counting_load(pmx.load)
+        for use_hash in (False, True):
+            shutil.rmtree(self.__cache_dir, ignore_errors=True)
+            self.__make_pmx_file('cache_hash', 3)
+            self.__set_mtime(path, mtime_ns)
+            cache = ModelCache(self.__cache_dir, use_hash=use_hash)
+            cache.load(load, path)
+            # a change of the content which keeps the size and modification time
+            model = pmx.load(path)
+            model.bones[0].name = 'BONE0'
+            pmx.save(path, model)
+            self.__set_mtime(path, mtime_ns)
+            model = cache.load(load, path)
+            self.assertEqual(model.bones[0].name, 'BONE0' if use_hash else 'bone0')
+
+    def test_eviction(self):
+        paths = [self.__make_pmx_file('cache_lru_%d'%i, 20) for i in range(4)]
+        cache = ModelCache(self.__cache_dir)
+        for path in paths[:3]:
+            cache.load(pmx.load, path)
+        entry_paths = [cache._ModelCache__entryPath(cache.key(pmx.load, p)) for p in paths]
+        cache.max_size = cache.size()
+        # the timestamps of files are too coarse to order the entries written in a test
+        for entry_path, seconds in zip(entry_paths, (1, 3, 2)):
+            self.__set_mtime(entry_path, seconds*10**9)
+
+        cache.load(pmx.load, paths[0]) # a hit makes it the most recently used
+        self.assertGreater(os.stat(entry_paths[0]).st_mtime_ns, 3*10**9)
+        self.__set_mtime(entry_paths[0], 4*10**9)
+
+        cache.load(pmx.load, paths[3])
+        self.assertEqual([e[0] for e in cache.entries()], [entry_paths[1], entry_paths[0], entry_paths[3]])
+        self.assertLessEqual(cache.size(), cache.max_size)
+
+        cache.clear()
+        self.assertEqual(cache.entries(), [])
+
+    def test_invalid_entry(self):
+        path = self.__make_pmx_file('cache_invalid', 2)
+        cache = ModelCache(self.__cache_dir)
+        cache.load(pmx.load, path)
+        entry_path = cache.entries()[0][0]
+        with open(entry_path, 'wb') as f:
+            f.write(b'broken')
+        load = self.__counting_load(pmx.load)
+        model = cache.load(load, path)
+        self.assertEqual(self.__load_count, 1)
+        self.assertEqual(len(model.bones), 2)
+        self.assertIsNotNone(cache.get(cache.key(pmx.load, path)))
+
+    def test_vmd(self):
+        path = make_vmd_file(self.__output_path('cache_motion.vmd'), frame_numbers=range(5))
+
+        cache = ModelCache(self.__cache_dir)
+        load = self.__counting_load(vmd._loadFile)
+        for _ in range(2):
+            motion = cache.load(load, path)
+            self.assertEqual([k.frame_number for k in motion.boneAnimation['bone']], list(range(5)))
+        self.assertEqual(self.__load_count, 1)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
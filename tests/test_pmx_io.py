@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'samples')
+
+class TestPmxIO(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __read_bytes(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def __save_unbuffered(self, path, model, add_uv_count):
+        with pmx.FileWriteStream(path) as fs:
+            header = pmx.Header(model)
+            header.additional_uvs = add_uv_count
+            header.save(fs)
+            fs.setHeader(header)
+            model.save(fs)
+
+    def __make_model(self):
+        model = pmx.Model()
+        model.name = model.name_e = 'test'
+        model.comment = model.comment_e = 'comment'
+
+        weights = [
+            (pmx.BoneWeight.BDEF1, [0], None),
+            (pmx.BoneWeight.BDEF2, [0, 1], [0.25]),
+            (pmx.BoneWeight.BDEF4, [0, 1, 2, 3], [0.4, 0.3, 0.2, 0.1]),
+            (pmx.BoneWeight.SDEF, [1, 2], pmx.BoneWeightSDEF(0.75, (0.1, 0.2, 0.3), (0.4, 0.5, 0.6), (0.7, 0.8, 0.9))),
+            ]
+        for i in range(300):
+            v = pmx.Vertex()
+            v.co = (i*0.5, i*0.25, -i*0.125)
+            v.normal = (0.0, 1.0, 0.0)
+            v.uv = (i/300.0, 1.0 - i/300.0)
+            v.additional_uvs = [(0.5, 0.25, i*0.125, 1.0)]
+            w = v.weight = pmx.BoneWeight()
+            w.type, w.bones, w.weights = weights[i%4]
+            v.edge_scale = 0.5
+            model.vertices.append(v)
+        model.faces = [(i, i+1, i+2) for i in range(0, 297, 3)]
+
+        mat = pmx.Material()
+        mat.name = mat.name_e = 'material'
+        mat.diffuse, mat.specular, mat.ambient, mat.edge_color = (1.0, 1.0, 1.0, 1.0), (0.5, 0.5, 0.5), (0.25, 0.25, 0.25), (0.0, 0.0, 0.0, 1.0)
+        mat.vertex_count = len(model.faces)*3
+        model.materials.append(mat)
+
+        for i in range(4):
+            b = pmx.Bone()
+            b.name = b.name_e = 'bone%d'%i
+            b.location = (0.0, i*1.0, 0.0)
+            b.parent = i - 1
+            if i == 3:
+                b.isIK = True
+                b.target = 2
+                link = pmx.IKLink()
+                link.target = 1
+                link.minimumAngle, link.maximumAngle = [-3.14, 0, 0], [-0.01, 0, 0]
+                b.ik_links.append(link)
+            model.bones.append(b)
+
+        vertex_morph = pmx.VertexMorph('vertex', 'vertex', 1)
+        uv_morph = pmx.UVMorph('uv', 'uv', 4, type_index=4)
+        for i in range(0, 300, 7):
+            offset = pmx.VertexMorphOffset()
+            offset.index, offset.offset = i, (0.5, -0.5, 0.25)
+            vertex_morph.offsets.append(offset)
+            offset = pmx.UVMorphOffset()
+            offset.index, offset.offset = i, (0.5, -0.5, 0.25, 0.0)
+            uv_morph.offsets.append(offset)
+        bone_morph = pmx.BoneMorph('bone', 'bone', 4)
+        offset = pmx.BoneMorphOffset()
+        offset.index, offset.location_offset, offset.rotation_offset = 1, (0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0)
+        bone_morph.offsets.append(offset)
+        group_morph = pmx.GroupMorph('group', 'group', 4)
+        offset = pmx.GroupMorphOffset()
+        offset.morph, offset.factor = 0, 0.5
+        group_morph.offsets.append(offset)
+        model.morphs.extend((vertex_morph, uv_morph, bone_morph, group_morph))
+
+        rigid = pmx.Rigid()
+        rigid.name = rigid.name_e = 'rigid'
+        rigid.bone = 0
+        rigid.size, rigid.location, rigid.rotation = (1.0, 1.0, 1.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)
+        rigid.velocity_attenuation = rigid.rotation_attenuation = rigid.bounce = rigid.friction = 0.5
+        model.rigids.append(rigid)
+        return model
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_buffered_writer(self):
+        model = self.__make_model()
+        output_buffered = self.__output_path('pmx_io_buffered.pmx')
+        output_unbuffered = self.__output_path('pmx_io_unbuffered.pmx')
+        pmx.save(output_buffered, model, add_uv_count=1)
+        self.__save_unbuffered(output_unbuffered, model, 1)
+        self.assertEqual(self.__read_bytes(output_buffered), self.__read_bytes(output_unbuffered))
+
+    def test_round_trip(self):
+        source_pmx = self.__output_path('pmx_io_source.pmx')
+        pmx.save(source_pmx, self.__make_model(), add_uv_count=1)
+        source_bytes = self.__read_bytes(source_pmx)
+
+        output_pmx = self.__output_path('pmx_io_output.pmx')
+        for kwargs in ({}, {'columnar':True}, {'use_mmap':True}, {'sections':('bones', 'morphs')}):
+            model = pmx.load(source_pmx, **kwargs)
+            pmx.save(output_pmx, model, add_uv_count=1)
+            self.assertEqual(source_bytes, self.__read_bytes(output_pmx), 'load options: %s'%str(kwargs))
+
+            # the objects are used instead of the arrays once they are created
+            model = pmx.load(source_pmx, **kwargs)
+            model.vertices[:]
+            for m in model.morphs:
+                m.offsets[:]
+            pmx.save(output_pmx, model, add_uv_count=1)
+            self.assertEqual(source_bytes, self.__read_bytes(output_pmx), 'load options: %s'%str(kwargs))
+
+    def test_vertex_arrays_from_vertices(self):
+        model = self.__make_model()
+        source_pmx = self.__output_path('pmx_io_source_arrays.pmx')
+        pmx.save(source_pmx, model, add_uv_count=1)
+        loaded_arrays = pmx.load(source_pmx).vertices.arrays
+
+        arrays = pmx.VertexArrays.fromVertices(model.vertices)
+        self.assertEqual(len(arrays), len(loaded_arrays))
+        for name in ('co', 'normal', 'uv', 'additional_uvs', 'weight_type', 'bones', 'weights', 'sdef_c', 'sdef_r0', 'sdef_r1', 'edge_scale'):
+            self.assertEqual(getattr(arrays, name).tolist(), getattr(loaded_arrays, name).tolist(), name)
+        self.assertEqual(pmx.VertexArrays.fromVertices([], 2).additional_uvs.shape, (0, 2, 4))
+
+    def test_round_trip_modified(self):
+        source_pmx = self.__output_path('pmx_io_source_modified.pmx')
+        pmx.save(source_pmx, self.__make_model(), add_uv_count=1)
+
+        model = pmx.load(source_pmx, columnar=True)
+        model.vertices[1].co = (1.0, 2.0, 3.0)
+        model.morphs[0].offsets[0].offset = (4.0, 5.0, 6.0)
+        del model.faces[0]
+        output_pmx = self.__output_path('pmx_io_output_modified.pmx')
+        pmx.save(output_pmx, model, add_uv_count=1)
+
+        result_model = pmx.load(output_pmx)
+        self.assertEqual(result_model.vertices[1].co, (1.0, 2.0, 3.0))
+        self.assertEqual(result_model.morphs[0].offsets[0].offset, (4.0, 5.0, 6.0))
+        self.assertEqual(len(result_model.faces), len(model.faces))
+
+    def test_writers_samples(self):
+        input_files = []
+        for root, dirs, files in os.walk(os.path.join(SAMPLES_DIR, 'pmx')):
+            input_files.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pmx'))
+        if len(input_files) < 1:
+            self.fail('required pmx sample file(s)!')
+
+        output_buffered = self.__output_path('pmx_io_sample_buffered.pmx')
+        output_unbuffered = self.__output_path('pmx_io_sample_unbuffered.pmx')
+        for filepath in input_files:
+            model = pmx.load(filepath)
+            add_uv_count = model.header.additional_uvs
+            pmx.save(output_buffered, model, add_uv_count=add_uv_count)
+            model = pmx.load(filepath, columnar=True)
+            self.__save_unbuffered(output_unbuffered, model, add_uv_count)
+            self.assertEqual(self.__read_bytes(output_buffered), self.__read_bytes(output_unbuffered), filepath)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import math
+import unittest
+
+import numpy as np
+
+from mmd_tools.core import pmx, vmd
+from mmd_tools.core.pmx.skeleton import SkeletonSolver
+from mmd_tools.core.vmd.evaluator import VMDEvaluator
+
+class TestPmxSkeleton(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __bone(self, name, location, parent):
+        b = pmx.Bone()
+        b.name = b.name_e = name
+        b.location = location
+        b.parent = parent
+        return b
+
+    def __make_bones(self):
+        bones = [
+            self.__bone('root', (0.0, 0.0, 0.0), -1),
+            self.__bone('hip', (0.0, 10.0, 0.0), 0),
+            self.__bone('knee', (0.0, 5.0, 0.0), 1),
+            self.__bone('ankle', (0.0, 0.0, 0.0), 2),
+            self.__bone('leg IK', (0.0, 0.0, 0.0), 0),
+            self.__bone('twist', (0.0, 10.0, 1.0), 0),
+            ]
+        ik = bones[4]
+        ik.isIK, ik.target, ik.loopCount, ik.rotationConstraint = True, 3, 40, 2.0
+        knee_link, hip_link = pmx.IKLink(), pmx.IKLink()
+        knee_link.target = 2
+        knee_link.minimumAngle, knee_link.maximumAngle = [-math.pi, 0.0, 0.0], [-0.0087, 0.0, 0.0]
+        hip_link.target = 1
+        ik.ik_links = [knee_link, hip_link]
+
+        twist = bones[5]
+        twist.hasAdditionalRotate, twist.hasAdditionalLocation = True, True
+        twist.additionalTransform = (1, 0.5)
+        return bones
+
+    def __pose(self, bones, num_frames):
+        locations = np.zeros((num_frames, len(bones), 3))
+        rotations = np.zeros((num_frames, len(bones), 4))
+        rotations[..., 3] = 1.0
+        return locations, rotations
+
+    def __z_rotation(self, angle):
+        return (0.0, 0.0, math.sin(angle/2), math.cos(angle/2))
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_rest_pose(self):
+        bones = self.__make_bones()
+        matrices = SkeletonSolver(bones).solve(*self.__pose(bones, 3), use_ik=False)
+        self.assertEqual(matrices.shape, (3, len(bones), 4, 4))
+        np.testing.assert_allclose(matrices[:, :, :3, 3], np.broadcast_to([b.location for b in bones], (3, len(bones), 3)), atol=1e-9)
+        np.testing.assert_allclose(matrices[:, :, :3, :3], np.broadcast_to(np.identity(3), (3, len(bones), 3, 3)), atol=1e-9)
+
+        # the limit of the knee bends the leg a little, the ankle stays at the IK bone
+        matrices = SkeletonSolver(bones).solve(*self.__pose(bones, 3))
+        np.testing.assert_allclose(matrices[:, 3, :3, 3], 0.0, atol=1e-3)
+        self.assertTrue((matrices[:, 2, 2, 3] < 0).all())
+
+    def test_forward_kinematics(self):
+        bones = self.__make_bones()
+        locations, rotations = self.__pose(bones, 2)
+        locations[:, 0] = (1.0, 0.0, 0.0)
+        rotations[1, 1] = self.__z_rotation(math.pi/2)
+        matrices = SkeletonSolver(bones).solve(locations, rotations, use_ik=False)
+        positions = matrices[:, :, :3, 3]
+        np.testing.assert_allclose(positions[0, 3], (1.0, 0.0, 0.0), atol=1e-9)
+        # the leg is rotated 90 degrees around the hip
+        np.testing.assert_allclose(positions[1, 2], (6.0, 10.0, 0.0), atol=1e-9)
+        np.testing.assert_allclose(positions[1, 3], (11.0, 10.0, 0.0), atol=1e-9)
+
+    def test_append(self):
+        bones = self.__make_bones()
+        locations, rotations = self.__pose(bones, 1)
+        locations[0, 1] = (0.0, 2.0, 0.0)
+        rotations[0, 1] = self.__z_rotation(math.pi/2)
+        matrices = SkeletonSolver(bones).solve(locations, rotations, use_ik=False)
+        twist = matrices[0, 5]
+        np.testing.assert_allclose(twist[:3, :3], [[math.sqrt(0.5), -math.sqrt(0.5), 0], [math.sqrt(0.5), math.sqrt(0.5), 0], [0, 0, 1]], atol=1e-9)
+        np.testing.assert_allclose(twist[:3, 3], (0.0, 11.0, 1.0), atol=1e-9)
+
+        matrices = SkeletonSolver(bones).solve(locations, rotations, use_append=False, use_ik=False)
+        np.testing.assert_allclose(matrices[0, 5, :3, :3], np.identity(3), atol=1e-9)
+
+    def test_ik(self):
+        bones = self.__make_bones()
+        locations, rotations = self.__pose(bones, 3)
+        locations[0, 4] = (0.0, 2.0, 0.0)
+        locations[1, 4] = (0.0, 3.0, 2.0)
+        locations[2, 4] = (0.0, -10.0, 0.0) # out of reach
+        matrices = SkeletonSolver(bones).solve(locations, rotations)
+        positions = matrices[:, :, :3, 3]
+        np.testing.assert_allclose(positions[:2, 3], locations[:2, 4], atol=1e-3)
+        for f in range(3):
+            # the hip and the knee keep their lengths, the knee only bends backwards on X
+            self.assertAlmostEqual(np.linalg.norm(positions[f, 2] - positions[f, 1]), 5.0, places=6)
+            self.assertAlmostEqual(np.linalg.norm(positions[f, 3] - positions[f, 2]), 5.0, places=6)
+            knee = matrices[f, 2, :3, :3].T @ matrices[f, 3, :3, 3] - matrices[f, 2, :3, :3].T @ matrices[f, 2, :3, 3]
+            self.assertAlmostEqual(knee[0], 0.0, places=6)
+            self.assertGreaterEqual(knee[2], -1e-6)
+        np.testing.assert_allclose(positions[2, 3], (0.0, 0.0, 0.0), atol=0.1)
+
+        matrices = SkeletonSolver(bones).solve(locations, rotations, use_ik=False)
+        np.testing.assert_allclose(matrices[:, 3, :3, 3], 0.0, atol=1e-9)
+
+    def test_solve_motion(self):
+        bones = self.__make_bones()
+        vmd_file = vmd.File()
+        vmd_file.boneAnimation = vmd.BoneAnimation()
+        for frame_number, angle in ((0, 0.0), (10, math.pi/2)):
+            k = vmd.BoneFrameKey()
+            k.frame_number, k.location, k.rotation = frame_number, [0.0, 0.0, 0.0], list(self.__z_rotation(angle))
+            k.interp = ([20]*4 + [20]*4 + [107]*4 + [107]*4) * 4
+            vmd_file.boneAnimation['hip'].append(k)
+        matrices = SkeletonSolver(bones).solveMotion(VMDEvaluator(vmd_file), [0, 5, 10], use_ik=False)
+        positions = matrices[:, 3, :3, 3]
+        for angle, position in zip((0.0, math.pi/4, math.pi/2), positions):
+            np.testing.assert_allclose(position, (10*math.sin(angle), 10 - 10*math.cos(angle), 0.0), atol=1e-5)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
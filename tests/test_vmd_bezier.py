@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+import numpy as np
+
+from mathutils import Vector
+from mmd_tools.core.vmd.importer import _FnBezier, _FnBezierArray
+
+class _Keyframe:
+    def __init__(self, co, handle_left, handle_right):
+        self.co = Vector(co)
+        self.handle_left = Vector(handle_left)
+        self.handle_right = Vector(handle_right)
+
+class TestVmdBezier(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __make_keyframe_pairs(self, count, seed=0):
+        rand = random.Random(seed)
+        pairs = []
+        for i in range(count):
+            x0, y0 = rand.uniform(-10, 10), rand.uniform(-5, 5)
+            x1, y1 = x0 + rand.choice((1, 2, 3.5, 10, 60)), rand.uniform(-5, 5)
+            if i % 3 == 0: # VMD-like curves, the handles are inside the segment
+                handle_right = (x0 + rand.uniform(0, x1 - x0), y0 + rand.uniform(-2, 2))
+                handle_left = (x0 + rand.uniform(0, x1 - x0), y1 + rand.uniform(-2, 2))
+            else: # the handles can be out of the segment
+                handle_right = (x0 + rand.uniform(0, 2*(x1 - x0)), y0 + rand.uniform(-8, 8))
+                handle_left = (x1 - rand.uniform(0, 2*(x1 - x0)), y1 + rand.uniform(-8, 8))
+            kp0 = _Keyframe((x0, y0), (x0 - 1, y0), handle_right)
+            kp1 = _Keyframe((x1, y1), handle_left, (x1 + 1, y1))
+            pairs.append((kp0, kp1))
+        return pairs
+
+    def __make_curves(self, pairs):
+        scalar_curves = [_FnBezier.from_fcurve(kp0, kp1) for kp0, kp1 in pairs]
+        curves = _FnBezierArray.from_fcurve(
+            [kp0.co for kp0, kp1 in pairs], [kp0.handle_right for kp0, kp1 in pairs],
+            [kp1.handle_left for kp0, kp1 in pairs], [kp1.co for kp0, kp1 in pairs],
+            )
+        return scalar_curves, curves
+
+    def __assert_points(self, scalar_points, points, msg=None):
+        np.testing.assert_allclose(np.array([tuple(p) for p in scalar_points]), points, rtol=1e-6, atol=1e-6, err_msg=msg or '')
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_from_fcurve(self):
+        scalar_curves, curves = self.__make_curves(self.__make_keyframe_pairs(300))
+        self.assertEqual(curves.shape, (300, 4, 2))
+        for i in range(4):
+            self.__assert_points([bz.points[i] for bz in scalar_curves], curves[:, i], 'point %d'%i)
+
+    def test_evaluate_and_split(self):
+        scalar_curves, curves = self.__make_curves(self.__make_keyframe_pairs(300, seed=1))
+        rand = random.Random(1)
+        t = [rand.random() for _ in scalar_curves]
+        self.__assert_points([bz.evaluate(i) for bz, i in zip(scalar_curves, t)], _FnBezierArray.evaluate(curves, t))
+
+        left, right, pt = _FnBezierArray.split(curves, t)
+        scalar_results = [bz.split(i) for bz, i in zip(scalar_curves, t)]
+        self.__assert_points([r[2] for r in scalar_results], pt)
+        for i in range(4):
+            self.__assert_points([r[0].points[i] for r in scalar_results], left[:, i], 'left point %d'%i)
+            self.__assert_points([r[1].points[i] for r in scalar_results], right[:, i], 'right point %d'%i)
+
+    def test_axis_to_t(self):
+        scalar_curves, curves = self.__make_curves(self.__make_keyframe_pairs(300, seed=2))
+        rand = random.Random(2)
+        x = [rand.uniform(bz.points[0].x, bz.points[3].x) for bz in scalar_curves]
+
+        scalar_t = []
+        for bz, val in zip(scalar_curves, x):
+            try:
+                scalar_t.append(bz.axis_to_t(val))
+            except (StopIteration, ValueError, ZeroDivisionError): # missed by the precision errors
+                scalar_t.append(float('nan'))
+        t = _FnBezierArray.axis_to_t(curves, x)
+        np.testing.assert_allclose(scalar_t, t, rtol=0, atol=1e-9)
+
+        # the refined t reaches x, and it is found even if the cubic formula misses it
+        refined_t = _FnBezierArray.axis_to_t(curves, x, newton_iterations=8)
+        self.assertFalse(np.isnan(refined_t).any())
+        np.testing.assert_allclose(refined_t[~np.isnan(t)], t[~np.isnan(t)], rtol=0, atol=1e-6)
+        np.testing.assert_allclose(_FnBezierArray.evaluate_by_x(curves, x, newton_iterations=8)[:, 0], x, rtol=0, atol=1e-3)
+
+        scalar_results = [bz.split_by_x(val) for bz, val, i in zip(scalar_curves, x, t) if not np.isnan(i)]
+        left, right, pt = _FnBezierArray.split_by_x(curves[~np.isnan(t)], np.array(x)[~np.isnan(t)])
+        self.__assert_points([r[2] for r in scalar_results], pt)
+        self.__assert_points([r[1].points[1] for r in scalar_results], right[:, 1])
+
+    def test_find_critical(self):
+        scalar_curves, curves = self.__make_curves(self.__make_keyframe_pairs(300, seed=3))
+        roots = _FnBezierArray.find_critical(curves)
+        self.assertEqual(roots.shape, (300, 2))
+        for bz, r in zip(scalar_curves, roots):
+            scalar_roots = list(bz.find_critical())
+            self.assertEqual(len(scalar_roots), np.count_nonzero(~np.isnan(r)))
+            np.testing.assert_allclose(scalar_roots, r[~np.isnan(r)], rtol=0, atol=1e-9)
+
+    def test_find_roots(self):
+        # a*t*t*t + b*t*t + c*t + d = 0, including the linear and the quadratic equations
+        equations = [(0, 0, 2, -1), (0, 1, 0, -0.25), (0, 1, -1, 0.25), (1, -1.5, 0.5, 0), (4, -6, 3, -0.5), (1, 0, 0, 2)]
+        roots = _FnBezierArray.find_roots(*np.array(equations).T)
+        self.assertEqual(roots.shape, (len(equations), 3))
+        for (a, b, c, d), r in zip(equations, roots):
+            r = r[~np.isnan(r)]
+            for t in r:
+                self.assertTrue(0 <= t <= 1)
+                self.assertAlmostEqual(((a*t + b)*t + c)*t + d, 0, places=6)
+        self.assertTrue(np.isnan(roots[-1]).all())
+        self.assertAlmostEqual(_FnBezierArray.first_roots(roots)[0], 0.5)
+
+    def test_sample_frames_control_points(self):
+        import bpy
+        from mmd_tools.core.vmd.exporter import _FCurve
+
+        rand = random.Random(4)
+        action = bpy.data.actions.new(name='test_vmd_bezier')
+        fcurve = action.fcurves.new(data_path='location', index=0)
+        frames = [0, 1, 10, 25, 60, 64, 100]
+        fcurve.keyframe_points.add(len(frames))
+        for kp, frame in zip(fcurve.keyframe_points, frames):
+            kp.interpolation = 'BEZIER'
+            kp.handle_left_type = kp.handle_right_type = 'FREE'
+            kp.co = (frame, rand.uniform(-5, 5))
+        kps = list(fcurve.keyframe_points)
+        for kp0, kp1 in zip(kps[:-1], kps[1:]): # VMD-like curves, the handles are inside the segment
+            x0, x1 = kp0.co.x, kp1.co.x
+            kp0.handle_right = (x0 + rand.uniform(0, x1 - x0), kp0.co.y + rand.uniform(-2, 2))
+            kp1.handle_left = (x0 + rand.uniform(0, x1 - x0), kp1.co.y + rand.uniform(-2, 2))
+        kps[0].handle_left, kps[-1].handle_right = kps[0].co - Vector((1, 0)), kps[-1].co + Vector((1, 0))
+
+        # the control points of each frame split by _FnBezier, as the former exporter did
+        to_vmd_control_points = _FCurve._FCurve__toVMDControlPoints
+        expected = [(kps[0].co.y, [20, 20, 107, 107])]
+        for kp0, kp1 in zip(kps[:-1], kps[1:]):
+            bz = _FnBezier.from_fcurve(kp0, kp1)
+            for f in range(int(kp0.co.x) + 1, int(kp1.co.x)):
+                b1, bz, pt = bz.split_by_x(f)
+                expected.append((pt.y, to_vmd_control_points(np.array([[tuple(p) for p in b1.points]], dtype=np.float32))[0].tolist()))
+            expected.append((kp1.co.y, to_vmd_control_points(np.array([[tuple(p) for p in bz.points]], dtype=np.float32))[0].tolist()))
+
+        curve = _FCurve(0.0)
+        curve.setFCurve(fcurve)
+        keys = curve.sampleFrames(list(range(0, 101)))
+        bpy.data.actions.remove(action)
+
+        self.assertEqual([list(sum(interp, ())) for v, interp in keys], [cp for v, cp in expected])
+        np.testing.assert_allclose([v for v, interp in keys], [v for v, cp in expected], rtol=0, atol=1e-5)
+
+    def test_sample_frames_long_steep_segment(self):
+        import bpy
+        from mmd_tools.core.vmd.exporter import _FCurve
+
+        action = bpy.data.actions.new(name='test_vmd_bezier')
+        fcurve = action.fcurves.new(data_path='location', index=0)
+        # (co, handle_left, handle_right), the handles are almost vertical at both ends of the long segments
+        keyframes = [
+            ((0, 0), (-1, 0), (0.001, 1000)),
+            ((3000, 1), (2999.999, -1000), (3000.001, 5000)),
+            ((9000, -1000), (8999.999, 1e6), (9001, -1000)),
+            ]
+        fcurve.keyframe_points.add(len(keyframes))
+        for kp, (co, handle_left, handle_right) in zip(fcurve.keyframe_points, keyframes):
+            kp.interpolation = 'BEZIER'
+            kp.handle_left_type = kp.handle_right_type = 'FREE'
+            kp.co, kp.handle_left, kp.handle_right = co, handle_left, handle_right
+
+        curve = _FCurve(0.0)
+        curve.setFCurve(fcurve)
+        frame_numbers = list(range(0, 9001))
+        keys = curve.sampleFrames(frame_numbers)
+        bpy.data.actions.remove(action)
+
+        values = np.array([v for v, interp in keys])
+        control_points = np.array([interp for v, interp in keys]).reshape(-1, 4)
+        self.assertFalse(np.isnan(values).any())
+        self.assertTrue(((control_points >= 0) & (control_points <= 127)).all())
+        np.testing.assert_allclose(values[[0, 3000, 9000]], [0, 1, -1000], rtol=0, atol=1e-3)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import math
+import os
+import unittest
+
+import numpy as np
+
+from mmd_tools.core import vmd
+from mmd_tools.core.vmd.evaluator import VMDEvaluator
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LINEAR_INTERP = ([20]*4 + [20]*4 + [107]*4 + [107]*4) * 4
+
+class TestVmdEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __bone_key(self, frame_number, location, rotation, interp=LINEAR_INTERP):
+        k = vmd.BoneFrameKey()
+        k.frame_number, k.location, k.rotation, k.interp = frame_number, list(location), list(rotation), list(interp)
+        return k
+
+    def __camera_key(self, frame_number, distance, location, rotation, angle, persp=True):
+        k = vmd.CameraKeyFrameKey()
+        k.frame_number, k.distance, k.location, k.rotation = frame_number, distance, list(location), list(rotation)
+        k.interp = [20, 107, 20, 107]*6
+        k.angle, k.persp = angle, persp
+        return k
+
+    def __make_vmd_file(self):
+        vmd_file = vmd.File()
+        vmd_file.header = vmd.Header()
+        vmd_file.boneAnimation = vmd.BoneAnimation()
+        vmd_file.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+        vmd_file.cameraAnimation = vmd.CameraAnimation()
+
+        half = math.sqrt(0.5)
+        keys = vmd_file.boneAnimation['linear']
+        keys.append(self.__bone_key(10, (2.0, 4.0, 6.0), (0.0, half, 0.0, half)))
+        keys.append(self.__bone_key(0, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0)))
+        # the ease-in curve of the x channel only
+        interp = list(LINEAR_INTERP)
+        interp[0], interp[4], interp[8], interp[12] = 127, 0, 127, 127
+        keys = vmd_file.boneAnimation['ease']
+        keys.append(self.__bone_key(0, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0)))
+        keys.append(self.__bone_key(20, (1.0, 1.0, 1.0), (0.0, 0.0, 0.0, -1.0), interp))
+
+        keys = vmd_file.shapeKeyAnimation['morph']
+        for frame_number, weight in ((0, 0.0), (4, 1.0), (8, 0.5)):
+            k = vmd.ShapeKeyFrameKey()
+            k.frame_number, k.weight = frame_number, weight
+            keys.append(k)
+
+        vmd_file.cameraAnimation.append(self.__camera_key(0, -45.0, (0.0, 10.0, 0.0), (0.0, 0.0, 0.0), 30))
+        vmd_file.cameraAnimation.append(self.__camera_key(10, -25.0, (10.0, 10.0, 0.0), (1.0, 0.0, 0.0), 40, False))
+        return vmd_file
+
+    def __check_results(self, evaluator):
+        frames = np.arange(-5, 31) * 0.5
+        bones = evaluator.evaluateBones(frames)
+        self.assertEqual(sorted(bones.keys()), ['ease', 'linear'])
+
+        locations, rotations = bones['linear']
+        self.assertEqual(locations.shape, (len(frames), 3))
+        self.assertEqual(rotations.shape, (len(frames), 4))
+        progress = np.clip(frames / 10.0, 0, 1)
+        np.testing.assert_allclose(locations, progress[:, None] * (2.0, 4.0, 6.0), atol=1e-5)
+        # slerp keeps the angular speed constant: the angle of y rotation is 90 degrees * progress
+        angles = 2 * np.arctan2(rotations[:, 1], rotations[:, 3])
+        np.testing.assert_allclose(angles, progress * math.pi / 2, atol=1e-5)
+        np.testing.assert_allclose(np.linalg.norm(rotations, axis=1), 1.0, atol=1e-6)
+
+        locations, rotations = evaluator.evaluateBones([10.0], names=['ease', 'missing'])['ease']
+        self.assertLess(locations[0, 0], 0.5)
+        self.assertAlmostEqual(locations[0, 1], 0.5, places=5)
+        # q and -q are the same rotation
+        np.testing.assert_allclose(np.abs(rotations[0]), (0, 0, 0, 1), atol=1e-6)
+
+        weights = evaluator.evaluateMorphs([-1, 2, 4, 6, 100])['morph']
+        np.testing.assert_allclose(weights, (0.0, 0.5, 1.0, 0.75, 0.5), atol=1e-6)
+
+        camera = evaluator.evaluateCamera([0, 5, 10, 20])
+        np.testing.assert_allclose(camera['distance'], (-45.0, -35.0, -25.0, -25.0), atol=1e-4)
+        np.testing.assert_allclose(camera['location'][:, 0], (0.0, 5.0, 10.0, 10.0), atol=1e-4)
+        np.testing.assert_allclose(camera['rotation'][:, 0], (0.0, 0.5, 1.0, 1.0), atol=1e-5)
+        np.testing.assert_allclose(camera['angle'], (30.0, 35.0, 40.0, 40.0), atol=1e-4)
+        self.assertEqual(camera['persp'].tolist(), [True, True, False, False])
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_evaluate(self):
+        self.__check_results(VMDEvaluator(self.__make_vmd_file()))
+
+    def test_evaluate_loaded(self):
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'vmd_evaluator.vmd')
+        self.__make_vmd_file().save(filepath=output_vmd)
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=output_vmd)
+        self.__check_results(VMDEvaluator(vmd_file))
+
+    def test_no_camera(self):
+        vmd_file = vmd.File()
+        vmd_file.boneAnimation = vmd.BoneAnimation()
+        evaluator = VMDEvaluator(vmd_file)
+        self.assertIsNone(evaluator.evaluateCamera([0]))
+        self.assertEqual(evaluator.evaluateBones([0]), {})
+        self.assertEqual(evaluator.evaluateMorphs([0]), {})
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import unittest
+
+from mmd_tools.core import vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 'センター' and a name cut to its first 15 bytes ('a' and 7 double-byte characters) by the file format
+BONE_NAMES = ['センター', 'bone', 'bone1', 'a左足ＩＫ親先端部', 'an_overlong_bone_name']
+MORPH_NAMES = ['まばたき', 'あ', 'an_overlong_morph_name']
+
+class TestVmdIO(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __read_bytes(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def __file_name(self, name):
+        # the name as it is stored in the file
+        return vmd._toShiftJisString(vmd._toShiftJisBytes(name)[:15])
+
+    def __make_file(self):
+        vmd_file = vmd.File()
+        vmd_file.header = vmd.Header()
+        vmd_file.header.model_name = 'テストモデル'
+        vmd_file.boneAnimation = vmd.BoneAnimation()
+        vmd_file.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+        vmd_file.cameraAnimation = vmd.CameraAnimation()
+        vmd_file.lampAnimation = vmd.LampAnimation()
+        vmd_file.selfShadowAnimation = vmd.SelfShadowAnimation()
+        vmd_file.propertyAnimation = vmd.PropertyAnimation()
+
+        for frame_number in range(0, 30, 3):
+            for i, name in enumerate(BONE_NAMES):
+                k = vmd.BoneFrameKey()
+                k.frame_number = frame_number
+                k.location = [0.5*i, -0.25*frame_number, 1.0]
+                k.rotation = [0.0, 0.0, 0.0, 1.0] if i else [0.5, 0.5, 0.5, 0.5]
+                k.interp = [(i + frame_number + j) % 128 for j in range(64)]
+                vmd_file.boneAnimation[name].append(k)
+            for i, name in enumerate(MORPH_NAMES):
+                k = vmd.ShapeKeyFrameKey()
+                k.frame_number, k.weight = frame_number, 0.125*i
+                vmd_file.shapeKeyAnimation[name].append(k)
+
+        for frame_number in range(0, 30, 10):
+            k = vmd.CameraKeyFrameKey()
+            k.frame_number, k.distance, k.angle, k.persp = frame_number, -45.0, 30, frame_number != 10
+            k.location, k.rotation, k.interp = [0.0, 10.0, 0.5*frame_number], [0.25, 0.0, 0.0], [20, 107]*12
+            vmd_file.cameraAnimation.append(k)
+            k = vmd.LampKeyFrameKey()
+            k.frame_number, k.color, k.direction = frame_number, [0.5, 0.5, 0.75], [-0.5, -1.0, 0.5]
+            vmd_file.lampAnimation.append(k)
+            k = vmd.SelfShadowFrameKey()
+            k.frame_number, k.mode, k.distance = frame_number, frame_number//10, 8875.0
+            vmd_file.selfShadowAnimation.append(k)
+            k = vmd.PropertyFrameKey()
+            k.frame_number, k.visible = frame_number, frame_number != 20
+            k.ik_states = [('左足ＩＫ', frame_number != 10), ('右足ＩＫ', True)]
+            vmd_file.propertyAnimation.append(k)
+        return vmd_file
+
+    def __assert_keys(self, keys, expected_keys, msg=None):
+        self.assertEqual(len(keys), len(expected_keys), msg)
+        for k, expected in zip(keys, expected_keys):
+            values, expected_values = dict(vars(k)), dict(vars(expected))
+            if isinstance(k, vmd.SelfShadowFrameKey): # stored as (10000 - distance)/100000 in float32
+                self.assertAlmostEqual(values.pop('distance'), expected_values.pop('distance'), places=2)
+            self.assertEqual({n: list(v) if isinstance(v, (list, tuple)) else v for n, v in values.items()},
+                             {n: list(v) if isinstance(v, (list, tuple)) else v for n, v in expected_values.items()}, msg)
+
+    def __assert_animations(self, animation, expected_animation):
+        self.assertEqual(list(animation.keys()), [self.__file_name(n) for n in expected_animation.keys()])
+        for name, expected_keys in expected_animation.items():
+            self.__assert_keys(animation[self.__file_name(name)], expected_keys, name)
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_round_trip(self):
+        source = self.__make_file()
+        source_vmd = self.__output_path('vmd_io_source.vmd')
+        source.save(filepath=source_vmd)
+        source_bytes = self.__read_bytes(source_vmd)
+
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=source_vmd)
+        self.assertEqual(vmd_file.header.model_name, 'テストモデル')
+        self.__assert_animations(vmd_file.boneAnimation, source.boneAnimation)
+        self.__assert_animations(vmd_file.shapeKeyAnimation, source.shapeKeyAnimation)
+        for name in ('cameraAnimation', 'lampAnimation', 'selfShadowAnimation', 'propertyAnimation'):
+            self.__assert_keys(getattr(vmd_file, name), getattr(source, name), name)
+
+        output_vmd = self.__output_path('vmd_io_output.vmd')
+        vmd_file.save(filepath=output_vmd)
+        self.assertEqual(source_bytes, self.__read_bytes(output_vmd))
+
+        # the frame key objects are used instead of the records once they are created
+        for animation in (vmd_file.boneAnimation, vmd_file.shapeKeyAnimation):
+            for keys in animation.values():
+                keys[:]
+        vmd_file.save(filepath=output_vmd)
+        self.assertEqual(source_bytes, self.__read_bytes(output_vmd))
+
+    def test_corrupt_count(self):
+        source_vmd = self.__output_path('vmd_io_corrupt_source.vmd')
+        self.__make_file().save(filepath=source_vmd)
+        source = vmd.File()
+        source.load(filepath=source_vmd)
+        source_bytes = self.__read_bytes(source_vmd)
+
+        # a huge count of the bone keys in a file truncated after 3 records
+        bone_record_size = vmd.BoneAnimation.recordDType().itemsize
+        corrupt_vmd = self.__output_path('vmd_io_corrupt.vmd')
+        with open(corrupt_vmd, 'wb') as f:
+            f.write(source_bytes[:50] + struct.pack('<L', 0xFFFFFFF0) + source_bytes[54:54+3*bone_record_size])
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=corrupt_vmd)
+        self.assertEqual(list(vmd_file.boneAnimation.keys()), ['センター'])
+        self.__assert_keys(vmd_file.boneAnimation['センター'], source.boneAnimation['センター'][:3])
+        self.assertEqual(len(vmd_file.shapeKeyAnimation), 0)
+
+        # a huge count of the morph keys after the complete bone keys
+        morph_offset = 54 + sum(len(v) for v in source.boneAnimation.values())*bone_record_size
+        with open(corrupt_vmd, 'wb') as f:
+            f.write(source_bytes[:morph_offset] + struct.pack('<L', 0xFFFFFFF0) + source_bytes[morph_offset+4:morph_offset+4+100])
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=corrupt_vmd)
+        self.assertEqual(sum(len(v) for v in vmd_file.boneAnimation.values()), sum(len(v) for v in source.boneAnimation.values()))
+        self.assertEqual(sum(len(v) for v in vmd_file.shapeKeyAnimation.values()), 100//vmd.ShapeKeyAnimation.recordDType().itemsize)
+        self.assertEqual(len(vmd_file.cameraAnimation), 0)
+
+    def test_load_sections(self):
+        source_vmd = self.__output_path('vmd_io_sections.vmd')
+        self.__make_file().save(filepath=source_vmd)
+        full = vmd.File()
+        full.load(filepath=source_vmd)
+
+        for sections in (('cameraAnimation', 'lampAnimation', 'selfShadowAnimation', 'propertyAnimation'),
+                         ('propertyAnimation',), ('shapeKeyAnimation', 'lampAnimation'), ()):
+            vmd_file = vmd.File()
+            vmd_file.load(filepath=source_vmd, sections=sections)
+            for name in vmd.File.SECTIONS:
+                animation, expected = getattr(vmd_file, name), getattr(full, name)
+                if name not in sections:
+                    self.assertEqual(len(animation), 0, name)
+                elif isinstance(expected, dict):
+                    self.assertEqual(list(animation.keys()), list(expected.keys()))
+                    for n in expected.keys():
+                        self.__assert_keys(animation[n], expected[n], '%s %s'%(sections, n))
+                else:
+                    self.__assert_keys(animation, expected, '%s %s'%(sections, name))
+
+    def test_iter_bone_keys(self):
+        source_vmd = self.__output_path('vmd_io_iter.vmd')
+        self.__make_file().save(filepath=source_vmd)
+        full = vmd.File()
+        full.load(filepath=source_vmd)
+        bone_animation = full.boneAnimation
+
+        for chunk_size in (65536, 7, 1):
+            keys = list(vmd.iter_bone_keys(source_vmd, chunk_size=chunk_size))
+            self.assertEqual(len(keys), sum(len(v) for v in bone_animation.values()))
+            self.assertEqual(list(dict.fromkeys(n for n, k in keys)), [self.__file_name(n) for n in BONE_NAMES])
+            for name, expected_keys in bone_animation.items():
+                self.__assert_keys([k for n, k in keys if n == name], expected_keys, '%d %s'%(chunk_size, name))
+
+            # the names are compared on the raw 15 bytes, an over-long name matches its stored part only
+            names = ['センター', 'bone', 'a左足ＩＫ親先端部', 'missing']
+            keys = list(vmd.iter_bone_keys(source_vmd, names=names, chunk_size=chunk_size))
+            self.assertEqual(sorted(set(n for n, k in keys)), sorted(self.__file_name(n) for n in names[:3]))
+            for name in names[:3]:
+                name = self.__file_name(name)
+                self.__assert_keys([k for n, k in keys if n == name], bone_animation[name], '%d %s'%(chunk_size, name))
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
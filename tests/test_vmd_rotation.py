@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import math
+import random
+import unittest
+
+import numpy as np
+
+from mmd_tools.core.vmd.importer import _FnRotation
+
+class TestVmdRotation(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    @staticmethod
+    def __compatible_rotation(prev, curr):
+        # the rule applied to each key of a bone in AXIS_ANGLE mode by the former importer
+        angle, x, y, z = curr
+        if prev[1]*x + prev[2]*y + prev[3]*z < 0:
+            angle, x, y, z = -angle, -x, -y, -z
+        angle_diff = prev[0] - angle
+        if abs(angle_diff) > math.pi:
+            pi_2 = math.pi * 2
+            bias = -0.5 if angle_diff < 0 else 0.5
+            angle += int(bias + angle_diff/pi_2) * pi_2
+        return (angle, x, y, z)
+
+    def __make_quaternions(self, count, rand):
+        quats = []
+        for i in range(count):
+            r = rand.random()
+            if r < 0.1: # zero-length
+                quats.append((0.0, 0.0, 0.0, 0.0))
+            elif r < 0.4: # the angles near +-pi
+                axis = np.array([rand.uniform(-1, 1) for _ in range(3)])
+                half = math.pi/2 + rand.choice((-1, 1))*rand.choice((0, 1e-15, 1e-9, 1e-3))
+                quats.append((math.cos(half), *(axis/np.linalg.norm(axis)*math.sin(half)*rand.choice((-1, 1)))))
+            else:
+                quats.append(tuple(rand.uniform(-1, 1) for _ in range(4)))
+        return quats
+
+    #********************************************
+    # Tests
+    #********************************************
+
+    def test_compatible_axis_angles(self):
+        rand = random.Random(0)
+        for i in range(300):
+            axis_angles = _FnRotation.to_axis_angles(self.__make_quaternions(rand.randint(1, 30), rand))
+            # the angles of the quaternions are in [0, 2pi], the flipped and shifted ones are not
+            axis_angles[:, 0] += [rand.choice((0, 0, 2*math.pi, -4*math.pi, -math.pi)) for _ in axis_angles]
+            prev = None if i % 2 else (rand.uniform(-20, 20), rand.uniform(-1, 1), 0.0, rand.choice((0.0, 1.0)))
+
+            expected, p = [], prev
+            for curr in axis_angles.tolist():
+                curr = tuple(curr) if p is None else self.__compatible_rotation(p, curr)
+                expected.append(curr)
+                p = curr
+            np.testing.assert_array_equal(_FnRotation.compatible_axis_angles(axis_angles, prev), expected, err_msg=str(i))
+
+        self.assertEqual(_FnRotation.compatible_axis_angles(np.zeros((0, 4))).shape, (0, 4))
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()